@@ -0,0 +1,133 @@
+import asyncio
+import importlib
+from contextlib import asynccontextmanager
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+from analysis_cache import AnalysisCache
+from linkedin_extraction import LinkedInExtractor
+from profile_cache import ProfileCache
+from prompt_packing import PromptPacker
+from single_flight import SingleFlight
+from tenants import connection_key
+from telemetry import logger
+
+if TYPE_CHECKING:
+    from azure_ai_agent import AgentRuntime
+
+load_dotenv()
+
+# Profiles are scraped through one extractor so every runtime shares the profile cache
+profile_cache = ProfileCache()
+linkedin_extractor = LinkedInExtractor(cache=profile_cache)
+
+# Analyses of a profile for a company are reused until the profile or the company description changes
+analysis_cache = AnalysisCache()
+
+# Analyses being scored by any pipeline, so concurrent requests for one profile and company share them
+analysis_flights = SingleFlight("analysis")
+
+# Token budget of a scoring chunk, adapted to the latency and truncations of every analysis
+prompt_packer = PromptPacker()
+
+
+class AgentRuntimeRegistry:
+    """Keeps one AgentRuntime per connection string for the lifetime of the server.
+
+    The agents module, and with it the Semantic Kernel, Azure and OpenAI SDKs, is only imported when
+    the first runtime is built, in a worker thread, so a worker starts serving right away.
+
+    Work holds its runtime through ``use``; a runtime released while in use is only closed once
+    the last user is done with it. Runtimes of different connection strings are built concurrently.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.transport = transport
+        self._runtimes: Dict[str, "AgentRuntime"] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict["AgentRuntime", int] = {}
+        self._retired: Set["AgentRuntime"] = set()
+        self._agents: Optional[ModuleType] = None
+        self._agents_lock = asyncio.Lock()
+
+    async def agents(self) -> ModuleType:
+        """The ``azure_ai_agent`` module, imported on first use."""
+        if self._agents is None:
+            async with self._agents_lock:
+                if self._agents is None:
+                    self._agents = await asyncio.to_thread(importlib.import_module, "azure_ai_agent")
+        return self._agents
+
+    async def get(self, conn_str: str) -> Tuple["AgentRuntime", bool]:
+        """Return the runtime for a connection string and whether it had to be built (a cold start)."""
+        runtime = self._runtimes.get(conn_str)
+        if runtime:
+            return runtime, False
+
+        # A slow connection only holds back the requests for the same connection string
+        async with self._locks.setdefault(conn_str, asyncio.Lock()):
+            runtime = self._runtimes.get(conn_str)
+            if runtime:
+                return runtime, False
+            agents = await self.agents()
+            runtime = agents.AgentRuntime(conn_str, self.transport)
+            await runtime.start()
+            self._runtimes[conn_str] = runtime
+            return runtime, True
+
+    @asynccontextmanager
+    async def use(self, conn_str: str) -> AsyncIterator[Tuple["AgentRuntime", bool]]:
+        """Hold the runtime of a connection string (and whether it was a cold start) while work runs on it."""
+        runtime, cold = await self.get(conn_str)
+        self._users[runtime] = self._users.get(runtime, 0) + 1
+        try:
+            yield runtime, cold
+        finally:
+            self._users[runtime] -= 1
+            if not self._users[runtime]:
+                del self._users[runtime]
+                if runtime in self._retired:
+                    self._retired.discard(runtime)
+                    await self._close(runtime)
+
+    async def release(self, conn_str: str) -> None:
+        """Close the runtime of a connection string no tenant uses anymore, once its work is done."""
+        lock = self._locks.setdefault(conn_str, asyncio.Lock())
+        async with lock:
+            runtime = self._runtimes.pop(conn_str, None)
+        if not lock.locked():
+            self._locks.pop(conn_str, None)
+        if not runtime:
+            return
+        if self._users.get(runtime):
+            # Requests, jobs or streams still call it; the last of them closes it
+            self._retired.add(runtime)
+        else:
+            await self._close(runtime)
+
+    @staticmethod
+    async def _close(runtime: "AgentRuntime") -> None:
+        try:
+            await runtime.close()
+        except Exception as e:
+            logger.warning("Error closing agent runtime: %s", e)
+
+    async def close(self) -> None:
+        runtimes = [*self._runtimes.values(), *self._retired]
+        self._runtimes.clear()
+        self._retired.clear()
+        for runtime in runtimes:
+            await self._close(runtime)
+
+    def stats(self) -> Dict[str, Any]:
+        # Connection strings hold secrets, so runtimes are reported under a short fingerprint
+        return {
+            connection_key(conn_str): runtime.stats()
+            for conn_str, runtime in self._runtimes.items()
+        }
+
+
+runtimes = AgentRuntimeRegistry()
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from profile_cache import normalize_profile_url
+from prompt_packing import estimate_tokens
+from tiered_cache import TieredCache
+
+# Profile fields that change the outcome of an analysis
+FINGERPRINT_FIELDS = [
+    "headline",
+    "jobTitle",
+    "companyName",
+    "companyIndustry",
+    "currentJobDuration",
+    "topSkillsByEndorsements",
+    "experiences",
+    "skills",
+]
+
+
+def company_fingerprint(*parts: Optional[str]) -> str:
+    """Hash of the company description/target profile, insensitive to case and whitespace."""
+    text = "\n".join(" ".join((part or "").lower().split()) for part in parts)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def profile_fingerprint(profile: Dict[str, Any]) -> str:
+    fields = {name: profile.get(name) for name in FINGERPRINT_FIELDS}
+    fields["linkedinUrl"] = normalize_profile_url(profile.get("linkedinUrl") or "")
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class AnalysisCache(TieredCache):
+    """Profile analyses (``potential_match``, ``match_reason``, ...) keyed by company and profile fingerprint."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        max_memory_entries: Optional[int] = None,
+        max_disk_entries: Optional[int] = None,
+    ):
+        super().__init__(
+            path=path or os.getenv("ANALYSIS_CACHE_PATH", "analysis_cache.db"),
+            table="analyses",
+            ttl_seconds=ttl_seconds or float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(30 * 24 * 3600))),
+            max_memory_entries=max_memory_entries or int(os.getenv("ANALYSIS_CACHE_MEMORY_ENTRIES", "5000")),
+            max_disk_entries=max_disk_entries or int(os.getenv("ANALYSIS_CACHE_DISK_ENTRIES", "200000")),
+        )
+        self.saved_tokens = 0
+        self._saved_lock = threading.Lock()
+
+    @staticmethod
+    def key(company_key: str, fingerprint: str) -> str:
+        return f"{company_key}:{fingerprint}"
+
+    def get_analyses(self, company_key: str, fingerprints: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Cached analyses for one company, keyed by profile fingerprint."""
+        found = self.get_many(self.key(company_key, fingerprint) for fingerprint in fingerprints)
+        return {key.split(":", 1)[1]: value["analysis"] for key, value in found.items()}
+
+    def put_analyses(self, company_key: str, analyses: Dict[str, Dict[str, Any]], prompt_tokens: Dict[str, int]) -> None:
+        """Store analyses by profile fingerprint, with the prompt tokens a later hit will save."""
+        self.put_many({
+            self.key(company_key, fingerprint): {
+                "analysis": {key: value for key, value in analysis.items() if key != "url"},
+                "tokens": prompt_tokens.get(fingerprint, 0) + estimate_tokens(json.dumps(analysis)),
+            }
+            for fingerprint, analysis in analyses.items()
+        })
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        found = super().get_many(keys)
+        with self._saved_lock:
+            self.saved_tokens += sum(value.get("tokens", 0) for value in found.values())
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["saved_tokens"] = self.saved_tokens
+        return stats
@@ -1,52 +1,59 @@
 import os
 from dotenv import load_dotenv
 import asyncio
-from azure.identity import DefaultAzureCredential
+import time
+from contextlib import AsyncExitStack
+from azure.identity.aio import DefaultAzureCredential
 import json
+import httpx
 from pydantic import BaseModel, Field
-from typing import Annotated, List, Any, Optional
-from apify_client import ApifyClient
+from typing import Annotated, List, Any, Optional, Dict, Tuple
+from openai import AsyncAzureOpenAI
 
 from semantic_kernel.kernel import Kernel
-from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureChatPromptExecutionSettings
 from semantic_kernel.agents import ChatCompletionAgent, AzureAIAgent
 
 from semantic_kernel.contents import AuthorRole, ChatMessageContent, ChatHistory
-from semantic_kernel.functions import kernel_function
+from semantic_kernel.filters import FilterTypes, FunctionInvocationContext
+from semantic_kernel.functions import KernelArguments, kernel_function
+
+from agent_registry import linkedin_extractor, runtimes
+from analysis_cache import company_fingerprint
+from linkedin_extraction import ExtractionProgress, LinkedInExtractor
+from prompt_packing import compact_profile
+from resilience import CircuitOpenError, ResilientTransport, find_error, services
+from telemetry import log_sampled, logger, record_agent_stream, stage_seconds, timed
 
 
 load_dotenv()
 
 # # Create kernel function with Azure OpenAI Chat Completion client
-def create_kernel(service_id: str) -> Kernel:
+def create_kernel(service_id: str, async_client: Optional[AsyncAzureOpenAI] = None) -> Kernel:
     kernel = Kernel()
-    chat_completion_service = AzureChatCompletion(service_id=service_id)
+    chat_completion_service = AzureChatCompletion(service_id=service_id, async_client=async_client)
     kernel.add_service(chat_completion_service)
+    instrument_kernel(kernel)
     return kernel
 
+def instrument_kernel(kernel: Kernel) -> None:
+    """Time every plugin call of the kernel, which covers the agent to agent hops and the scraping plugin."""
+    async def time_function(context: FunctionInvocationContext, next) -> None:
+        with timed("plugin_invoke", plugin=context.function.plugin_name or "", function=context.function.name):
+            await next(context)
+
+    kernel.add_filter(FilterTypes.FUNCTION_INVOCATION, time_function)
+
 class LinkedInDataPlugin:
+    def __init__(self, extractor: Optional[LinkedInExtractor] = None):
+        self.extractor = extractor or linkedin_extractor
+
     @kernel_function(name="extractLinkedinData", description="Provides the data of some LinkedIn profiles list.")
-    def extractLinkedinData(self, linkedinUrls: List[str]) -> Annotated[str, "Returns the data of the linkedin profiles list."]:
+    async def extractLinkedinData(self, linkedinUrls: List[str]) -> Annotated[str, "Returns the data of the linkedin profiles list."]:
         """Extract LinkedIn profile data for the given URLs."""
-        # In production, use the Apify API call
-        client = ApifyClient(os.getenv("APIFY_API_KEY"))
-        run_input = {"profileUrls": linkedinUrls}
-        run = client.actor("2SyF0bVxmgGr8IVCZ").call(run_input=run_input)
-        extractedData = []
-        for item in client.dataset(run["defaultDatasetId"]).iterate_items():
-            extractedData.append({
-                "linkedinUrl": item.get("linkedinUrl"),
-                "firstName": item.get("firstName"),
-                "lastName": item.get("lastName"),
-                "headline": item.get("headline"),
-                "jobTitle": item.get("jobTitle"),
-                "companyName": item.get("companyName"),
-                "companyIndustry": item.get("companyIndustry"),
-                "currentJobDuration": item.get("currentJobDuration"),
-                "topSkillsByEndorsements": item.get("topSkillsByEndorsements"),
-                "experiences": item.get("experiences"),
-                "skills": item.get("skills"),
-            })
+        # In production, use the Apify API call, split in concurrent batches
+        progress = ExtractionProgress()
+        extractedData = await self.extractor.extract(linkedinUrls, progress=progress)
         
         # For testing, return sample data
         # extractedData = [
@@ -69,7 +76,10 @@ class LinkedInDataPlugin:
         #     }
         # ]
 
-        return json.dumps(extractedData)
+        # The batch counters let the coordinator fill in its current_batch/total_batches fields.
+        # Profiles are compacted so long experience and skill lists do not blow up the prompt
+        profiles = [compact_profile(profile) for profile in extractedData]
+        return json.dumps({**progress.to_dict(), "profiles": profiles})
 
 # Agent names and instructions
 HOST_NAME = "host"
@@ -150,6 +160,7 @@ WRITER_INSTRUCTIONS = """
     Your tasks:
     1. When receiving a message with "action": "generate_email":
         - Use the provided analysis results to create a personalized email
+        - Present the company described in the earlier message with "company_description"
         - Ensure the email is professional and tailored to the potential client
         - Include key details from the profile analysis
     2. Always format the email as a JSON object:
@@ -162,12 +173,67 @@ WRITER_INSTRUCTIONS = """
 
     """
 
+SCORING_NAME = "scoring_agent"
+SCORING_INSTRUCTIONS = """
+    You score LinkedIn profiles as potential clients of a company.
+    You receive a JSON message with "action": "score_profiles", the company description and the scraped profiles.
+    For every profile, decide whether the person is a potential client for the company and explain why in one sentence.
+    Only use the data of the given profiles and answer with one result per profile, using its linkedinUrl as url.
+"""
+
+class ProfileAnalysis(BaseModel):
+    role: str
+    company: str
+    industry: str
+    seniority: str
+    relevant_skills: List[str]
+
+class ProfileScore(BaseModel):
+    url: str
+    analysis: ProfileAnalysis
+    potential_match: bool
+    match_reason: str
+
+class ScoringResponse(BaseModel):
+    """Strict schema of the scoring agent's answer, enforced through structured outputs."""
+    results: List[ProfileScore]
+
 class CompanyInfo(BaseModel):
     name: Optional[str] = None
     industry: Optional[str] = None
     description: Optional[str] = None
     target_profile: Optional[str] = None
 
+    def fingerprint(self) -> str:
+        return company_fingerprint(self.describe())
+
+    def describe(self) -> str:
+        """The company as the scoring prompts describe it; the analysis cache is keyed by its fingerprint."""
+        fields = (("Company Name", self.name), ("Industry", self.industry), ("Description", self.description),
+                  ("Ideal Profile", self.target_profile))
+        if not any(value for label, value in fields if label != "Description"):
+            # Same text, and cache key, as the description a request sends explicitly
+            return self.description or ""
+        return "\n".join(f"{label}: {value}" for label, value in fields if value)
+
+    @classmethod
+    def from_history(cls, chat_history: ChatHistory) -> Optional["CompanyInfo"]:
+        """The company information the host agent passed on in its latest JSON reply, if any.
+
+        The host formats the stored company information into its ``analyze_profiles`` messages, so
+        this is the host's extraction rather than the raw text the user typed.
+        """
+        for message in reversed(chat_history.messages):
+            if message.role != AuthorRole.ASSISTANT or not message.content:
+                continue
+            try:
+                reply = json.loads(str(message.content))
+            except ValueError:
+                continue
+            if isinstance(reply, dict) and reply.get("company_description"):
+                return cls(description=str(reply["company_description"]))
+        return None
+
 class HostAgent(ChatCompletionAgent):
     company_info: CompanyInfo = Field(default_factory=CompanyInfo)
 
@@ -182,95 +248,167 @@ class HostAgent(ChatCompletionAgent):
                 if not content or not content.content or not isinstance(content.content.content, (str, dict)):
                     continue
                 
-                try:
-                    # If content is already a dict, use it directly
-                    if isinstance(content.content.content, dict):
-                        data = content.content.content
-                    else:
-                        # Try to parse JSON string
-                        data = json.loads(content.content.content)
-                    
-                    # Validate data is a dict and has status
-                    if isinstance(data, dict) and "status" in data:
-                        formatted_response = self.format_analysis_response(data)
-                        content.content.content = formatted_response
-                except (json.JSONDecodeError, AttributeError, TypeError):
-                    # If not JSON or has wrong structure, leave content as is
-                    pass
-                
                 yield content
         except asyncio.CancelledError:
             # Handle cancellation gracefully
             return
         except Exception as e:
+            # An unavailable service is reported by the endpoint, with when to try again
+            if find_error(e, CircuitOpenError):
+                raise
             # Log error and return a user-friendly message
-            print(f"Error in invoke_stream: {str(e)}")
+            logger.exception("Error in invoke_stream: %s", e)
             content = ChatMessageContent(
                 role=AuthorRole.ASSISTANT,
                 content="I encountered an error while processing. Please try again or provide your company information first."
             )
             yield content
 
+class AgentRuntime:
+    """Azure clients and agent graph for one connection string, built once and reused across requests.
+
+    ``transport`` replaces the HTTP transport under the resilience layer, e.g. to reach a local fake.
+    """
+
+    def __init__(self, conn_str: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.conn_str = conn_str
+        self.transport = transport
+        self.credential = None
+        self.client = None
+        self.openai_client = None
+        self.linkedin_agent = None
+        self.coordinator_agent = None
+        self.writer_agent = None
+        self.scoring_agent = None
+        self.host_agent = None
+        self.build_seconds = None
+        self.timings = {
+            "cold": {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+            "warm": {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+        }
+        self._stack = AsyncExitStack()
+
+    async def start(self) -> None:
+        started = time.perf_counter()
+        try:
+            # The credential caches its tokens, so it must outlive a single request
+            self.credential = await self._stack.enter_async_context(DefaultAzureCredential())
+            self.client = await self._stack.enter_async_context(
+                AzureAIAgent.create_client(credential=self.credential, conn_str=self.conn_str)
+            )
+
+            # Every chat completion service shares one pooled HTTP client whose requests go through the
+            # rate limits, retries and circuit breaker of the azure_openai service. The SDK's own retries
+            # are turned off so a throttled request is not retried twice over.
+            settings_client = AzureChatCompletion(service_id="host").client
+            self.openai_client = settings_client.with_options(
+                http_client=httpx.AsyncClient(transport=ResilientTransport(services.get("azure_openai"), self.transport)),
+                max_retries=0,
+            )
+            await settings_client.close()
+            self._stack.push_async_callback(self.openai_client.close)
+            host_service = AzureChatCompletion(service_id="host", async_client=self.openai_client)
+
+            # Create kernels for agents
+            linkedin_kernel = create_kernel("linkedin", self.openai_client)
+            coordinator_kernel = create_kernel("coordinator", self.openai_client)
+            writer_kernel = create_kernel("writer", self.openai_client)
+
+            # Create the linkedin agent
+            self.linkedin_agent = ChatCompletionAgent(
+                id=LINKEDIN_NAME,
+                kernel=linkedin_kernel,
+                name=LINKEDIN_NAME,
+                instructions=LINKEDIN_INSTRUCTIONS,
+                plugins=[LinkedInDataPlugin()],
+            )
+
+            # Create the coordinator agent
+            self.coordinator_agent = ChatCompletionAgent(
+                id=COORDINATOR_NAME,
+                kernel=coordinator_kernel,
+                name=COORDINATOR_NAME,
+                instructions=COORDINATOR_INSTRUCTIONS,
+                plugins=[self.linkedin_agent],  # Coordinator can use LinkedIn agent directly
+            )
+
+            # Create the writer agent with Azure OpenAI client hosted in Azure
+            self.writer_agent = ChatCompletionAgent(
+                id=WRITER_NAME,
+                kernel=writer_kernel,
+                name=WRITER_NAME,
+                instructions=WRITER_INSTRUCTIONS,
+            )
+
+            # Scores already scraped profiles in a single call, for the direct mode of the structured endpoints
+            self.scoring_agent = ChatCompletionAgent(
+                id=SCORING_NAME,
+                kernel=create_kernel("scoring", self.openai_client),
+                name=SCORING_NAME,
+                instructions=SCORING_INSTRUCTIONS,
+                arguments=KernelArguments(settings=AzureChatPromptExecutionSettings(response_format=ScoringResponse)),
+            )
+
+            # Create host agent using the new HostAgent class
+            self.host_agent = HostAgent(
+                id=HOST_NAME,
+                service=host_service,
+                name=HOST_NAME,
+                instructions=HOST_INSTRUCTIONS,
+                plugins=[self.coordinator_agent, self.writer_agent],
+            )
+            instrument_kernel(self.host_agent.kernel)
+        except Exception:
+            await self.close()
+            raise
+        self.build_seconds = time.perf_counter() - started
+        stage_seconds.observe(self.build_seconds, stage="agent_build")
+
+    async def close(self) -> None:
+        await self._stack.aclose()
+
+    def record_invocation(self, seconds: float, cold: bool) -> None:
+        timing = self.timings["cold" if cold else "warm"]
+        timing["count"] += 1
+        timing["total_seconds"] += seconds
+        timing["max_seconds"] = max(timing["max_seconds"], seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        invocations = {}
+        for kind, timing in self.timings.items():
+            invocations[kind] = {
+                "count": timing["count"],
+                "avg_seconds": timing["total_seconds"] / timing["count"] if timing["count"] else None,
+                "max_seconds": timing["max_seconds"],
+            }
+        return {"build_seconds": self.build_seconds, "invocations": invocations}
+
+
 # Update main function to use HostAgent
 async def main(message: str, chat_history: ChatHistory, connection_string: str = None) -> str:
-    credential = DefaultAzureCredential()
-    
     # Use provided connection string or fall back to environment variable
     conn_str = connection_string or os.getenv("PROJECT_CONNECTION_STRING")
     if not conn_str:
         raise ValueError("No Azure connection string provided. Please set up your connection first.")
 
-    async with AzureAIAgent.create_client(credential=credential, conn_str=conn_str) as azure_openai_client:
-        
-        # Create kernels for agents
-        linkedin_kernel = create_kernel("linkedin")
-        coordinator_kernel = create_kernel("coordinator")
-        writer_kernel = create_kernel("writer")
-        
-        # Create the linkedin agent
-        linkedin_agent = ChatCompletionAgent(
-            id=LINKEDIN_NAME,
-            kernel=linkedin_kernel,
-            name=LINKEDIN_NAME,
-            instructions=LINKEDIN_INSTRUCTIONS,
-            plugins=[LinkedInDataPlugin()],
-        )
-
-        # Create the coordinator agent
-        coordinator_agent = ChatCompletionAgent(
-            id=COORDINATOR_NAME,
-            kernel=coordinator_kernel,
-            name=COORDINATOR_NAME,
-            instructions=COORDINATOR_INSTRUCTIONS,
-            plugins=[linkedin_agent],  # Coordinator can use LinkedIn agent directly
-        )
-
-        # Create the writer agent with Azure OpenAI client hosted in Azure
-        writer_agent = ChatCompletionAgent(
-            id=WRITER_NAME,
-            kernel=writer_kernel,
-            name=WRITER_NAME,
-            instructions=WRITER_INSTRUCTIONS,
-        )
-
-        # Create host agent using the new HostAgent class
-        host_agent = HostAgent(
-            id=HOST_NAME,
-            service=AzureChatCompletion(service_id="host"),
-            name=HOST_NAME,
-            instructions=HOST_INSTRUCTIONS,
-            plugins=[coordinator_agent, writer_agent],
-        )
-
+    started = time.perf_counter()
+    async with runtimes.use(conn_str) as (runtime, cold):
         user_input = message
-        
+
         chat_history.add_user_message(user_input)
-        
-        response = ""
-        async for content in host_agent.invoke_stream(messages=chat_history):
-            response += content.content.content
-        print(f"Host agent response: {response}")
-        return response
+
+        # Collect the streamed chunks and join them once
+        parts = []
+        stream = runtime.host_agent.invoke_stream(messages=chat_history)
+        async for content in record_agent_stream(HOST_NAME, stream, user_input):
+            parts.append(content.content.content)
+        response = "".join(parts)
+
+        elapsed = time.perf_counter() - started
+        runtime.record_invocation(elapsed, cold)
+    logger.info("Host agent responded in %.2fs (%s)", elapsed, "cold" if cold else "warm")
+    log_sampled("Host agent response", response)
+    return response
 
 
 # Función principal para ejecutar el código de prueba
@@ -0,0 +1,10 @@
+"""Offline benchmarks of the app against the local stand-ins for the external services.
+
+Run the benchmarks from the ``back`` directory, e.g. ``python -m bench.extraction``, and the
+end-to-end load test of the API with ``python -m bench.load``.
+"""
+import os
+import sys
+
+# The fakes live with the tests, which use them too
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test"))
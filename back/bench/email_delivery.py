@@ -0,0 +1,56 @@
+"""Send throughput of the email delivery engine against a local SMTP sink.
+
+    python -m bench.email_delivery --recipients 200 --latency 0.02 --pool-size 4
+"""
+import argparse
+import asyncio
+import time
+
+from email_delivery import EmailDeliveryEngine, SMTPSettings
+from fakes import SMTPSink
+
+
+async def measure(label: str, sink: SMTPSink, recipients, **engine_options) -> None:
+    settings = SMTPSettings(server=sink.host, port=sink.port, sender="bench@example.com", starttls=False)
+    engine = EmailDeliveryEngine(settings=settings, **engine_options)
+    received_before = sink.received
+    started = time.perf_counter()
+    job = engine.submit("Benchmark", "Hello from the benchmark.", recipients)
+    await engine.wait(job.id)
+    elapsed = time.perf_counter() - started
+    await engine.close()
+    report = job.to_dict()
+    print(
+        f"{label:<24} {elapsed:7.2f}s {len(recipients) / elapsed:8.1f} emails/s "
+        f"status={report['status']} counts={report['counts']} delivered_to_sink={sink.received - received_before}"
+    )
+
+
+async def run(args) -> None:
+    recipients = [f"user{i}@example.com" for i in range(args.recipients)]
+    with SMTPSink(latency=args.latency, fail_every=args.fail_every) as sink:
+        # Baseline: one connection, no rate limits, like the old sequential loop
+        await measure("single connection", sink, recipients, pool_size=1, rate_per_second=0, connection_rate_per_second=0)
+        await measure(
+            f"pool of {args.pool_size}",
+            sink,
+            recipients,
+            pool_size=args.pool_size,
+            rate_per_second=args.rate,
+            connection_rate_per_second=args.connection_rate,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds the sink takes per message")
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every n-th message with a transient 421")
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0, help="Global emails per second (0 = unlimited)")
+    parser.add_argument("--connection-rate", type=float, default=0, help="Emails per second per connection (0 = unlimited)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Throughput of LinkedIn profile extraction against the fake Apify backend.
+
+    python -m bench.extraction --urls 500 --batch-size 25 --concurrency 4
+"""
+import argparse
+import asyncio
+import time
+
+from linkedin_extraction import LinkedInExtractor
+from fakes import FakeApifyClientAsync, fake_profile_urls
+
+
+async def measure(label: str, extractor: LinkedInExtractor, urls) -> None:
+    started = time.perf_counter()
+    first_item = None
+    count = 0
+    async for _ in extractor.stream(urls):
+        if first_item is None:
+            first_item = time.perf_counter() - started
+        count += 1
+    elapsed = time.perf_counter() - started
+    print(
+        f"{label:<28} profiles={count:<6} total={elapsed:7.2f}s "
+        f"first_item={first_item or 0:6.2f}s throughput={count / elapsed:8.1f} profiles/s "
+        f"actor_runs={extractor.client.calls} max_parallel_runs={extractor.client.max_running}"
+    )
+
+
+async def run(args) -> None:
+    urls = fake_profile_urls(args.urls)
+
+    def backend():
+        return FakeApifyClientAsync(run_latency=args.run_latency, per_url_latency=args.per_url_latency)
+
+    # Baseline: the whole list in one actor run, as the plugin used to do
+    await measure("single run", LinkedInExtractor(client=backend(), batch_size=len(urls), max_concurrency=1), urls)
+    await measure(
+        f"batched ({args.batch_size} x {args.concurrency})",
+        LinkedInExtractor(client=backend(), batch_size=args.batch_size, max_concurrency=args.concurrency),
+        urls,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--urls", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--run-latency", type=float, default=0.5, help="Fixed seconds per actor run")
+    parser.add_argument("--per-url-latency", type=float, default=0.01, help="Extra seconds per scraped URL")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Parse cost of streamed coordinator output: string concatenation + regex vs. the incremental parser.
+
+    python -m bench.json_parse --results 2000 --chunk-size 8
+"""
+import argparse
+import json
+import re
+import time
+
+from json_stream import IncrementalJSONParser
+from fakes import fake_profile_urls
+
+
+def make_response(count: int) -> str:
+    document = {
+        "status": "complete",
+        "current_batch": 1,
+        "total_batches": 1,
+        "processed_urls": count,
+        "total_urls": count,
+        "results": [
+            {
+                "url": url,
+                "analysis": {"role": "CTO", "industry": "Information Technology", "notes": "Leads cloud migration {phase 2}"},
+                "potential_match": i % 3 == 0,
+                "match_reason": "Decision maker in a company moving its legacy systems to the cloud.",
+            }
+            for i, url in enumerate(fake_profile_urls(count))
+        ],
+        "errors": [],
+    }
+    return "Here is the analysis:\n```json\n" + json.dumps(document, indent=2) + "\n```\nLet me know if you need anything else."
+
+
+def previous_approach(chunks):
+    response = ""
+    for chunk in chunks:
+        response += chunk
+        # HostAgent.invoke_stream tried json.loads on every chunk
+        try:
+            json.loads(chunk)
+        except json.JSONDecodeError:
+            pass
+    json_match = re.search(r'\{.*\}', response, re.DOTALL)
+    return json.loads(json_match.group())
+
+
+def incremental_approach(chunks):
+    parser = IncrementalJSONParser()
+    first_result_chunk = None
+    for index, chunk in enumerate(chunks):
+        if parser.feed(chunk) and first_result_chunk is None:
+            first_result_chunk = index
+    return parser.document(), first_result_chunk
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--results", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=8, help="Characters per streamed chunk")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = make_response(args.results)
+    chunks = [text[i:i + args.chunk_size] for i in range(0, len(text), args.chunk_size)]
+    print(f"response: {len(text) / 1024:.0f} KiB in {len(chunks)} chunks")
+
+    for label, approach in (("concat + regex", previous_approach), ("incremental parser", incremental_approach)):
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            outcome = approach(chunks)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        extra = ""
+        if isinstance(outcome, tuple):
+            extra = f" first result after chunk {outcome[1]} of {len(chunks)}"
+        print(f"{label:<20} {best * 1000:8.1f} ms{extra}")
+
+
+if __name__ == "__main__":
+    main()
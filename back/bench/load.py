@@ -0,0 +1,349 @@
+"""Load test of /chat/, /process_invitees/ (also double-submitted), /send_emails/, /generate_emails/ and /leads/ against fake Azure OpenAI, Apify and SMTP backends.
+
+    python -m bench.load --concurrency 1 8 --profiles 10 50 --recipients 50 --requests 20
+    python -m bench.load --compare bench/results/<earlier run>.json
+    python -m bench.load --scenarios process_invitees --modes agents direct
+    python -m bench.load --scenarios leads --leads 2000
+    python -m bench.load --scenarios duplicates --concurrency 4 8
+
+The app runs in this process and is driven through its ASGI interface, so the numbers include the
+endpoints, agents, pipeline, caches and pools but no network between the client and the server.
+Every run is saved to ``bench/results`` under the commit it ran on; ``--compare`` prints the change
+against an earlier run and exits with status 1 when a p95 latency or the throughput regressed by more
+than ``--tolerance``.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from fakes import (
+    INDUSTRIES, SKILLS, TITLES, FakeApifyClientAsync, FakeChatCompletionServer, SMTPSink, configure_environment,
+    fake_profile_urls,
+)
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+async def drive(count: int, concurrency: int, request: Callable[[int], Awaitable[bool]]) -> Dict[str, Any]:
+    """Send ``count`` requests with at most ``concurrency`` in flight and summarize them."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(index: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = await request(index)
+            except Exception as e:
+                print(f"  request failed: {e}", file=sys.stderr)
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(count)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": count,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 3),
+        "p50_seconds": round(percentile(latencies, 0.50), 4),
+        "p95_seconds": round(percentile(latencies, 0.95), 4),
+        "p99_seconds": round(percentile(latencies, 0.99), 4),
+        "peak_traced_mb": round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+    }
+
+
+async def run_scenarios(
+    args, app_module, client: httpx.AsyncClient, llm: FakeChatCompletionServer
+) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    # Every request gets fresh sessions and URLs, so nothing is answered from the caches
+    ids = itertools.count()
+
+    async def measure(name: str, concurrency: int, request: Callable[[int], Awaitable[bool]]) -> None:
+        before = (llm.requests, llm.prompt_tokens, llm.completion_tokens)
+        summary = await drive(args.requests, concurrency, request)
+        # Model round trips and tokens each request cost, as counted by the fake model
+        summary["llm_calls_per_request"] = round((llm.requests - before[0]) / args.requests, 2)
+        summary["prompt_tokens_per_request"] = round((llm.prompt_tokens - before[1]) / args.requests, 1)
+        summary["completion_tokens_per_request"] = round((llm.completion_tokens - before[2]) / args.requests, 1)
+        results[name] = summary
+        print(
+            f"{name:<42} {summary['throughput_rps']:8.2f} req/s p50={summary['p50_seconds']:7.3f}s "
+            f"p95={summary['p95_seconds']:7.3f}s p99={summary['p99_seconds']:7.3f}s "
+            f"errors={summary['errors']:<3} peak={summary['peak_traced_mb']:7.1f}MB rss={summary['max_rss_mb']:7.1f}MB "
+            f"llm_calls={summary['llm_calls_per_request']:<5} "
+            f"tokens={summary['prompt_tokens_per_request']:.0f}+{summary['completion_tokens_per_request']:.0f}"
+        )
+
+    if "chat" in args.scenarios:
+        for concurrency in args.concurrency:
+            async def chat(index: int) -> bool:
+                response = await client.post("/chat/", json={
+                    "session_id": f"chat-{next(ids)}",
+                    "message": "We are Contoso, a cloud consultancy looking for IT decision makers.",
+                })
+                return response.status_code == 200
+            await measure(f"chat c={concurrency}", concurrency, chat)
+
+    if "process_invitees" in args.scenarios:
+        for mode, profiles, concurrency in itertools.product(args.modes, args.profiles, args.concurrency):
+            async def process(index: int) -> bool:
+                session = next(ids)
+                response = await client.post("/process_invitees/", json={
+                    "session_id": f"invitees-{session}",
+                    "linkedin_urls": fake_profile_urls(profiles, offset=session * profiles),
+                    "company_description": "Contoso, a cloud consultancy looking for IT decision makers.",
+                    "mode": mode,
+                })
+                return response.status_code == 200
+            await measure(f"process_invitees[{mode}] n={profiles} c={concurrency}", concurrency, process)
+
+    if "duplicates" in args.scenarios:
+        # Each group of ``concurrency`` requests sends the same URLs at once, as a double-submitting frontend would
+        for profiles, concurrency in itertools.product(args.profiles, args.concurrency):
+            group = next(ids)
+
+            async def duplicate(index: int) -> bool:
+                response = await client.post("/process_invitees/", json={
+                    "session_id": f"duplicates-{group}-{index}",
+                    "linkedin_urls": fake_profile_urls(profiles, offset=(20_000_000 + group * args.requests + index // concurrency) * profiles),
+                    "company_description": "Contoso, a cloud consultancy looking for IT decision makers.",
+                    "mode": "direct",
+                })
+                return response.status_code == 200 and not response.json()["errors"]
+
+            flights = {"scrape": app_module.linkedin_extractor.in_flight, "analysis": app_module.analysis_flights}
+            joined = {flight: in_flight.joined for flight, in_flight in flights.items()}
+            actor_runs = app_module.linkedin_extractor.client.calls
+            name = f"process_invitees[duplicates] n={profiles} c={concurrency}"
+            await measure(name, concurrency, duplicate)
+            results[name]["actor_runs_per_request"] = round((app_module.linkedin_extractor.client.calls - actor_runs) / args.requests, 2)
+            for flight, in_flight in flights.items():
+                results[name][f"{flight}_joined"] = in_flight.joined - joined[flight]
+            print(
+                f"{'':<42} actor_runs={results[name]['actor_runs_per_request']} per request, "
+                f"joined scrapes={results[name]['scrape_joined']} analyses={results[name]['analysis_joined']}"
+            )
+
+    if "send_emails" in args.scenarios:
+        for recipients in args.recipients:
+            for concurrency in args.concurrency:
+                async def send(index: int) -> bool:
+                    batch = next(ids)
+                    response = await client.post("/send_emails/", json={
+                        "email_body": "Hello from the load test.",
+                        "potential_clients": [f"user{batch}-{i}@example.com" for i in range(recipients)],
+                    })
+                    if response.status_code != 202:
+                        return False
+                    # Delivery runs in the background; the request counts until every email is sent
+                    job_id = response.json()["job_id"]
+                    job = await app_module.email_engine.wait(job_id)
+                    return job is not None and job.status == "completed"
+                await measure(f"send_emails n={recipients} c={concurrency}", concurrency, send)
+
+    if "generate_emails" in args.scenarios:
+        for recipients in args.recipients:
+            for concurrency in args.concurrency:
+                rates: List[float] = []
+
+                async def generate(index: int) -> bool:
+                    batch = next(ids)
+                    response = await client.post("/generate_emails/", json={
+                        "company_description": "Contoso, a cloud consultancy looking for IT decision makers.",
+                        "potential_clients": [
+                            {"url": url, "email": f"user{batch}-{i}@example.com", "potential_match": True}
+                            for i, url in enumerate(fake_profile_urls(recipients, offset=batch * recipients))
+                        ],
+                        "send": True,
+                    })
+                    frames = [json.loads(line) for line in response.text.splitlines() if line]
+                    if response.status_code != 200 or not frames or frames[-1]["type"] != "complete":
+                        return False
+                    rates.append(frames[-1]["drafts_per_second"])
+                    # The request counts until every draft is sent
+                    job = await app_module.email_engine.wait(frames[0]["job_id"])
+                    return job is not None and job.status == "completed"
+
+                name = f"generate_emails n={recipients} c={concurrency}"
+                await measure(name, concurrency, generate)
+                results[name]["drafts_per_second"] = round(statistics.mean(rates), 2) if rates else 0.0
+                print(f"{'':<42} {results[name]['drafts_per_second']:8.2f} drafts/s per request")
+
+    if "leads" in args.scenarios:
+        # Index the leads of one large event, then ask for them again and search them
+        urls = fake_profile_urls(args.leads, offset=10_000_000)
+        invitees = {
+            "session_id": "leads",
+            "linkedin_urls": urls,
+            "company_description": "Contoso, a cloud consultancy looking for IT decision makers.",
+            "mode": "direct",
+        }
+        started = time.perf_counter()
+        response = await client.post("/process_invitees/", json=invitees)
+        print(f"{'index ' + str(args.leads) + ' leads':<42} {time.perf_counter() - started:8.2f}s status={response.status_code} matches={len(response.json().get('potential_clients', []))}")
+        actor_runs = app_module.linkedin_extractor.client.calls
+
+        async def repeat(index: int) -> bool:
+            response = await client.post("/process_invitees/", json=invitees)
+            return response.status_code == 200 and not response.json()["errors"]
+        await measure(f"process_invitees[indexed] n={args.leads}", 1, repeat)
+        # Every profile was answered from the index: no actor run and no model call
+        results[f"process_invitees[indexed] n={args.leads}"]["actor_runs"] = app_module.linkedin_extractor.client.calls - actor_runs
+
+        queries = [
+            {"industry": INDUSTRIES[0]},
+            {"job_title": TITLES[1], "potential_match": "true"},
+            {"company": "Company 7"},
+            {"q": SKILLS[2]},
+            {"q": f"{TITLES[0]} {SKILLS[4]}", "industry": INDUSTRIES[1]},
+        ]
+        for concurrency in args.concurrency:
+            async def search(index: int) -> bool:
+                response = await client.get("/leads/", params=queries[index % len(queries)])
+                return response.status_code == 200
+            await measure(f"leads n={args.leads} c={concurrency}", concurrency, search)
+        print(f"{'':<42} lead_index={app_module.lead_index.stats()}")
+
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save(results: Dict[str, Any], output_dir: str) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(results["started_at"]))
+    path = os.path.join(output_dir, f"{stamp}-{results['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """Print the change of every scenario against the baseline and return whether any regressed."""
+    print(f"\nCompared with {baseline['commit']} ({time.ctime(baseline['started_at'])}):")
+    regressed = False
+    for name, summary in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before:
+            continue
+        changes = []
+        for key, worse_when_higher in (("throughput_rps", False), ("p95_seconds", True), ("p99_seconds", True), ("peak_traced_mb", True)):
+            if not before[key]:
+                continue
+            change = (summary[key] - before[key]) / before[key]
+            flag = ""
+            if key in ("throughput_rps", "p95_seconds") and (change > tolerance if worse_when_higher else change < -tolerance):
+                flag = " REGRESSION"
+                regressed = True
+            changes.append(f"{key}={change:+.1%}{flag}")
+        print(f"  {name:<42} {' '.join(changes)}")
+    return regressed
+
+
+async def run(args) -> int:
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory() as data_dir, \
+            FakeChatCompletionServer(latency=args.llm_latency, tokens_per_second=args.tokens_per_second) as llm, \
+            SMTPSink(latency=args.smtp_latency) as sink:
+        configure_environment(llm, sink, data_dir)
+        import main as app_module
+
+        app_module.linkedin_extractor.client = FakeApifyClientAsync(
+            run_latency=args.apify_run_latency, per_url_latency=args.apify_per_url_latency
+        )
+        # PROJECT_CONNECTION_STRING made the fake connection the default tenant's
+        app_module.runtimes.transport = llm.transport()
+        # What the lifespan does when a worker starts: load the agent SDKs and build the default runtime
+        await app_module.warm_up()
+
+        results = {
+            "commit": git_commit(),
+            "started_at": time.time(),
+            "python": sys.version.split()[0],
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("compare", "output")},
+        }
+        transport = httpx.ASGITransport(app=app_module.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                results["scenarios"] = await run_scenarios(args, app_module, client, llm)
+        finally:
+            await app_module.jobs.close()
+            await app_module.email_engine.close()
+            await app_module.runtimes.close()
+            app_module.profile_cache.close()
+            app_module.analysis_cache.close()
+            app_module.lead_index.close()
+        results["llm"] = {
+            "requests": llm.requests,
+            "prompt_tokens": llm.prompt_tokens,
+            "completion_tokens": llm.completion_tokens,
+        }
+        results["emails_received"] = sink.received
+
+    print(f"\nSaved {save(results, args.output)}")
+    if baseline and compare(results, baseline, args.tolerance):
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=["chat", "process_invitees", "duplicates", "send_emails", "generate_emails", "leads"],
+                        choices=["chat", "process_invitees", "duplicates", "send_emails", "generate_emails", "leads"])
+    parser.add_argument("--requests", type=int, default=20, help="Requests per scenario and level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--profiles", type=int, nargs="+", default=[10, 50], help="LinkedIn URLs per /process_invitees/ request")
+    parser.add_argument("--modes", nargs="+", default=["agents", "direct"], choices=["agents", "direct"],
+                        help="Scoring modes of /process_invitees/")
+    parser.add_argument("--recipients", type=int, nargs="+", default=[50], help="Recipients per /send_emails/ and /generate_emails/ request")
+    parser.add_argument("--leads", type=int, default=1000, help="Profiles indexed before /leads/ is searched")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds before the fake model starts answering")
+    parser.add_argument("--tokens-per-second", type=float, default=500, help="Streaming speed of the fake model")
+    parser.add_argument("--apify-run-latency", type=float, default=0.5, help="Fixed seconds per fake actor run")
+    parser.add_argument("--apify-per-url-latency", type=float, default=0.01, help="Extra seconds per scraped URL")
+    parser.add_argument("--smtp-latency", type=float, default=0.005, help="Seconds the SMTP sink takes per email")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Directory the results are saved to")
+    parser.add_argument("--compare", help="Results file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative change counted as a regression")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
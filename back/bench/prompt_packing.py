@@ -0,0 +1,80 @@
+"""Prompt size of scraped profiles before and after compaction, and chunking with an adaptive token budget.
+
+    python -m bench.prompt_packing --profiles 500 --context-tokens 6000
+"""
+import argparse
+import asyncio
+import json
+import time
+import types
+
+from fakes import FakeApifyClientAsync, fake_profile, fake_profile_urls
+from linkedin_extraction import LinkedInExtractor
+from prompt_packing import PromptPacker, estimate_tokens, profile_tokens
+from scoring_pipeline import ProfileScoringPipeline
+
+
+class FakeCoordinator:
+    """Answers after a delay proportional to the prompt size and cuts off answers to prompts over ``context_tokens``."""
+
+    name = "coordinator_agent"
+
+    def __init__(self, tokens_by_url, context_tokens: int, seconds_per_1k_tokens: float):
+        self.tokens_by_url = tokens_by_url
+        self.context_tokens = context_tokens
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+
+    async def invoke_stream(self, messages):
+        message = json.loads(str(messages.messages[-1].content))
+        urls = message["linkedin_urls"]
+        prompt_tokens = sum(self.tokens_by_url[url] for url in urls)
+        await asyncio.sleep(self.seconds_per_1k_tokens * prompt_tokens / 1000)
+        text = json.dumps({"status": "complete", "results": [{"url": url, "potential_match": True} for url in urls]})
+        if prompt_tokens > self.context_tokens:
+            text = text[: len(text) // 2]
+        yield types.SimpleNamespace(content=types.SimpleNamespace(content=text))
+
+
+async def measure(label: str, urls, tokens_by_url, packer: PromptPacker, args) -> None:
+    runtime = types.SimpleNamespace(
+        coordinator_agent=FakeCoordinator(tokens_by_url, args.context_tokens, args.seconds_per_1k_tokens)
+    )
+    # The extractor gives the pipeline the size of every profile before it packs the chunks
+    extractor = LinkedInExtractor(client=FakeApifyClientAsync(run_latency=0, per_url_latency=0))
+    pipeline = ProfileScoringPipeline(
+        runtime, chunk_size=args.chunk_size, extractor=extractor, packer=packer, mode="agents"
+    )
+    started = time.perf_counter()
+    summary = await pipeline.run("Benchmark company", urls)
+    elapsed = time.perf_counter() - started
+    stats = packer.stats()
+    print(
+        f"{label:<24} {elapsed:7.2f}s results={len(summary['results'])}/{len(urls)} batches={stats['batches']} "
+        f"truncated={stats['truncated']} tokens={stats['tokens']} final_budget={stats['token_budget']}"
+    )
+
+
+async def run(args) -> None:
+    urls = fake_profile_urls(args.profiles)
+    profiles = [fake_profile(url) for url in urls]
+    raw = sum(estimate_tokens(json.dumps(profile)) for profile in profiles)
+    compact = {profile["linkedinUrl"]: profile_tokens(profile) for profile in profiles}
+    print(f"prompt tokens: raw={raw} compacted={sum(compact.values())} ({sum(compact.values()) / raw:.0%})")
+
+    # Fixed chunks: the budget never adapts
+    fixed = PromptPacker(token_budget=10 ** 9, min_budget=10 ** 9, max_budget=10 ** 9)
+    await measure(f"fixed chunks of {args.chunk_size}", urls, compact, fixed, args)
+    await measure("adaptive token budget", urls, compact, PromptPacker(), args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=20)
+    parser.add_argument("--context-tokens", type=int, default=6000, help="Prompt size past which answers are cut off")
+    parser.add_argument("--seconds-per-1k-tokens", type=float, default=0.01)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Success rate and latency of chat completion calls through the resilience layer against a fake server.
+
+    python -m bench.resilience --requests 200 --concurrency 20 --throttle-every 5 --fail-every 7
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from resilience import ResilientService, ResilientTransport
+from fakes import FakeChatCompletionServer
+
+
+BODY = {"messages": [{"role": "user", "content": "Score these profiles. " * 50}]}
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+async def measure(label: str, server: FakeChatCompletionServer, args, service: ResilientService = None) -> None:
+    transport = ResilientTransport(service) if service else None
+    limits = httpx.Limits(max_connections=args.concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    statuses = {}
+
+    async with httpx.AsyncClient(transport=transport, limits=limits, timeout=30) as client:
+        async def one() -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(server.url, json=BODY)
+                    outcome = str(response.status_code)
+                except Exception as e:
+                    outcome = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[outcome] = statuses.get(outcome, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    print(
+        f"{label:<22} {elapsed:7.2f}s ok={statuses.get('200', 0) / args.requests:6.1%} "
+        f"p50={percentile(latencies, 0.5):6.3f}s p99={percentile(latencies, 0.99):6.3f}s outcomes={statuses}"
+    )
+    if service:
+        print(f"{'':<22} {json.dumps(service.stats())}")
+
+
+async def run(args) -> None:
+    options = dict(
+        latency=args.latency,
+        throttle_every=args.throttle_every,
+        retry_after=args.retry_after,
+        fail_every=args.fail_every,
+        slow_every=args.slow_every,
+        slow_latency=args.slow_latency,
+    )
+
+    def service(**overrides) -> ResilientService:
+        settings = dict(
+            requests_per_minute=args.requests_per_minute,
+            tokens_per_minute=0,
+            max_retries=4,
+            base_delay=0.05,
+            breaker_failures=10,
+            breaker_reset_seconds=1,
+            hedge_after_seconds=0,
+        )
+        settings.update(overrides)
+        return ResilientService("bench", **settings)
+
+    with FakeChatCompletionServer(**options) as server:
+        await measure("no resilience", server, args)
+    with FakeChatCompletionServer(**options) as server:
+        await measure("retries", server, args, service())
+    with FakeChatCompletionServer(**options) as server:
+        await measure(f"retries + hedge@{args.hedge_after}s", server, args, service(hedge_after_seconds=args.hedge_after))
+
+    # A dependency that is down: the breaker opens and the remaining calls fail fast
+    with FakeChatCompletionServer(**options) as server:
+        server.down = True
+        await measure("outage", server, args, service())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per successful answer")
+    parser.add_argument("--throttle-every", type=int, default=5, help="Answer every n-th request with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="Retry-After of the 429 answers")
+    parser.add_argument("--fail-every", type=int, default=7, help="Answer every n-th request with a 500")
+    parser.add_argument("--slow-every", type=int, default=20, help="Make every n-th answer slow")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Seconds per slow answer")
+    parser.add_argument("--hedge-after", type=float, default=0.2, help="Seconds before a hedged second attempt")
+    parser.add_argument("--requests-per-minute", type=float, default=0, help="Client-side rate limit, 0 = none")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Several worker processes sharing one SQLite state store: sessions, connections and jobs across workers, and worker startup time.
+
+    python -m bench.scale_out --workers 3 --turns 6
+
+Each worker is a separate process serving the app over HTTP against the fake Azure OpenAI, Apify and
+SMTP backends; requests are spread over the workers round robin, as a load balancer without sticky
+sessions would.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from fakes import (
+    FAKE_CONNECTION_STRING, FakeApifyClientAsync, FakeChatCompletionServer, SMTPSink, RedirectTransport, configure_environment,
+    fake_profile_urls,
+)
+from state_store import SQLiteStateStore
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(port: int, llm_endpoint: str, ready: Any) -> None:
+    """Worker process: import and warm up the app, report how long that took, then serve it."""
+    import uvicorn
+
+    async def run() -> None:
+        started = time.perf_counter()
+        import main as app_module
+        imported = time.perf_counter()
+        app_module.linkedin_extractor.client = FakeApifyClientAsync(run_latency=0.1, per_url_latency=0.0)
+        app_module.runtimes.transport = RedirectTransport(llm_endpoint)
+        await app_module.warm_up()
+        ready.put({
+            "port": port,
+            "import_seconds": round(imported - started, 2),
+            "warm_up_seconds": round(time.perf_counter() - imported, 2),
+        })
+        config = uvicorn.Config(app_module.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning")
+        await uvicorn.Server(config).serve()
+
+    asyncio.run(run())
+
+
+async def check_sessions(clients: List[httpx.AsyncClient], turns: int, store: Any) -> str:
+    # Turns of one session sent at once to different workers must all end up in its history
+    await asyncio.gather(*(
+        clients[turn % len(clients)].post("/chat/", json={"session_id": "shared", "message": f"Turn {turn}: we are Contoso."})
+        for turn in range(turns)
+    ))
+    history = store.get("sessions", "shared")
+    messages = json.loads(history["history"])["messages"] if history else []
+    kept = sum(1 for message in messages if message["role"] == "user")
+    return f"{kept}/{turns} concurrent turns kept"
+
+
+async def check_connections(clients: List[httpx.AsyncClient]) -> str:
+    conn_str = FAKE_CONNECTION_STRING.replace("bench;bench", "bench;acme")
+    headers = {"X-Tenant-ID": "acme"}
+    response = await clients[0].post("/set_connection/", json={"connection_string": conn_str}, headers=headers)
+    token = response.json()["tenant_token"]
+    connected = [
+        (await client.get("/connection_status/", headers=headers)).json()["connected"] for client in clients
+    ]
+    # The tenant's token is required on every worker
+    authorized = [
+        (await client.get("/leads/", headers={**headers, "X-Tenant-Token": token})).status_code == 200
+        and (await client.get("/leads/", headers=headers)).status_code == 401
+        for client in clients
+    ]
+    return f"set on worker 0, connected on {sum(connected)}/{len(clients)} workers, token enforced on {sum(authorized)}"
+
+
+async def check_jobs(clients: List[httpx.AsyncClient]) -> str:
+    submitted = await clients[0].post("/jobs/process_invitees/", json={
+        "session_id": "jobs",
+        "linkedin_urls": fake_profile_urls(10),
+        "company_description": "Contoso, a cloud consultancy looking for IT decision makers.",
+    })
+    job_id = submitted.json()["job_id"]
+    # Another worker follows the job and sees it finish
+    events = []
+    async with clients[-1].stream("GET", f"/jobs/{job_id}/events") as response:
+        async for line in response.aiter_lines():
+            if line:
+                events.append(line)
+    status = (await clients[len(clients) // 2].get(f"/jobs/{job_id}")).json()["status"]
+    return f"run on worker 0, {len(events)} events followed on worker {len(clients) - 1}, {status} on worker {len(clients) // 2}"
+
+
+async def check_email_reports(clients: List[httpx.AsyncClient]) -> str:
+    submitted = await clients[0].post("/send_emails/", json={
+        "email_body": "Hello from the scale-out check.",
+        "potential_clients": [f"user{i}@example.com" for i in range(10)],
+    })
+    job_id = submitted.json()["job_id"]
+    for _ in range(100):
+        report = (await clients[-1].get(f"/send_emails/{job_id}")).json()
+        if report.get("finished_at"):
+            return f"sent by worker 0, {report['status']} ({report['counts']}) on worker {len(clients) - 1}"
+        await asyncio.sleep(0.2)
+    return "report not available on the other worker"
+
+
+async def run(args) -> int:
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as data_dir, \
+            FakeChatCompletionServer(latency=args.llm_latency) as llm, \
+            SMTPSink() as sink:
+        configure_environment(llm, sink, data_dir)
+        state_path = os.path.join(data_dir, "state.db")
+        os.environ.update({"STATE_STORE": "sqlite", "STATE_STORE_PATH": state_path, "JOB_SAVE_INTERVAL_SECONDS": "0.2"})
+
+        ready = context.Queue()
+        ports = [free_port() for _ in range(args.workers)]
+        workers = [context.Process(target=serve, args=(port, llm.endpoint, ready), daemon=True) for port in ports]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        reports: List[Dict[str, Any]] = [await asyncio.to_thread(ready.get, True, 120) for _ in workers]
+        print(f"{args.workers} workers ready in {time.perf_counter() - started:.2f}s")
+        for report in sorted(reports, key=lambda r: r["port"]):
+            print(f"  worker :{report['port']} import={report['import_seconds']}s warm_up={report['warm_up_seconds']}s")
+
+        store = SQLiteStateStore(state_path)
+        clients = [httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120) for port in ports]
+        try:
+            print(f"sessions     {await check_sessions(clients, args.turns, store)}")
+            print(f"connections  {await check_connections(clients)}")
+            print(f"jobs         {await check_jobs(clients)}")
+            print(f"email        {await check_email_reports(clients)}")
+        finally:
+            for client in clients:
+                await client.aclose()
+            store.close()
+            for worker in workers:
+                worker.terminate()
+                worker.join()
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=6, help="Concurrent chat turns of one session")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds before the fake model starts answering")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import asyncio
+import os
+import random
+import smtplib
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, Dict, List, Optional, Tuple
+
+from resilience import RateLimiter
+from state_store import StateStore
+from telemetry import timed
+
+EMAIL_JOBS = "email_jobs"
+
+
+@dataclass
+class SMTPSettings:
+    server: str = "smtp.gmail.com"
+    port: int = 587
+    sender: Optional[str] = None
+    password: Optional[str] = None
+    starttls: bool = True
+    timeout: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "SMTPSettings":
+        return cls(
+            server=os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+            port=int(os.getenv("SMTP_PORT", "587")),
+            sender=os.getenv("SMTP_SENDER"),
+            password=os.getenv("SMTP_PASSWORD"),
+            starttls=os.getenv("SMTP_STARTTLS", "true").lower() == "true",
+            timeout=float(os.getenv("SMTP_TIMEOUT_SECONDS", "30")),
+        )
+
+
+class _PooledConnection:
+    """One SMTP session of the pool; its blocking calls run in worker threads."""
+
+    def __init__(self, settings: SMTPSettings, rate: float):
+        self.settings = settings
+        self.limiter = RateLimiter(rate, burst=1)
+        self.smtp: Optional[smtplib.SMTP] = None
+
+    def _connect(self) -> None:
+        smtp = smtplib.SMTP(self.settings.server, self.settings.port, timeout=self.settings.timeout)
+        if self.settings.starttls:
+            smtp.starttls()
+        if self.settings.password:
+            smtp.login(self.settings.sender, self.settings.password)
+        self.smtp = smtp
+
+    def _send(self, recipient: str, message: str) -> None:
+        if self.smtp is None:
+            self._connect()
+        self.smtp.sendmail(self.settings.sender, recipient, message)
+
+    def _close(self) -> None:
+        smtp, self.smtp = self.smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    async def send(self, recipient: str, message: str) -> None:
+        await self.limiter.acquire()
+        await asyncio.to_thread(self._send, recipient, message)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close)
+
+
+def is_transient_smtp_error(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError))
+
+
+@dataclass
+class DeliveryJob:
+    id: str
+    subject: str
+    body: str
+    recipients: Dict[str, Dict[str, Any]]
+    # Only requests of this tenant see the job
+    tenant: Optional[str] = None
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    # Personalized (subject, body) per recipient, or None when its draft failed
+    drafts: Dict[str, "asyncio.Future[Optional[Tuple[str, str]]]"] = field(default_factory=dict, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for report in self.recipients.values():
+            counts[report["status"]] = counts.get(report["status"], 0) + 1
+        return {
+            "job_id": self.id,
+            "tenant": self.tenant,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "counts": counts,
+            "recipients": self.recipients,
+        }
+
+
+class EmailDeliveryEngine:
+    """Sends emails in the background over a pool of SMTP connections.
+
+    Sends are limited globally (``rate_per_second``) and per connection
+    (``connection_rate_per_second``); transient failures reconnect and retry with backoff,
+    and a failing recipient never stops the rest of the job.
+
+    With a ``store``, job reports are saved to it every ``save_interval`` seconds while they run and
+    when they finish, so every worker sharing the store can serve them.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[SMTPSettings] = None,
+        pool_size: Optional[int] = None,
+        rate_per_second: Optional[float] = None,
+        connection_rate_per_second: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        max_jobs: int = 1000,
+        store: Optional[StateStore] = None,
+        save_interval: Optional[float] = None,
+    ):
+        self.settings = settings or SMTPSettings.from_env()
+        self.store = store
+        self.save_interval = save_interval or float(os.getenv("JOB_SAVE_INTERVAL_SECONDS", "1"))
+        self.pool_size = pool_size or int(os.getenv("SMTP_POOL_SIZE", "3"))
+        self.limiter = RateLimiter(
+            rate_per_second if rate_per_second is not None else float(os.getenv("SMTP_RATE_PER_SECOND", "5"))
+        )
+        self.connection_rate = (
+            connection_rate_per_second if connection_rate_per_second is not None
+            else float(os.getenv("SMTP_CONNECTION_RATE_PER_SECOND", "2"))
+        )
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("SMTP_MAX_RETRIES", "3"))
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, DeliveryJob]" = OrderedDict()
+        self._pool: Optional[asyncio.Queue] = None
+        self._connections: List[_PooledConnection] = []
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _get_pool(self) -> asyncio.Queue:
+        if self._pool is None:
+            self._pool = asyncio.Queue()
+            for _ in range(self.pool_size):
+                connection = _PooledConnection(self.settings, self.connection_rate)
+                self._connections.append(connection)
+                self._pool.put_nowait(connection)
+        return self._pool
+
+    def build_message(self, recipient: str, subject: str, body: str) -> str:
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = self.settings.sender
+        message["To"] = recipient
+        message.attach(MIMEText(body, "plain"))
+        return message.as_string()
+
+    async def _deliver(self, job: DeliveryJob, recipient: str) -> None:
+        report = job.recipients[recipient]
+        subject, body = job.subject, job.body
+        if recipient in job.drafts:
+            draft = await job.drafts[recipient]
+            if draft is None:
+                report["status"] = "failed"
+                return
+            subject, body = draft
+        message = self.build_message(recipient, subject, body)
+        pool = self._get_pool()
+        for attempt in range(self.max_retries + 1):
+            report["attempts"] = attempt + 1
+            await self.limiter.acquire()
+            connection = await pool.get()
+            try:
+                report["status"] = "sending"
+                with timed("smtp_send"):
+                    await connection.send(recipient, message)
+                report["status"] = "sent"
+                report["error"] = None
+                return
+            except Exception as e:
+                report["error"] = str(e)
+                # Drop the session so the next send on this connection reconnects
+                await connection.close()
+                if not is_transient_smtp_error(e) or attempt == self.max_retries:
+                    report["status"] = "failed"
+                    return
+                report["status"] = "retrying"
+            finally:
+                pool.put_nowait(connection)
+            await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def _store_report(self, report: Dict[str, Any], trim: bool) -> None:
+        self.store.set(EMAIL_JOBS, report["job_id"], report)
+        if trim:
+            entries = self.store.entries(EMAIL_JOBS)
+            for key, _, _ in entries[:max(0, len(entries) - self.max_jobs)]:
+                self.store.delete(EMAIL_JOBS, key)
+
+    async def _save(self, job: DeliveryJob, trim: bool = False) -> None:
+        if self.store is not None:
+            await asyncio.to_thread(self._store_report, job.to_dict(), trim)
+
+    async def _save_periodically(self, job: DeliveryJob) -> None:
+        while True:
+            await asyncio.sleep(self.save_interval)
+            await self._save(job)
+
+    async def _run(self, job: DeliveryJob) -> None:
+        job.status = "sending"
+        saver = asyncio.create_task(self._save_periodically(job)) if self.store is not None else None
+        try:
+            await asyncio.gather(*(self._deliver(job, recipient) for recipient in job.recipients))
+            failed = sum(1 for report in job.recipients.values() if report["status"] == "failed")
+            job.status = "completed" if not failed else "partial" if failed < len(job.recipients) else "failed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        finally:
+            job.finished_at = time.time()
+            if saver:
+                saver.cancel()
+            await asyncio.shield(self._save(job, trim=True))
+
+    def submit(
+        self, subject: str, body: str, recipients: List[str], drafted: bool = False, tenant: Optional[str] = None
+    ) -> DeliveryJob:
+        """Start delivering in the background for ``tenant`` and return the job for status polling.
+
+        With ``drafted``, every recipient waits for its own email, handed over with ``provide_draft``
+        (or given up with ``fail_draft``), and is sent as soon as it arrives; ``subject`` and ``body``
+        are then only the fallback of drafts that lack them.
+        """
+        if not self.settings.sender:
+            raise ValueError("No sender configured. Set SMTP_SENDER and SMTP_PASSWORD.")
+        unique = [recipient for recipient in dict.fromkeys(r.strip() for r in recipients if r and r.strip())]
+        status = "drafting" if drafted else "queued"
+        job = DeliveryJob(
+            id=uuid.uuid4().hex,
+            subject=subject,
+            body=body,
+            recipients={recipient: {"status": status, "attempts": 0, "error": None} for recipient in unique},
+            tenant=tenant,
+        )
+        if drafted:
+            loop = asyncio.get_running_loop()
+            job.drafts = {recipient: loop.create_future() for recipient in unique}
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    def provide_draft(self, job: DeliveryJob, recipient: str, subject: Optional[str], body: Optional[str]) -> None:
+        """Hand the personalized email of a recipient of a drafted job over for sending."""
+        draft = job.drafts.get(recipient.strip())
+        if draft is not None and not draft.done():
+            job.recipients[recipient.strip()]["status"] = "queued"
+            draft.set_result((subject or job.subject, body or job.body))
+
+    def fail_draft(self, job: DeliveryJob, error: str, recipient: Optional[str] = None) -> None:
+        """Mark the recipient (or every recipient still waiting) of a drafted job as failed, without sending."""
+        recipients = [recipient.strip()] if recipient else list(job.drafts)
+        for key in recipients:
+            draft = job.drafts.get(key)
+            if draft is not None and not draft.done():
+                job.recipients[key]["error"] = error
+                draft.set_result(None)
+
+    def get(self, job_id: str) -> Optional[DeliveryJob]:
+        return self.jobs.get(job_id)
+
+    async def report(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Report of a job, also when another worker sharing the store runs it."""
+        job = self.jobs.get(job_id)
+        if job:
+            return job.to_dict()
+        if self.store is None:
+            return None
+        return await asyncio.to_thread(self.store.get, EMAIL_JOBS, job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        recipients: Dict[str, int] = {}
+        for job in self.jobs.values():
+            if job.finished_at is None:
+                for report in job.recipients.values():
+                    recipients[report["status"]] = recipients.get(report["status"], 0) + 1
+        return {
+            "running_jobs": len(self._tasks),
+            "pending_recipients": recipients,
+            "idle_connections": self._pool.qsize() if self._pool is not None else self.pool_size,
+        }
+
+    async def wait(self, job_id: str) -> Optional[DeliveryJob]:
+        task = self._tasks.get(job_id)
+        if task:
+            await asyncio.gather(task, return_exceptions=True)
+        return self.jobs.get(job_id)
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for connection in self._connections:
+            await connection.close()
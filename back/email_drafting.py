@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from json_stream import parse_agent_json
+from telemetry import metrics, record_agent_stream, timed
+
+email_drafts = metrics.counter("email_drafts_total", "Emails drafted by the writer agent, per outcome.")
+
+
+def company_message(company_description: str) -> str:
+    """First message of every draft prompt of a company, byte for byte the same for all its clients."""
+    return json.dumps({"company_description": company_description}, sort_keys=True)
+
+
+class EmailDrafter:
+    """Drafts a personalized email per potential client through the runtime's writer agent.
+
+    Drafts run concurrently, at most ``concurrency`` at a time, and are yielded as each finishes, so
+    a slow draft never holds back the ones behind it. Every prompt starts with the writer instructions
+    and the same company message and only ends with the client's analysis: for all clients of a
+    company the provider sees one long identical prefix, which it can serve from its prompt cache.
+    """
+
+    def __init__(self, runtime: Any, concurrency: Optional[int] = None):
+        self.runtime = runtime
+        self.concurrency = concurrency or int(os.getenv("EMAIL_DRAFT_CONCURRENCY", "8"))
+        self.drafted = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    async def draft(self, prefix: str, client: Dict[str, Any]) -> Dict[str, Any]:
+        from semantic_kernel.contents import ChatHistory
+
+        agent = self.runtime.writer_agent
+        history = ChatHistory()
+        history.add_user_message(prefix)
+        history.add_user_message(json.dumps({"action": "generate_email", "analysis": client}))
+        parts = []
+        stream = agent.invoke_stream(messages=history)
+        async for content in record_agent_stream(agent.name, stream, prefix + history.messages[-1].content):
+            parts.append(content.content.content)
+        try:
+            with timed("parse"):
+                draft = parse_agent_json("".join(parts))
+        except ValueError:
+            draft = {"body": "".join(parts)}
+        if client.get("email"):
+            draft["to"] = client["email"]
+        return draft
+
+    async def _draft_one(self, prefix: str, index: int, client: Dict[str, Any]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"index": index, "url": client.get("url")}
+        # Also on a failed draft, so its delivery can be failed for the recipient right away
+        if client.get("email"):
+            result["to"] = client["email"]
+        try:
+            result.update(await self.draft(prefix, client))
+            self.drafted += 1
+            email_drafts.inc(outcome="drafted")
+        except Exception as e:
+            result["error"] = str(e)
+            self.failed += 1
+            email_drafts.inc(outcome="failed")
+        return result
+
+    async def draft_all(self, company_description: str, clients: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the draft of every client as it finishes, with its ``index`` in ``clients``.
+
+        A draft that failed carries an ``error`` instead of the email, and the client's ``to``
+        address like the others; the other drafts still run.
+        """
+        prefix = company_message(company_description)
+        pending = iter(enumerate(clients))
+        finished: asyncio.Queue = asyncio.Queue()
+
+        async def worker() -> None:
+            # Workers share the iterator, so each takes the next client only when it is free
+            for index, client in pending:
+                finished.put_nowait(await self._draft_one(prefix, index, client))
+
+        started = time.perf_counter()
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(clients)))]
+        try:
+            for _ in range(len(clients)):
+                yield await finished.get()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.seconds += time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "drafted": self.drafted,
+            "failed": self.failed,
+            "seconds": round(self.seconds, 3),
+            "drafts_per_second": round(self.drafted / self.seconds, 2) if self.seconds else 0.0,
+        }
@@ -0,0 +1,154 @@
+import os
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+REQUIRED_COLUMNS = ["name", "email", "linkedin_url"]
+
+
+class InviteeFileError(ValueError):
+    """The uploaded file cannot be read as an invitee list."""
+
+
+@dataclass
+class IngestReport:
+    rows: int = 0
+    invitees: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    parse_seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "invitees": self.invitees,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "parse_seconds": round(self.parse_seconds, 3),
+        }
+
+
+def normalize_urls(urls: "pd.Series") -> "pd.Series":
+    """Vectorized ``profile_cache.normalize_profile_url``; empty values stay empty."""
+    urls = urls.fillna("").astype(str).str.strip().str.lower()
+    urls = urls.str.replace(r"^[a-z]+://", "", regex=True).str.replace(r"[?#].*$", "", regex=True).str.rstrip("/")
+    return urls.where(urls == "", "https://" + urls)
+
+
+def normalize_emails(emails: "pd.Series") -> "pd.Series":
+    emails = emails.fillna("").astype(str).str.strip().str.lower()
+    return emails.where(emails.str.fullmatch(r"[^@\s]+@[^@\s]+\.[^@\s]+"), "")
+
+
+def _column_names(header) -> Dict[str, int]:
+    """Positions of the required columns in a header row, matched case-insensitively."""
+    positions = {}
+    for i, column in enumerate(header):
+        name = str(column or "").strip().lower()
+        if name in REQUIRED_COLUMNS and name not in positions:
+            positions[name] = i
+    missing = [column for column in REQUIRED_COLUMNS if column not in positions]
+    if missing:
+        raise InviteeFileError(f"The file must contain 'name', 'email', and 'linkedin_url' columns (missing {', '.join(missing)}).")
+    return positions
+
+
+def _csv_frames(file: BinaryIO, chunk_rows: int) -> Iterator["pd.DataFrame"]:
+    # pandas is only imported by the first upload, which keeps worker startup fast
+    import pandas as pd
+
+    header = pd.read_csv(file, nrows=0, encoding="utf-8-sig").columns
+    positions = _column_names(header)
+    file.seek(0)
+    reader = pd.read_csv(
+        file,
+        usecols=list(positions.values()),
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunk_rows,
+        encoding="utf-8-sig",
+    )
+    renames = {header[i]: name for name, i in positions.items()}
+    for frame in reader:
+        yield frame.rename(columns=renames)
+
+
+def _xlsx_frames(file: BinaryIO, chunk_rows: int) -> Iterator["pd.DataFrame"]:
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    # Read-only mode streams the sheet instead of loading every cell
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        positions = _column_names(next(rows, ()))
+        wanted = [(name, positions[name]) for name in REQUIRED_COLUMNS]
+        chunk: List[Tuple[Any, ...]] = []
+        for row in rows:
+            chunk.append(tuple(row[i] if i < len(row) else None for _, i in wanted))
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=REQUIRED_COLUMNS)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=REQUIRED_COLUMNS)
+    finally:
+        workbook.close()
+
+
+def ingest_invitees(
+    file: BinaryIO, filename: str, chunk_rows: Optional[int] = None
+) -> Tuple[List[Dict[str, str]], IngestReport]:
+    """Parse a CSV or XLSX invitee list chunk by chunk.
+
+    LinkedIn URLs and emails are normalized, rows without a LinkedIn URL are dropped, and rows repeating
+    a URL or an email seen earlier in the file are skipped. Blocking; call through ``asyncio.to_thread``.
+    """
+    chunk_rows = chunk_rows or int(os.getenv("INGEST_CHUNK_ROWS", "5000"))
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".csv":
+        frames = _csv_frames(file, chunk_rows)
+    elif extension in (".xlsx", ".xlsm"):
+        frames = _xlsx_frames(file, chunk_rows)
+    else:
+        raise InviteeFileError("Only .csv and .xlsx files are supported.")
+
+    report = IngestReport()
+    started = time.perf_counter()
+    invitees: List[Dict[str, str]] = []
+    seen_urls: set = set()
+    seen_emails: set = set()
+    try:
+        for frame in frames:
+            report.rows += len(frame)
+            urls = normalize_urls(frame["linkedin_url"])
+            emails = normalize_emails(frame["email"])
+            names = frame["name"].fillna("").astype(str).str.strip()
+
+            valid = urls.str.contains("linkedin.com/", regex=False)
+            report.invalid += int((~valid).sum())
+            emails = emails.where(valid, "")
+            # Duplicates within the chunk, then against earlier chunks
+            duplicate = urls.duplicated() | urls.isin(seen_urls)
+            duplicate |= (emails != "") & (emails.duplicated() | emails.isin(seen_emails))
+            duplicate &= valid
+            report.duplicates += int(duplicate.sum())
+
+            keep = valid & ~duplicate
+            kept_urls, kept_emails = urls[keep].tolist(), emails[keep].tolist()
+            seen_urls.update(kept_urls)
+            seen_emails.update(email for email in kept_emails if email)
+            invitees.extend(
+                {"name": name, "email": email, "linkedinUrl": url}
+                for name, email, url in zip(names[keep].tolist(), kept_emails, kept_urls)
+            )
+    except InviteeFileError:
+        raise
+    except Exception as e:
+        raise InviteeFileError(f"Could not read {filename}: {str(e)}") from e
+
+    report.invitees = len(invitees)
+    report.parse_seconds = time.perf_counter() - started
+    return invitees, report
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from state_store import StateStore
+
+JOBS = "jobs"
+JOB_CANCELS = "job_cancels"
+FINISHED = ("completed", "failed", "cancelled")
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    # Only requests of this tenant see the job
+    tenant: Optional[str] = None
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Dict[str, Any] = field(default_factory=dict)
+    partial_results: List[Any] = field(default_factory=list)
+    result: Any = None
+    error: Optional[str] = None
+    # Last time the worker running the job saved it
+    heartbeat_at: Optional[float] = None
+    _subscribers: List[asyncio.Queue] = field(default_factory=list, repr=False)
+    _changed: bool = field(default=False, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "tenant": self.tenant,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+            "partial_results": self.partial_results,
+            "result": self.result,
+            "error": self.error,
+            "heartbeat_at": self.heartbeat_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        return cls(
+            id=data["job_id"],
+            kind=data["kind"],
+            tenant=data.get("tenant"),
+            status=data["status"],
+            created_at=data["created_at"],
+            started_at=data.get("started_at"),
+            finished_at=data.get("finished_at"),
+            progress=data.get("progress") or {},
+            partial_results=data.get("partial_results") or [],
+            result=data.get("result"),
+            error=data.get("error"),
+            heartbeat_at=data.get("heartbeat_at"),
+        )
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        self._changed = True
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def set_progress(self, progress: Dict[str, Any]) -> None:
+        self.progress = progress
+        self.publish({"type": "progress", **progress})
+
+    def add_partial_result(self, result: Any) -> None:
+        self.partial_results.append(result)
+        self.publish({"type": "result", "result": result})
+
+
+class JobQueue:
+    """Runs long analyses in the background and keeps their results.
+
+    At most ``workers`` jobs run at once, and at most ``per_key_concurrency`` of them for the same
+    key (the connection string the job uses). Job records are saved to the StateStore when they
+    start and finish, so finished results can be fetched again without running the agents.
+
+    While a job runs, its progress is saved every ``save_interval`` seconds, so every worker sharing
+    the store can report, follow and cancel it whichever worker runs it. Queued and running jobs are
+    saved at least every third of ``lease_seconds`` as a heartbeat; a job whose record is older than
+    ``lease_seconds`` lost its worker and is reported as failed.
+    """
+
+    def __init__(
+        self,
+        store: StateStore,
+        workers: Optional[int] = None,
+        per_key_concurrency: Optional[int] = None,
+        max_jobs: Optional[int] = None,
+        save_interval: Optional[float] = None,
+        lease_seconds: Optional[float] = None,
+    ):
+        self.store = store
+        self.save_interval = save_interval or float(os.getenv("JOB_SAVE_INTERVAL_SECONDS", "1"))
+        self.lease_seconds = lease_seconds or float(os.getenv("JOB_LEASE_SECONDS", "30"))
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "8"))
+        self.per_key_concurrency = per_key_concurrency or int(os.getenv("JOB_CONCURRENCY_PER_CONNECTION", "2"))
+        self.max_jobs = max_jobs or int(os.getenv("JOB_MAX_STORED", "1000"))
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._key_slots: Dict[str, asyncio.Semaphore] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def _save(self, job: Job) -> None:
+        job._changed = False
+        job.heartbeat_at = time.time()
+        await asyncio.to_thread(self.store.set, JOBS, job.id, job.to_dict())
+
+    async def _sync(self, job: Job, task: asyncio.Task) -> None:
+        """Save the progress of a queued or running job and cancel it when another worker asked to."""
+        while True:
+            await asyncio.sleep(self.save_interval)
+            if await asyncio.to_thread(self.store.get, JOB_CANCELS, job.id):
+                task.cancel()
+                return
+            if job._changed or time.time() - job.heartbeat_at >= self.lease_seconds / 3:
+                await self._save(job)
+
+    async def _fail_abandoned(self, job: Job) -> Job:
+        """Mark a saved job failed when the worker running it stopped saving it."""
+        if job.status in FINISHED or time.time() - (job.heartbeat_at or job.created_at) <= self.lease_seconds:
+            return job
+        job.status = "failed"
+        job.error = "The worker running the job stopped."
+        job.finished_at = time.time()
+        await asyncio.to_thread(self.store.set, JOBS, job.id, job.to_dict())
+        return job
+
+    async def _forget_old_jobs(self) -> None:
+        # Oldest first; a long running job only keeps its own record, not the finished ones after it
+        excess = len(self.jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED][:excess]
+        for job_id in finished:
+            # Jobs finishing together trim concurrently
+            if self.jobs.pop(job_id, None):
+                await asyncio.to_thread(self.store.delete, JOBS, job_id)
+
+    async def _run(self, job: Job, key: str, run: Callable[[Job], Awaitable[Any]]) -> None:
+        key_slots = self._key_slots.setdefault(key, asyncio.Semaphore(self.per_key_concurrency))
+        sync = asyncio.create_task(self._sync(job, asyncio.current_task()))
+        try:
+            # Wait for the key first so a job blocked on its connection does not hold a worker
+            async with key_slots, self._slots:
+                job.status = "running"
+                job.started_at = time.time()
+                job.publish({"type": "status", "status": job.status})
+                await self._save(job)
+                job.result = await run(job)
+                job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            sync.cancel()
+            await asyncio.gather(sync, return_exceptions=True)
+            job.finished_at = time.time()
+            job.publish({"type": "done", **job.to_dict()})
+            await self._save(job)
+            await asyncio.to_thread(self.store.delete, JOB_CANCELS, job.id)
+            await self._forget_old_jobs()
+
+    async def submit(
+        self, kind: str, key: str, run: Callable[[Job], Awaitable[Any]], tenant: Optional[str] = None
+    ) -> Job:
+        """Queue ``run(job)`` for ``tenant``; its return value becomes the job result."""
+        job = Job(id=uuid.uuid4().hex, kind=kind, tenant=tenant)
+        self.jobs[job.id] = job
+        await self._save(job)
+        task = asyncio.create_task(self._run(job, key, run))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job:
+            return job
+        data = await asyncio.to_thread(self.store.get, JOBS, job_id)
+        return await self._fail_abandoned(Job.from_dict(data)) if data else None
+
+    async def cancel(self, job_id: str) -> bool:
+        job = await self.get(job_id)
+        if not job or job.status in FINISHED:
+            return False
+        task = self._tasks.get(job_id)
+        if not task:
+            # Running on another worker, which checks for the request every save_interval
+            await asyncio.to_thread(self.store.set, JOB_CANCELS, job_id, {"requested_at": time.time()})
+            return True
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return True
+
+    async def wait(self, job_id: str) -> Optional[Job]:
+        task = self._tasks.get(job_id)
+        if task:
+            await asyncio.gather(task, return_exceptions=True)
+        return await self.get(job_id)
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield a snapshot of the job followed by its events until it finishes."""
+        job = await self.get(job_id)
+        if not job:
+            return
+        yield {"type": "snapshot", **job.to_dict()}
+        if job.status in FINISHED:
+            return
+        if job_id not in self.jobs:
+            async for event in self._follow_saved(job):
+                yield event
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        job._subscribers.append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if event["type"] == "done":
+                    return
+        finally:
+            job._subscribers.remove(queue)
+
+    async def _follow_saved(self, job: Job) -> AsyncIterator[Dict[str, Any]]:
+        """Events of a job another worker runs, replayed from the records it saves."""
+        seen_results = len(job.partial_results)
+        while True:
+            await asyncio.sleep(self.save_interval)
+            data = await asyncio.to_thread(self.store.get, JOBS, job.id)
+            if not data:
+                return
+            saved = await self._fail_abandoned(Job.from_dict(data))
+            if saved.status != job.status and saved.status not in FINISHED:
+                yield {"type": "status", "status": saved.status}
+            for result in saved.partial_results[seen_results:]:
+                yield {"type": "result", "result": result}
+            seen_results = len(saved.partial_results)
+            if saved.progress != job.progress:
+                yield {"type": "progress", **saved.progress}
+            if saved.status in FINISHED:
+                yield {"type": "done", **saved.to_dict()}
+                return
+            job = saved
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"jobs": counts, "running": len(self._tasks)}
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
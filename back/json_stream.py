@@ -0,0 +1,169 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Characters that can change the parser state; everything else is skipped in bulk
+_SPECIAL = re.compile(r'[\\"{}\[\]:,]')
+
+
+class TruncatedJSONError(ValueError):
+    """The output ended inside its top-level JSON document, as when the model ran out of tokens."""
+
+
+class IncrementalJSONParser:
+    """Pulls JSON out of streamed agent output in a single pass.
+
+    Chunks are scanned as they arrive: every object of the ``array_key`` array of the top-level
+    document is returned by ``feed`` as soon as its closing brace is seen, and ``document``
+    parses the first complete top-level object, ignoring code fences and prose around it.
+    """
+
+    def __init__(self, array_key: str = "results"):
+        self.array_key = array_key
+        self._parts: List[str] = []
+        self._length = 0
+        self._text: Optional[str] = None
+
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._documents: List[Tuple[int, int]] = []
+        self._document_start: Optional[int] = None
+
+        # Keys of the top-level object, to find the start of the array
+        self._key_parts: Optional[List[str]] = None
+        self._key_start = 0
+        self._last_key: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+
+        # Text of the array item currently being read
+        self._item_parts: Optional[List[str]] = None
+        self._item_start = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Consume a chunk and return the array items that were completed by it."""
+        if not chunk:
+            return []
+        completed: List[Dict[str, Any]] = []
+        offset = self._length
+        skip_until = 0
+        if self._escape:
+            self._escape = False
+            skip_until = 1
+
+        for match in _SPECIAL.finditer(chunk):
+            i = match.start()
+            if i < skip_until:
+                continue
+            char = match.group()
+
+            if self._in_string:
+                if char == "\\":
+                    if i + 1 < len(chunk):
+                        skip_until = i + 2
+                    else:
+                        self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key_parts is not None:
+                        self._last_key = "".join(self._key_parts) + chunk[self._key_start:i]
+                        self._key_parts = None
+                continue
+
+            if self._depth == 0:
+                # Outside a document only an opening brace matters; prose may hold anything else
+                if char == "{":
+                    self._depth = 1
+                    self._document_start = offset + i
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._pending_key is None:
+                    self._key_parts = []
+                    self._key_start = i + 1
+            elif char == ":":
+                if self._depth == 1:
+                    self._pending_key = self._last_key
+            elif char == ",":
+                if self._depth == 1:
+                    self._pending_key = None
+                    self._last_key = None
+            elif char in "{[":
+                if char == "[" and self._depth == 1 and self._pending_key == self.array_key:
+                    self._array_depth = 2
+                elif char == "{" and self._array_depth is not None and self._depth == self._array_depth:
+                    self._item_parts = []
+                    self._item_start = i
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._item_parts is not None and self._depth == self._array_depth:
+                    item_text = "".join(self._item_parts) + chunk[self._item_start:i + 1]
+                    self._item_parts = None
+                    try:
+                        item = json.loads(item_text)
+                    except json.JSONDecodeError:
+                        item = None
+                    if isinstance(item, dict):
+                        completed.append(item)
+                elif self._array_depth is not None and self._depth == self._array_depth - 1:
+                    self._array_depth = None
+                if self._depth == 0:
+                    self._documents.append((self._document_start, offset + i + 1))
+                    self._document_start = None
+                    self._pending_key = None
+                    self._last_key = None
+                    self._array_depth = None
+
+        # Carry partially read keys and items over to the next chunk
+        if self._key_parts is not None:
+            self._key_parts.append(chunk[self._key_start:])
+            self._key_start = 0
+        if self._item_parts is not None:
+            self._item_parts.append(chunk[self._item_start:])
+            self._item_start = 0
+
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        self._text = None
+        return completed
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far, joined once."""
+        if self._text is None:
+            self._text = "".join(self._parts)
+            self._parts = [self._text]
+        return self._text
+
+    @property
+    def unclosed(self) -> bool:
+        """Whether the output so far ends inside a top-level document."""
+        return self._depth > 0
+
+    def document(self) -> Dict[str, Any]:
+        """Parse the first complete top-level JSON object of the output.
+
+        Raises TruncatedJSONError when there is none because the output stopped inside one, and
+        ValueError when the output holds no JSON object at all.
+        """
+        for start, end in self._documents:
+            try:
+                data = json.loads(self.text[start:end])
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                return data
+        if self.unclosed:
+            raise TruncatedJSONError("The json response was truncated before its end")
+        raise ValueError("Failed to extract the json response")
+
+
+def parse_agent_json(response: str) -> Dict[str, Any]:
+    """Extract the JSON object from an agent response that may be wrapped in prose or code fences."""
+    parser = IncrementalJSONParser()
+    parser.feed(response)
+    return parser.document()
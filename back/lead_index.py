@@ -0,0 +1,230 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from profile_cache import normalize_profile_url
+
+# Profile fields with their own column, and the filter name of the ones that are indexed
+COLUMNS = {
+    "firstName": "first_name",
+    "lastName": "last_name",
+    "headline": "headline",
+    "jobTitle": "job_title",
+    "companyName": "company_name",
+    "companyIndustry": "company_industry",
+}
+FILTERS = {"industry": "company_industry", "job_title": "job_title", "company": "company_name"}
+
+
+def profile_skills(profile: Dict[str, Any]) -> str:
+    skills = [skill.get("title") for skill in profile.get("skills") or [] if isinstance(skill, dict)]
+    return ", ".join(filter(None, [profile.get("topSkillsByEndorsements"), *skills]))
+
+
+def fts_query(text: str) -> str:
+    """Every word of ``text`` as a quoted FTS5 term, so user input cannot break the query syntax."""
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+
+class LeadIndex:
+    """Scraped profiles and their analyses across every event, in a SQLite file.
+
+    Profiles are kept once per normalized URL, with indexed columns for the industry, job title and
+    company, and a full-text index over the headline and skills when SQLite has FTS5. Analyses are
+    kept per tenant, company and profile with an indexed ``potential_match``, so a tenant only finds
+    the leads it qualified, and a profile already analyzed for the same company within
+    ``max_age_seconds`` does not need to be scraped or scored again.
+
+    Methods are blocking and thread-safe; call them through ``asyncio.to_thread`` from async code.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_age_seconds: Optional[float] = None):
+        self.path = path or os.getenv("LEAD_INDEX_PATH", "lead_index.db")
+        self.max_age_seconds = max_age_seconds or float(os.getenv("LEAD_INDEX_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leads (url TEXT PRIMARY KEY, "
+            + ", ".join(f"{column} TEXT" for column in COLUMNS.values())
+            + ", skills TEXT, profile TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        for column in FILTERS.values():
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS leads_{column} ON leads ({column} COLLATE NOCASE)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lead_analyses (tenant TEXT NOT NULL, company_key TEXT NOT NULL, "
+            "url TEXT NOT NULL, potential_match INTEGER NOT NULL, match_reason TEXT, result TEXT NOT NULL, "
+            "analyzed_at REAL NOT NULL, PRIMARY KEY (tenant, company_key, url))"
+        )
+        # Leads are listed most recent first, so a query walks these in order and stops at its limit
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lead_analyses_recent ON lead_analyses (tenant, analyzed_at)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS lead_analyses_match ON lead_analyses (tenant, potential_match, analyzed_at)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lead_analyses_url ON lead_analyses (url)")
+        try:
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5(headline, skills)")
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: text queries fall back to LIKE
+            self.full_text = False
+        self._conn.commit()
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def put_profiles(self, profiles: Iterable[Dict[str, Any]]) -> None:
+        now = time.time()
+        with self._lock:
+            for profile in profiles:
+                if not profile.get("linkedinUrl"):
+                    continue
+                url = normalize_profile_url(profile["linkedinUrl"])
+                values = [profile.get(field) for field in COLUMNS]
+                skills = profile_skills(profile)
+                # An upsert keeps the rowid, which the full-text index refers to
+                self._conn.execute(
+                    "INSERT INTO leads (url, " + ", ".join(COLUMNS.values()) + ", skills, profile, updated_at) "
+                    f"VALUES (?, {', '.join('?' * len(COLUMNS))}, ?, ?, ?) "
+                    "ON CONFLICT (url) DO UPDATE SET "
+                    + ", ".join(f"{column} = excluded.{column}" for column in COLUMNS.values())
+                    + ", skills = excluded.skills, profile = excluded.profile, updated_at = excluded.updated_at",
+                    (url, *values, skills, json.dumps(profile), now),
+                )
+                if self.full_text:
+                    row = self._conn.execute("SELECT rowid FROM leads WHERE url = ?", (url,)).fetchone()
+                    self._conn.execute("DELETE FROM leads_fts WHERE rowid = ?", (row[0],))
+                    self._conn.execute(
+                        "INSERT INTO leads_fts (rowid, headline, skills) VALUES (?, ?, ?)",
+                        (row[0], profile.get("headline") or "", skills),
+                    )
+            self._conn.commit()
+
+    def put_results(self, tenant: str, company_key: str, results: Iterable[Dict[str, Any]]) -> None:
+        now = time.time()
+        rows = [
+            (
+                tenant, company_key, normalize_profile_url(str(result["url"])),
+                int(bool(result.get("potential_match"))), result.get("match_reason"),
+                json.dumps({key: value for key, value in result.items() if key not in ("url", "cached")}), now,
+            )
+            for result in results if result.get("url")
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO lead_analyses VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def known_results(self, tenant: str, company_key: str, urls: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Recent results of the tenant for the same company, keyed by normalized URL."""
+        keys = list(dict.fromkeys(normalize_profile_url(url) for url in urls))
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            # Stay under SQLite's limit of variables per statement
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT url, result FROM lead_analyses WHERE tenant = ? AND company_key = ? AND analyzed_at > ? "
+                    f"AND url IN ({','.join('?' * len(batch))})",
+                    (tenant, company_key, time.time() - self.max_age_seconds, *batch),
+                ).fetchall()
+                found.update((url, json.loads(result)) for url, result in rows)
+        return found
+
+    def query(
+        self,
+        tenant: str,
+        company_key: Optional[str] = None,
+        potential_match: Optional[bool] = None,
+        text: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+        **filters: Optional[str],
+    ) -> List[Dict[str, Any]]:
+        """Analyzed leads of a tenant, most recent first; one entry per profile and company it was analyzed for.
+
+        ``filters`` match ``industry``, ``job_title`` and ``company`` exactly, ignoring case, and
+        ``text`` finds words of the headline and skills.
+        """
+        conditions = ["a.tenant = ?"]
+        params: List[Any] = [tenant]
+        if company_key:
+            conditions.append("a.company_key = ?")
+            params.append(company_key)
+        if potential_match is not None:
+            conditions.append("a.potential_match = ?")
+            params.append(int(potential_match))
+        for name, value in filters.items():
+            if value:
+                conditions.append(f"l.{FILTERS[name]} = ? COLLATE NOCASE")
+                params.append(value)
+        if text and text.split():
+            if self.full_text:
+                conditions.append("l.rowid IN (SELECT rowid FROM leads_fts WHERE leads_fts MATCH ?)")
+                params.append(fts_query(text))
+            else:
+                for word in text.split():
+                    conditions.append("(l.headline LIKE ? OR l.skills LIKE ?)")
+                    params.extend([f"%{word}%"] * 2)
+        started = time.perf_counter()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT l.url, " + ", ".join(f"l.{column}" for column in COLUMNS.values())
+                + ", l.skills, a.company_key, a.potential_match, a.match_reason, a.result, a.analyzed_at "
+                "FROM lead_analyses a JOIN leads l ON l.url = a.url "
+                f"WHERE {' AND '.join(conditions)} ORDER BY a.analyzed_at DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - started
+        leads = []
+        for row in rows:
+            lead = {"url": row[0], **dict(zip(COLUMNS, row[1:len(COLUMNS) + 1]))}
+            skills, company_key, match, reason, result, analyzed_at = row[len(COLUMNS) + 1:]
+            lead.update({
+                "skills": skills,
+                "company_key": company_key,
+                "potential_match": bool(match),
+                "match_reason": reason,
+                "analysis": json.loads(result).get("analysis"),
+                "analyzed_at": analyzed_at,
+            })
+            leads.append(lead)
+        return leads
+
+    def get(self, tenant: str, url: str) -> Optional[Dict[str, Any]]:
+        """A profile the tenant analyzed, with every analysis of it."""
+        key = normalize_profile_url(url)
+        with self._lock:
+            analyses = self._conn.execute(
+                "SELECT company_key, result, analyzed_at FROM lead_analyses WHERE tenant = ? AND url = ? "
+                "ORDER BY analyzed_at DESC",
+                (tenant, key),
+            ).fetchall()
+            row = self._conn.execute("SELECT profile FROM leads WHERE url = ?", (key,)).fetchone() if analyses else None
+        if not row:
+            return None
+        return {
+            "url": key,
+            "profile": json.loads(row[0]),
+            "analyses": [
+                {"company_key": company_key, **json.loads(result), "analyzed_at": analyzed_at}
+                for company_key, result, analyzed_at in analyses
+            ],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            leads = self._conn.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+            analyses = self._conn.execute("SELECT COUNT(*) FROM lead_analyses").fetchone()[0]
+            return {
+                "leads": leads,
+                "analyses": analyses,
+                "queries": self.queries,
+                "avg_query_ms": round(1000 * self.query_seconds / self.queries, 3) if self.queries else None,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
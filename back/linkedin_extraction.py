@@ -0,0 +1,225 @@
+import asyncio
+import os
+from dataclasses import dataclass, field, asdict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from profile_cache import ProfileCache, normalize_profile_url
+from resilience import ResilientService, services
+from single_flight import Futures, SingleFlight
+from telemetry import timed
+
+
+LINKEDIN_ACTOR_ID = "2SyF0bVxmgGr8IVCZ"
+
+# Fields of the Apify dataset items that are passed on to the agents
+PROFILE_FIELDS = [
+    "linkedinUrl",
+    "firstName",
+    "lastName",
+    "headline",
+    "jobTitle",
+    "companyName",
+    "companyIndustry",
+    "currentJobDuration",
+    "topSkillsByEndorsements",
+    "experiences",
+    "skills",
+]
+
+_DONE = object()
+
+
+def extract_profile_fields(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: item.get(name) for name in PROFILE_FIELDS}
+
+
+@dataclass
+class ExtractionProgress:
+    """Progress of an extraction, using the counter names of the coordinator response schema."""
+    current_batch: int = 0
+    total_batches: int = 0
+    processed_urls: int = 0
+    total_urls: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class LinkedInExtractor:
+    """Scrapes LinkedIn profiles through the Apify actor in concurrent batches without blocking the event loop."""
+
+    def __init__(
+        self,
+        client: Any = None,
+        actor_id: str = LINKEDIN_ACTOR_ID,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        cache: Optional[ProfileCache] = None,
+        service: Optional[ResilientService] = None,
+    ):
+        self._client = client
+        self.service = service or services.get("apify")
+        self.cache = cache
+        self.actor_id = actor_id
+        self.batch_size = batch_size or int(os.getenv("APIFY_BATCH_SIZE", "25"))
+        self.max_concurrency = max_concurrency or int(os.getenv("APIFY_MAX_CONCURRENCY", "4"))
+        # Profiles being scraped for any caller, so concurrent requests for one profile share its run
+        self.in_flight = SingleFlight("scrape")
+
+    @property
+    def client(self) -> Any:
+        # Created on first use, so the Apify SDK is not imported while a worker starts
+        if self._client is None:
+            from apify_client import ApifyClientAsync
+
+            # Retries are left to the apify service, which also rate limits and breaks the circuit
+            self._client = ApifyClientAsync(os.getenv("APIFY_API_KEY"), max_retries=0)
+        return self._client
+
+    @client.setter
+    def client(self, client: Any) -> None:
+        self._client = client
+
+    def make_batches(self, urls: List[str]) -> List[List[str]]:
+        return [urls[i:i + self.batch_size] for i in range(0, len(urls), self.batch_size)]
+
+    async def _run_batch(self, batch: List[str], queue: asyncio.Queue, led: Optional[Futures] = None) -> None:
+        """Scrape a batch into ``queue``, resolving the ``led`` flights of its URLs as profiles arrive."""
+        led = led or {}
+        keys = [normalize_profile_url(url) for url in batch]
+        try:
+            with timed("apify_scrape"):
+                run = await self.service.call(lambda: self.client.actor(self.actor_id).call(run_input={"profileUrls": batch}))
+            if not run:
+                raise RuntimeError("The Apify actor run did not return a result.")
+            profiles = []
+            async for item in self.client.dataset(run["defaultDatasetId"]).iterate_items():
+                profile = extract_profile_fields(item)
+                profiles.append(profile)
+                self.in_flight.resolve(led, normalize_profile_url(profile.get("linkedinUrl") or ""), profile)
+                await queue.put(profile)
+            if self.cache and profiles:
+                await asyncio.to_thread(self.cache.put_many, profiles)
+        except Exception as e:
+            for key in keys:
+                self.in_flight.fail(led, key, e)
+            raise
+        # URLs the actor returned nothing for have no profile for anyone
+        for key in keys:
+            self.in_flight.resolve(led, key, None)
+        # Only now that the profiles are cached, so later callers find them there
+        self.in_flight.release(led, keys)
+
+    async def stream(
+        self,
+        urls: List[str],
+        on_progress: Optional[Callable[[ExtractionProgress], Any]] = None,
+        progress: Optional[ExtractionProgress] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield profiles as soon as their dataset items arrive, whichever batch they belong to.
+
+        Cached profiles are yielded first and only the cache misses are scraped. Misses another
+        caller is already scraping are not scraped again: their profiles are yielded when that run
+        delivers them. A failing batch is recorded in ``progress.errors`` and the remaining batches
+        keep running; the first error is only raised when every batch failed.
+        """
+        cached: Dict[str, Dict[str, Any]] = {}
+        if self.cache:
+            cached = await asyncio.to_thread(self.cache.get_many, urls)
+        misses = {normalize_profile_url(url): url for url in urls if normalize_profile_url(url) not in cached}
+        led, joined = self.in_flight.claim(misses)
+        runner: Optional[asyncio.Task] = None
+        try:
+            batches = self.make_batches([misses[key] for key in led])
+            progress = progress or ExtractionProgress()
+            progress.total_batches = len(batches)
+            progress.total_urls = len(urls)
+            progress.processed_urls = len(urls) - len(misses)
+            if cached and on_progress:
+                on_progress(progress)
+            for profile in cached.values():
+                yield profile
+            if not batches and not joined:
+                return
+
+            # A bounded queue keeps fast batches from piling up items nobody is consuming yet
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.batch_size * self.max_concurrency)
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            failures: List[BaseException] = []
+            taken_over_urls: List[str] = []
+
+            async def run_batch(batch: List[str]) -> None:
+                async with semaphore:
+                    try:
+                        await self._run_batch(batch, queue, led)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        failures.append(e)
+                        progress.errors.append({"urls": batch, "error": str(e)})
+                    progress.current_batch += 1
+                    progress.processed_urls += len(batch)
+                    if on_progress:
+                        on_progress(progress)
+
+            async def follow(key: str, future: asyncio.Future) -> None:
+                future, taken_over = await self.in_flight.follow(key, future)
+                if taken_over:
+                    # The caller scraping it was cancelled, so this one scrapes it, batched with the other
+                    # profiles taken over at the same time once they are listed too
+                    led[key] = future
+                    taken_over_urls.append(misses[key])
+                    await asyncio.sleep(0)
+                    if taken_over_urls:
+                        retried = self.make_batches(taken_over_urls)
+                        taken_over_urls.clear()
+                        progress.total_batches += len(retried)
+                        await asyncio.gather(*(run_batch(batch) for batch in retried))
+                    return
+                try:
+                    profile = future.result()
+                except Exception as e:
+                    failures.append(e)
+                    progress.errors.append({"urls": [misses[key]], "error": str(e)})
+                else:
+                    if profile:
+                        await queue.put(dict(profile))
+                progress.processed_urls += 1
+                if on_progress:
+                    on_progress(progress)
+
+            async def run_all() -> None:
+                try:
+                    await asyncio.gather(
+                        *(run_batch(batch) for batch in batches),
+                        *(follow(key, future) for key, future in joined.items()),
+                    )
+                finally:
+                    await queue.put(_DONE)
+
+            runner = asyncio.create_task(run_all())
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                yield item
+            await runner
+        finally:
+            if runner is not None and not runner.done():
+                runner.cancel()
+                await asyncio.gather(runner, return_exceptions=True)
+            # Whatever this caller did not finish, also when its consumer stopped before the scraping
+            # started, is left to the callers that joined it
+            self.in_flight.release(led)
+
+        if failures and len(failures) == len(batches) + len(joined):
+            raise failures[0]
+
+    async def extract(
+        self,
+        urls: List[str],
+        on_progress: Optional[Callable[[ExtractionProgress], Any]] = None,
+        progress: Optional[ExtractionProgress] = None,
+    ) -> List[Dict[str, Any]]:
+        return [profile async for profile in self.stream(urls, on_progress=on_progress, progress=progress)]
@@ -1,30 +1,118 @@
+import asyncio
 import json
-import io
-import re
+import os
+import time
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Form, Header, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from typing import List, Dict, Any
-import pandas as pd
+from typing import TYPE_CHECKING, List, Dict, Any, Literal, Optional, Callable, Awaitable, Union
 from pydantic import BaseModel
 
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-
-from semantic_kernel.contents import ChatHistory
-
-from azure_ai_agent import main as agent
-
-app = FastAPI()
-
-# Dictionary to store chat histories for each session
-chat_histories = {}
-
-# Store the connection string globally (in production, use a proper session management)
-azure_connection_string = None
+from agent_registry import runtimes, profile_cache, analysis_cache, analysis_flights, linkedin_extractor, prompt_packer
+from analysis_cache import company_fingerprint
+from email_delivery import EmailDeliveryEngine
+from email_drafting import EmailDrafter
+from invitee_ingest import InviteeFileError, ingest_invitees
+from job_queue import Job, JobQueue
+from lead_index import LeadIndex
+from resilience import CircuitOpenError, error_status, find_error, retry_after, services
+from scoring_pipeline import ProfileScoringPipeline
+from session_store import SessionBusyError, SessionManager
+from state_store import create_state_store
+from tenants import DEFAULT_TENANT, ConnectionRegistry, Tenant, TenantAuthError, TenantQuotaError, connection_key
+from telemetry import configure_logging, log_sampled, logger, metrics, stage_seconds
+
+if TYPE_CHECKING:
+    from semantic_kernel.contents import ChatHistory
+
+
+async def warm_up() -> None:
+    """Build the default tenant's agent runtime up front so the first request does not pay for it."""
+    default_tenant = await connections.get(DEFAULT_TENANT)
+    if default_tenant:
+        try:
+            await runtimes.get(default_tenant.conn_str)
+        except Exception as e:
+            logger.warning("Could not warm up the agent runtime: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    # The runtime is built in the background so the worker serves requests while the SDKs load
+    warming = asyncio.create_task(warm_up())
+    yield
+    warming.cancel()
+    await asyncio.gather(warming, return_exceptions=True)
+    await jobs.close()
+    await email_engine.close()
+    await runtimes.close()
+    profile_cache.close()
+    analysis_cache.close()
+    lead_index.close()
+    state_store.close()
+
+app = FastAPI(lifespan=lifespan)
+
+# Chat histories for each session, with eviction and compaction
+state_store = create_state_store()
+sessions = SessionManager(state_store)
+
+email_engine = EmailDeliveryEngine(store=state_store)
+
+# Background analyses and email drafting, with their results kept in the state store
+jobs = JobQueue(state_store)
+
+# Profiles and analyses of every event, queried by /leads/ and used to skip profiles already qualified
+lead_index = LeadIndex()
+
+# Azure connection and request limits of every tenant, named by the X-Tenant-ID header and
+# authenticated by the X-Tenant-Token header
+connections = ConnectionRegistry(runtimes, store=state_store)
+
+# Cache, queue and pool counters and gauges served on /metrics
+CACHE_COUNTERS = ("hits", "memory_hits", "disk_hits", "misses", "expirations", "evictions")
+metrics.register_stats("profile_cache", "Scraped profile cache", profile_cache.stats, counters=CACHE_COUNTERS)
+metrics.register_stats(
+    "analysis_cache", "Profile analysis cache", analysis_cache.stats, counters=CACHE_COUNTERS + ("saved_tokens",)
+)
+metrics.register_stats("lead_index", "Index of analyzed leads", lead_index.stats, counters=("queries",))
+metrics.register_stats(
+    "single_flight",
+    "Scrapes and analyses shared by concurrent requests",
+    lambda: {"scrape": linkedin_extractor.in_flight.stats(), "analysis": analysis_flights.stats()},
+    label="flight",
+    counters=("led", "joined", "taken_over"),
+)
+metrics.register_stats("sessions", "Chat sessions", sessions.stats, counters=("evictions", "expirations", "compactions"))
+metrics.register_stats("job_queue", "Background jobs of this worker", jobs.stats)
+metrics.register_stats("email", "Email delivery", email_engine.stats)
+metrics.register_stats(
+    "prompt_packing",
+    "Scoring chunks and their token budget",
+    prompt_packer.stats,
+    counters=("batches", "profiles", "tokens", "seconds", "slow", "truncated", "failed"),
+)
+metrics.register_stats(
+    "runtime",
+    "Agent runtimes per connection",
+    runtimes.stats,
+    label="runtime",
+    counters=("invocations_cold_count", "invocations_warm_count"),
+)
+metrics.register_stats(
+    "outbound",
+    "Calls to outbound services",
+    services.stats,
+    label="service",
+    counters=(
+        "calls", "successes", "failures", "retries", "throttled", "short_circuited", "hedges", "hedge_wins",
+        "limiter_wait_seconds", "backoff_seconds", "breaker_opens",
+    ),
+)
+metrics.register_stats("tenant", "Requests per tenant", connections.stats, label="tenant", counters=("requests", "rejected"))
 
 # Add CORS middleware
 app.add_middleware(
@@ -35,9 +123,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def upstream_error_response(error: Exception) -> Optional[JSONResponse]:
+    """503 when a dependency's circuit is open, 429 when it is still throttling after the retries, and
+    409 when another request kept the session busy."""
+    busy = find_error(error, SessionBusyError)
+    if busy:
+        return JSONResponse(content={"error": str(busy)}, status_code=409)
+    circuit_open = find_error(error, CircuitOpenError)
+    if circuit_open:
+        return JSONResponse(
+            content={"error": str(circuit_open), "service": circuit_open.service},
+            status_code=503,
+            headers={"Retry-After": str(int(circuit_open.retry_after))},
+        )
+    if error_status(error) == 429:
+        headers = {}
+        delay = retry_after(error)
+        if delay is not None:
+            headers["Retry-After"] = str(int(delay) + 1)
+        return JSONResponse(
+            content={"error": "The AI service is busy, please try again shortly."},
+            status_code=429,
+            headers=headers,
+        )
+    return None
+
+async def authenticate(tenant_id: Optional[str], token: Optional[str]) -> Union[Tenant, JSONResponse]:
+    """The tenant of a request, once the request presented the tenant's token, or the error response."""
+    tenant = await connections.get(tenant_id or DEFAULT_TENANT)
+    if not tenant:
+        return JSONResponse(content={"error": "Azure connection not established. Please configure your connection first."}, status_code=400)
+    try:
+        tenant.authorize(token)
+    except TenantAuthError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=401)
+    return tenant
+
+async def admit(tenant_id: Optional[str], token: Optional[str]) -> Union[Tenant, JSONResponse]:
+    """The tenant of a request, once its token was checked and its quota let the request in, or the error response."""
+    tenant = await authenticate(tenant_id, token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    try:
+        tenant.admit()
+    except TenantQuotaError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=429, headers={"Retry-After": str(int(e.retry_after) + 1)})
+    return tenant
+
 class ProcessInviteesRequest(BaseModel):
     session_id: str
-    linkedin_urls: List[str]
+    # Empty to analyze the invitees uploaded for the session
+    linkedin_urls: List[str] = []
+    company_description: Optional[str] = None
+    # "direct" scores the scraped profiles in one call per chunk, "agents" goes through the agent chain;
+    # SCORING_MODE when not given
+    mode: Optional[Literal["agents", "direct"]] = None
 
 class ChatRequest(BaseModel):
     session_id: str
@@ -46,6 +186,7 @@ class ChatRequest(BaseModel):
 class SendEmailsRequest(BaseModel):
     email_body: str
     potential_clients: List[str]
+    subject: str = "You're Invited to Our Event!"
 
 class ConnectionTestRequest(BaseModel):
     connection_string: str
@@ -59,214 +200,592 @@ class CompanyAnalysisRequest(BaseModel):
 
 class EmailGenerationRequest(BaseModel):
     company_description: str
+    # Analysis results; clients with an "email" can be sent their draft
     potential_clients: List[Dict[str, Any]]
+    # Send every draft to its client as soon as it is written
+    send: bool = False
+    subject: str = "You're Invited to Our Event!"
 
 @app.post("/test_connection/")
 async def test_connection(request: ConnectionTestRequest):
-    """Endpoint to test Azure connection string."""
+    """Endpoint to test an Azure connection string without making it any tenant's connection."""
     try:
-        # Test the connection by attempting to create a client
-        from azure.identity import DefaultAzureCredential
-        from azure_ai_agent import create_kernel
-        
-        # Try to create a kernel with the provided connection string
-        credential = DefaultAzureCredential()
-        
-        # Temporarily set the connection string for testing
-        import os
-        original_conn_str = os.environ.get("PROJECT_CONNECTION_STRING")
-        os.environ["PROJECT_CONNECTION_STRING"] = request.connection_string
-        
-        try:
-            # Try to create a simple kernel to test the connection
-            kernel = create_kernel("test")
-            
-            # If we get here, the connection string is valid
-            global azure_connection_string
-            azure_connection_string = request.connection_string
-            
-            return {"status": "success", "message": "Connection successful"}
-        except Exception as test_error:
-            return JSONResponse(
-                content={"status": "error", "message": f"Connection failed: {str(test_error)}"}, 
-                status_code=400
-            )
-        finally:
-            # Restore original connection string
-            if original_conn_str:
-                os.environ["PROJECT_CONNECTION_STRING"] = original_conn_str
-            elif "PROJECT_CONNECTION_STRING" in os.environ:
-                del os.environ["PROJECT_CONNECTION_STRING"]
-                
+        await connections.validate(request.connection_string)
+        return {"status": "success", "message": "Connection successful"}
     except Exception as e:
-        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+        return JSONResponse(
+            content={"status": "error", "message": f"Connection failed: {str(e)}"},
+            status_code=400
+        )
 
 @app.post("/set_connection/")
-async def set_connection(request: SetConnectionRequest):
-    """Endpoint to set the Azure connection string for the session."""
+async def set_connection(
+    request: SetConnectionRequest,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """Endpoint to set the Azure connection string of the tenant named by the X-Tenant-ID header.
+
+    The first time, the response carries the tenant's token, which every later request of the tenant
+    sends in the X-Tenant-Token header; changing the connection again also requires it.
+    """
     try:
-        global azure_connection_string
-        azure_connection_string = request.connection_string
-        
-        # Set it in environment for the current session
-        import os
-        os.environ["PROJECT_CONNECTION_STRING"] = request.connection_string
-        
-        return {"status": "success", "message": "Connection string set successfully"}
+        _, token = await connections.set(x_tenant_id or DEFAULT_TENANT, request.connection_string, x_tenant_token)
+        return {"status": "success", "message": "Connection string set successfully", "tenant_token": token}
+    except TenantAuthError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=401)
     except Exception as e:
-        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+        return JSONResponse(content={"status": "error", "message": f"Connection failed: {str(e)}"}, status_code=400)
 
 @app.get("/connection_status/")
-async def get_connection_status():
-    """Check if a connection string is currently set."""
-    global azure_connection_string
-    is_connected = azure_connection_string is not None
+async def get_connection_status(x_tenant_id: Optional[str] = Header(None)):
+    """Check if the tenant has a connection string set."""
+    is_connected = await connections.get(x_tenant_id or DEFAULT_TENANT) is not None
     
     return {
         "connected": is_connected,
         "message": "Connection established" if is_connected else "No connection established"
     }
-async def upload_excel(file: UploadFile):
-    """Endpoint to upload the Excel file with invitees."""
+
+@app.get("/tenant_status/")
+async def get_tenant_status(x_tenant_id: Optional[str] = Header(None), x_tenant_token: Optional[str] = Header(None)):
+    """Report the connection fingerprint, running requests and quota rejections of the tenant."""
+    tenant = await authenticate(x_tenant_id, x_tenant_token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    return {tenant.id: tenant.stats()}
+
+@app.get("/runtime_status/")
+async def get_runtime_status(x_tenant_id: Optional[str] = Header(None), x_tenant_token: Optional[str] = Header(None)):
+    """Report build time and cold vs. warm invocation timings of the tenant's agent runtime."""
+    tenant = await authenticate(x_tenant_id, x_tenant_token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    key = connection_key(tenant.conn_str)
+    return {"runtimes": {name: stats for name, stats in runtimes.stats().items() if name == key}}
+
+@app.get("/cache_status/")
+async def get_cache_status():
+    """Report hit, miss and eviction counters of the profile and analysis caches, and the scrapes and
+    analyses concurrent requests shared instead of repeating them."""
+    return {
+        "profiles": await asyncio.to_thread(profile_cache.stats),
+        "analyses": await asyncio.to_thread(analysis_cache.stats),
+        "in_flight": {"scrape": linkedin_extractor.in_flight.stats(), "analysis": analysis_flights.stats()},
+    }
+
+@app.get("/leads/")
+async def get_leads(
+    industry: Optional[str] = None,
+    job_title: Optional[str] = None,
+    company: Optional[str] = None,
+    potential_match: Optional[bool] = None,
+    company_description: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """Search the leads the tenant analyzed across every event, most recent first.
+
+    ``industry``, ``job_title`` and ``company`` match exactly (ignoring case), ``q`` searches the
+    headline and skills, and ``company_description`` limits the leads to the ones analyzed for it.
+    """
+    tenant = await admit(x_tenant_id, x_tenant_token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    started = time.perf_counter()
+    leads = await asyncio.to_thread(
+        lead_index.query,
+        tenant.id,
+        company_key=company_fingerprint(company_description) if company_description else None,
+        potential_match=potential_match,
+        text=q,
+        limit=max(1, min(limit, 500)),
+        offset=max(0, offset),
+        industry=industry,
+        job_title=job_title,
+        company=company,
+    )
+    return {"leads": leads, "count": len(leads), "query_ms": round(1000 * (time.perf_counter() - started), 3)}
+
+@app.get("/leads/profile/")
+async def get_lead(url: str, x_tenant_id: Optional[str] = Header(None), x_tenant_token: Optional[str] = Header(None)):
+    """The scraped profile of a lead the tenant analyzed, with each of its analyses."""
+    tenant = await admit(x_tenant_id, x_tenant_token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    lead = await asyncio.to_thread(lead_index.get, tenant.id, url)
+    if lead is None:
+        return JSONResponse(content={"error": "Unknown lead."}, status_code=404)
+    return lead
+
+@app.get("/batch_status/")
+async def get_batch_status():
+    """Report the scoring token budget and the token counts and timings of recent chunks."""
+    return prompt_packer.stats()
+
+@app.get("/resilience_status/")
+async def get_resilience_status():
+    """Report calls, retries, throttling, hedging and circuit breaker state of the outbound services."""
+    return services.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Stage latency histograms, token counters and cache, queue and pool counters and gauges in the Prometheus text format."""
+    # Rendering reads the disk caches, so it runs off the event loop
+    return PlainTextResponse(await asyncio.to_thread(metrics.render), media_type="text/plain; version=0.0.4")
+
+@app.get("/session_status/")
+async def get_session_status():
+    """Report stored sessions, their size and eviction/compaction counters."""
+    return await asyncio.to_thread(sessions.stats)
+
+@app.get("/job_status/")
+async def get_job_status():
+    """Report queued, running and finished background jobs."""
+    return jobs.stats()
+
+@app.post("/upload_excel/")
+async def upload_excel(
+    file: UploadFile,
+    session_id: Optional[str] = Form(None),
+    analyze: bool = Form(False),
+    include_rows: bool = Form(True),
+    company_description: Optional[str] = Form(None),
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """Endpoint to upload the CSV or Excel file with invitees.
+
+    The rows are parsed in chunks from the spooled upload and stored with the session, so
+    /process_invitees/ can be called without sending the URLs again. With ``analyze`` the
+    analysis is queued right away and its job id is returned.
+    """
     try:
-        # Convert the uploaded file to a BytesIO object
-        contents = await file.read()
-        excel_data = io.BytesIO(contents)
-
-        # Read the Excel file
-        df = pd.read_excel(excel_data)
-        if not all(col in df.columns for col in ["name", "email", "linkedin_url"]):
-            return JSONResponse(content={"error": "The file must contain 'name', 'email', and 'linkedin_url' columns."}, status_code=400)
-
-        # Extract LinkedIn URLs and associated emails
-        global linkedin_data
-        linkedin_data = [
-            {"linkedinUrl": row["linkedin_url"], "email": row["email"]}
-            for _, row in df.iterrows()
-        ]
-        return {"message": "Excel file processed successfully.", "linkedin_data": linkedin_data}
+        linkedin_data, report = await asyncio.to_thread(ingest_invitees, file.file, file.filename)
+    except InviteeFileError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
-
-class ProcessInviteesRequest(BaseModel):
-    session_id: str
-    linkedin_urls: List[str]
+    stage_seconds.observe(report.parse_seconds, stage="ingest")
+    logger.info("Parsed %d rows from %s in %.3fs", report.rows, file.filename, report.parse_seconds)
+    response: Dict[str, Any] = {"message": "Excel file processed successfully.", "report": report.to_dict()}
+    if include_rows:
+        response["linkedin_data"] = linkedin_data
+    if session_id:
+        await sessions.save_invitees(session_id, linkedin_data, report.to_dict())
+
+    if analyze:
+        if not session_id:
+            return JSONResponse(content={"error": "A session_id is required to analyze the uploaded invitees."}, status_code=400)
+        request = ProcessInviteesRequest(
+            session_id=session_id,
+            linkedin_urls=[invitee["linkedinUrl"] for invitee in linkedin_data],
+            company_description=company_description,
+        )
+        submitted = await submit_process_invitees(request, x_tenant_id, x_tenant_token)
+        response["job"] = json.loads(submitted.body)
+        if submitted.status_code != 202:
+            return JSONResponse(content=response, status_code=submitted.status_code)
+    return response
+
+
+async def company_context(request: ProcessInviteesRequest) -> Optional[str]:
+    """The company to score the invitees for: the request's description, else the host agent's extraction.
+
+    The host agent's ``CompanyInfo`` is described by the same text on every run of a session, so the
+    analysis cache key derived from it stays stable. None when neither is known.
+    """
+    if request.company_description:
+        return request.company_description
+    agents = await runtimes.agents()
+    info = agents.CompanyInfo.from_history(await sessions.load(request.session_id))
+    return info.describe() if info else None
+
+async def resolve_analysis_request(request: ProcessInviteesRequest) -> Optional[JSONResponse]:
+    """Fill in the invitees uploaded for the session when a request sends no URLs, and the company the
+    session's host agent extracted when it sends no description; 400 when either is unknown."""
+    if not request.linkedin_urls:
+        uploaded = await sessions.load_invitees(request.session_id)
+        request.linkedin_urls = [invitee["linkedinUrl"] for invitee in uploaded["invitees"]] if uploaded else []
+    if not request.linkedin_urls:
+        return JSONResponse(content={"error": "No LinkedIn URLs given and no invitee file uploaded for this session."}, status_code=400)
+    request.company_description = await company_context(request)
+    if not request.company_description:
+        return JSONResponse(
+            content={"error": "No company description given and none was shared with the agent in this session."},
+            status_code=400,
+        )
+    return None
+
+async def analyze_invitees(
+    request: ProcessInviteesRequest,
+    conn_str: str,
+    tenant_id: str,
+    on_chunk: Optional[Callable[[Dict[str, Any], List[Dict[str, Any]]], Awaitable[None]]] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """Score the invitees of a request and record the potential clients in the session."""
+    async with runtimes.use(conn_str) as (runtime, _):
+        # Score the profiles in concurrent chunks instead of one message with every URL
+        pipeline = ProfileScoringPipeline(
+            runtime, extractor=linkedin_extractor, analysis_cache=analysis_cache, packer=prompt_packer, mode=request.mode,
+            lead_index=lead_index, tenant_id=tenant_id, in_flight=analysis_flights,
+        )
+        parsed_response = await pipeline.run(request.company_description, request.linkedin_urls, on_chunk=on_chunk, on_result=on_result)
+    logger.info("Scored %d profiles with status %s", len(parsed_response.get("results", [])), parsed_response["status"])
+    log_sampled("Parsed response", parsed_response)
+
+    retults = parsed_response.get("results", [])
+    potential_clients = [client for client in retults if client.get("potential_match", False)]
+    if parsed_response["status"] != "error":
+        async with sessions.session(request.session_id) as chat_history:
+            # Recorded as the assistant's: a user message would become part of the company context
+            chat_history.add_assistant_message(json.dumps({
+                "analyzed_urls": len(request.linkedin_urls),
+                "potential_clients": potential_clients,
+            }))
+
+    return {"status": parsed_response["status"], "potential_clients": potential_clients, "errors": parsed_response["errors"]}
 
 @app.post("/process_invitees/")
-async def process_invitees(request: ProcessInviteesRequest):
+async def process_invitees(
+    request: ProcessInviteesRequest,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
     """Endpoint to process LinkedIn profiles and determine potential clients."""
     try:
-        # Retrieve or create a new chat history for the session
-        if request.session_id not in chat_histories:
-            chat_histories[request.session_id] = ChatHistory()
+        tenant = await admit(x_tenant_id, x_tenant_token)
+        if isinstance(tenant, JSONResponse):
+            return tenant
 
-        chat_history: ChatHistory = chat_histories[request.session_id]
-        message = f"LinkedIn urls: {request.linkedin_urls}"
-        print(f"Processing LinkedIn URLs: {request.linkedin_urls}")
-        
-        # Check if connection string is available
-        global azure_connection_string
-        if not azure_connection_string:
-            return JSONResponse(content={"error": "Azure connection not established. Please configure your connection first."}, status_code=400)
-        
-        response = await agent(message, chat_history, azure_connection_string)
+        missing = await resolve_analysis_request(request)
+        if missing:
+            return missing
+        logger.info("Processing %d LinkedIn URLs", len(request.linkedin_urls))
 
-        chat_history.add_user_message(message)
-        chat_history.add_assistant_message(response)
-        print(f"Agent response: {response}")
-        # Parse the response to check if the description is provided
-        try:
-            # Extract JSON content using regex
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if not json_match:
-                return JSONResponse(content={"error": "Failed to extract the json response"}, status_code=400)
-
-            parsed_response = json.loads(json_match.group())
-            print(f"Parsed response: {parsed_response}")
-            retults = parsed_response.get("results", [])
-            potential_clients = [client for client in retults if client.get("potential_match", False)]
-        except json.JSONDecodeError:
-            return JSONResponse(content={"error": "Failed to parse the response."}, status_code=400)
-        
-        return {"potential_clients": potential_clients}
+        async with tenant.slot():
+            analysis = await analyze_invitees(request, tenant.conn_str, tenant.id)
+        if analysis["status"] == "error":
+            return JSONResponse(content={"error": "Failed to analyze the profiles.", "errors": analysis["errors"]}, status_code=502)
+
+        return {"potential_clients": analysis["potential_clients"], "errors": analysis["errors"]}
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        return upstream_error_response(e) or JSONResponse(content={"error": str(e)}, status_code=500)
 
 
-@app.post("/chat/")
-async def chat(request: ChatRequest):
-    """Endpoint to chat with the agent while maintaining memory."""
-    try:
-        # Retrieve or create a new chat history for the session
-        if request.session_id not in chat_histories:
-            chat_histories[request.session_id] = ChatHistory()
+def progress_frame(summary: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "progress",
+        "status": summary["status"],
+        "current_batch": summary["current_batch"],
+        "total_batches": summary["total_batches"],
+        "processed_urls": summary["processed_urls"],
+        "total_urls": summary["total_urls"],
+    }
 
-        chat_history: ChatHistory = chat_histories[request.session_id]
+@app.post("/process_invitees/stream/")
+async def process_invitees_stream(
+    request: ProcessInviteesRequest,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """Streaming variant of /process_invitees/ that emits NDJSON frames as profiles are scored.
+
+    Frames are ``{"type": "result", ...}`` as soon as a profile is scored, ``{"type": "progress", ...}``
+    after each chunk and every PROGRESS_INTERVAL_SECONDS, and a final ``complete`` or ``error`` frame.
+    """
+    tenant = await admit(x_tenant_id, x_tenant_token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+
+    missing = await resolve_analysis_request(request)
+    if missing:
+        return missing
+
+    conn_str = tenant.conn_str
+    progress_interval = float(os.getenv("PROGRESS_INTERVAL_SECONDS", "5"))
+
+    async def frames():
+        queue: asyncio.Queue = asyncio.Queue()
+        summary: Dict[str, Any] = {
+            "status": "processing",
+            "current_batch": 0,
+            "total_batches": len(ProfileScoringPipeline(None, extractor=linkedin_extractor, packer=prompt_packer).make_chunks(request.linkedin_urls)),
+            "processed_urls": 0,
+            "total_urls": len(request.linkedin_urls),
+        }
+
+        async def on_result(result: Dict[str, Any]) -> None:
+            await queue.put({"type": "result", **result})
+
+        async def on_chunk(running_summary: Dict[str, Any], results: List[Dict[str, Any]]) -> None:
+            summary.update(running_summary)
+            await queue.put(progress_frame(running_summary))
+
+        async def analyze() -> Dict[str, Any]:
+            async with tenant.slot():
+                return await analyze_invitees(request, conn_str, tenant.id, on_chunk=on_chunk, on_result=on_result)
+
+        task = asyncio.create_task(analyze())
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            yield json.dumps(progress_frame(summary)) + "\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=progress_interval)
+                except asyncio.TimeoutError:
+                    # Keep-alive progress frame while a slow chunk is still running
+                    yield json.dumps(progress_frame(summary)) + "\n"
+                    continue
+                if frame is None:
+                    break
+                yield json.dumps(frame) + "\n"
 
-        # Check if connection string is available
-        global azure_connection_string
-        if not azure_connection_string:
-            return JSONResponse(content={"error": "Azure connection not established. Please configure your connection first."}, status_code=400)
+            try:
+                analysis = task.result()
+            except Exception as e:
+                yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+                return
+
+            yield json.dumps({
+                "type": "complete" if analysis["status"] != "error" else "error",
+                "potential_clients": analysis["potential_clients"],
+                "errors": analysis["errors"],
+            }) + "\n"
+        finally:
+            # The client went away before the analysis finished
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
+@app.post("/jobs/process_invitees/")
+async def submit_process_invitees(
+    request: ProcessInviteesRequest,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """Queue a profile analysis in the background and return its job id."""
+    tenant = await admit(x_tenant_id, x_tenant_token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    missing = await resolve_analysis_request(request)
+    if missing:
+        return missing
+    conn_str = tenant.conn_str
+
+    async def run(job: Job) -> Dict[str, Any]:
+        async def on_chunk(summary: Dict[str, Any], results: List[Dict[str, Any]]) -> None:
+            job.set_progress({key: value for key, value in progress_frame(summary).items() if key != "type"})
+
+        async def on_result(result: Dict[str, Any]) -> None:
+            job.add_partial_result(result)
+
+        async with tenant.slot():
+            analysis = await analyze_invitees(request, conn_str, tenant.id, on_chunk=on_chunk, on_result=on_result)
+        if analysis["status"] == "error":
+            raise RuntimeError(f"Failed to analyze the profiles: {analysis['errors']}")
+        return analysis
+
+    job = await jobs.submit("process_invitees", connection_key(conn_str), run, tenant=tenant.id)
+    return JSONResponse(content={"job_id": job.id, "status": job.status}, status_code=202)
+
+@app.post("/jobs/generate_emails/")
+async def submit_generate_emails(
+    request: EmailGenerationRequest,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """Queue email drafting by the writer agent for the given potential clients."""
+    tenant = await admit(x_tenant_id, x_tenant_token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    conn_str = tenant.conn_str
+
+    async def run(job: Job) -> Dict[str, Any]:
+        drafts: List[Optional[Dict[str, Any]]] = [None] * len(request.potential_clients)
+        async with runtimes.use(conn_str) as (runtime, _), tenant.slot():
+            drafter = EmailDrafter(runtime)
+            async for draft in drafter.draft_all(request.company_description, request.potential_clients):
+                drafts[draft["index"]] = draft
+                job.add_partial_result(draft)
+                job.set_progress({"processed": drafter.drafted + drafter.failed, "total": len(drafts)})
+        return {"drafts": drafts, **drafter.stats()}
+
+    job = await jobs.submit("generate_emails", connection_key(conn_str), run, tenant=tenant.id)
+    return JSONResponse(content={"job_id": job.id, "status": job.status}, status_code=202)
+
+async def tenant_job(job_id: str, tenant_id: Optional[str], token: Optional[str]) -> Union[Job, JSONResponse]:
+    """A job of the request's tenant, or the error response; other tenants' jobs are unknown jobs."""
+    tenant = await authenticate(tenant_id, token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    job = await jobs.get(job_id)
+    if not job or job.tenant != tenant.id:
+        return JSONResponse(content={"error": "Unknown job."}, status_code=404)
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, x_tenant_id: Optional[str] = Header(None), x_tenant_token: Optional[str] = Header(None)):
+    """Status, progress, partial results and final result of a background job."""
+    job = await tenant_job(job_id, x_tenant_id, x_tenant_token)
+    if isinstance(job, JSONResponse):
+        return job
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(
+    job_id: str,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """NDJSON stream of a job snapshot followed by its progress, partial results and completion."""
+    job = await tenant_job(job_id, x_tenant_id, x_tenant_token)
+    if isinstance(job, JSONResponse):
+        return job
+
+    async def frames():
+        async for event in jobs.subscribe(job_id):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, x_tenant_id: Optional[str] = Header(None), x_tenant_token: Optional[str] = Header(None)):
+    """Cancel a queued or running job."""
+    job = await tenant_job(job_id, x_tenant_id, x_tenant_token)
+    if isinstance(job, JSONResponse):
+        return job
+    if not await jobs.cancel(job_id):
+        return JSONResponse(content={"error": "The job is not running."}, status_code=404)
+    return {"job_id": job_id, "status": "cancelled"}
 
-        response = await agent(request.message, chat_history, azure_connection_string)
 
-        chat_history.add_user_message(request.message)
-        chat_history.add_assistant_message(response)
+@app.post("/chat/")
+async def chat(
+    request: ChatRequest,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """Endpoint to chat with the agent while maintaining memory."""
+    try:
+        tenant = await admit(x_tenant_id, x_tenant_token)
+        if isinstance(tenant, JSONResponse):
+            return tenant
+
+        # The agent records the user message; only the reply is added here
+        async with tenant.slot(), sessions.session(request.session_id) as chat_history:
+            agents = await runtimes.agents()
+            response = await agents.main(request.message, chat_history, tenant.conn_str)
+            chat_history.add_assistant_message(response)
         
         return {"response": response}
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
-
-
-@app.post("/send_emails/")
-async def send_emails(request: SendEmailsRequest):
-    """Endpoint to send personalized emails to potential clients."""
+        return upstream_error_response(e) or JSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.post("/generate_emails/")
+async def generate_emails(
+    request: EmailGenerationRequest,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """Draft a personalized email per potential client, streamed as NDJSON frames as each draft finishes.
+
+    Frames: optionally {"type": "delivery", "job_id"} first when the drafts are sent, then one
+    {"type": "draft", "index", "url", "to", "subject", "body"} per client (with "error" instead of
+    the email when its draft failed), and {"type": "complete", "drafted", "failed", "seconds",
+    "drafts_per_second"} at the end. With "send", each draft is handed to email delivery as soon as
+    it is written; its report is served by /send_emails/{job_id}.
+    """
+    tenant = await admit(x_tenant_id, x_tenant_token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    conn_str = tenant.conn_str
     try:
-        # Email server configuration
-        smtp_server = "smtp.gmail.com"
-        smtp_port = 587
-        sender_email = "simonpariscam@gmail.com"
-        sender_password = "mrqt jajo flix jcej"
-
-        # Connect to the email server
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-
-        # Send emails to potential clients
-        for client in request.potential_clients:
-            recipient_email = client
-            if not recipient_email:
-                continue
-            # Ask the agent for the email content
-            try:
-
-                # Create the email content
-                message = MIMEMultipart("alternative")
-                message["Subject"] = "You're Invited to Our Event!"
-                message["From"] = sender_email
-                message["To"] = recipient_email
-
-                message.attach(MIMEText(request.email_body, "plain"))
+        # Builds the runtime up front, so a connection that fails is reported as an error response
+        await runtimes.get(conn_str)
+        delivery = None
+        if request.send:
+            recipients = [client["email"] for client in request.potential_clients if client.get("email")]
+            delivery = email_engine.submit(request.subject, "", recipients, drafted=True, tenant=tenant.id)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except Exception as e:
+        return upstream_error_response(e) or JSONResponse(content={"error": str(e)}, status_code=500)
 
-                # Send the email
-                server.sendmail(sender_email, recipient_email, message.as_string())
-            except Exception as e:
-                return JSONResponse(content={"error": str(e)}, status_code=500)
-            
+    async def frames():
+        try:
+            if delivery:
+                yield json.dumps({"type": "delivery", "job_id": delivery.id}) + "\n"
+            async with runtimes.use(conn_str) as (runtime, _), tenant.slot():
+                drafter = EmailDrafter(runtime)
+                async for draft in drafter.draft_all(request.company_description, request.potential_clients):
+                    if delivery and draft.get("to"):
+                        if "error" in draft:
+                            email_engine.fail_draft(delivery, draft["error"], draft["to"])
+                        else:
+                            email_engine.provide_draft(delivery, draft["to"], draft.get("subject"), draft.get("body"))
+                    yield json.dumps({"type": "draft", **draft}) + "\n"
+            yield json.dumps({"type": "complete", **drafter.stats()}) + "\n"
+        finally:
+            # Recipients left without a draft, e.g. when the client went away, are not sent anything
+            if delivery:
+                email_engine.fail_draft(delivery, "No email was drafted.")
 
-        # Close the server connection
-        server.quit()
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
 
-        return {"message": "Emails sent successfully."}
+@app.post("/send_emails/")
+async def send_emails(
+    request: SendEmailsRequest,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """Endpoint to send emails to potential clients in the background.
+
+    Returns a job id right away; the per-recipient report is served by /send_emails/{job_id}.
+    """
+    tenant = await admit(x_tenant_id, x_tenant_token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    try:
+        job = email_engine.submit(request.subject, request.email_body, request.potential_clients, tenant=tenant.id)
+        return JSONResponse(
+            content={"message": "Email delivery started.", **job.to_dict()},
+            status_code=202,
+        )
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+@app.get("/send_emails/{job_id}")
+async def get_email_delivery(
+    job_id: str,
+    x_tenant_id: Optional[str] = Header(None),
+    x_tenant_token: Optional[str] = Header(None),
+):
+    """Per-recipient status report of an email delivery job of the tenant."""
+    tenant = await authenticate(x_tenant_id, x_tenant_token)
+    if isinstance(tenant, JSONResponse):
+        return tenant
+    report = await email_engine.report(job_id)
+    if not report or report.get("tenant") != tenant.id:
+        return JSONResponse(content={"error": "Unknown email delivery job."}, status_code=404)
+    return report
+
 @app.get("/")
 def read_root():
     return {"message": "LinkedIn Profile Analysis API"}
 
 if __name__ == "__main__":
     import uvicorn
+
+    configure_logging()
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
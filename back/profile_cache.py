@@ -0,0 +1,44 @@
+import os
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from tiered_cache import TieredCache
+
+
+def normalize_profile_url(url: str) -> str:
+    """Canonical form of a LinkedIn profile URL: https, lower case, no query string, fragment or trailing slash."""
+    url = (url or "").strip().lower()
+    if "://" not in url:
+        url = f"https://{url}"
+    parts = urlsplit(url)
+    path = parts.path.rstrip("/")
+    return urlunsplit(("https", parts.netloc, path, "", ""))
+
+
+class ProfileCache(TieredCache):
+    """Scraped profiles keyed by normalized URL, in an in-memory LRU backed by SQLite."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        max_memory_entries: Optional[int] = None,
+        max_disk_entries: Optional[int] = None,
+    ):
+        super().__init__(
+            path=path or os.getenv("PROFILE_CACHE_PATH", "profile_cache.db"),
+            table="profiles",
+            ttl_seconds=ttl_seconds or float(os.getenv("PROFILE_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            max_memory_entries=max_memory_entries or int(os.getenv("PROFILE_CACHE_MEMORY_ENTRIES", "2000")),
+            max_disk_entries=max_disk_entries or int(os.getenv("PROFILE_CACHE_DISK_ENTRIES", "100000")),
+        )
+
+    def get_many(self, urls: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the cached profiles for the given URLs, keyed by normalized URL. Missing keys are misses."""
+        return super().get_many(normalize_profile_url(url) for url in urls)
+
+    def put_many(self, profiles: Iterable[Dict[str, Any]]) -> None:
+        super().put_many({
+            normalize_profile_url(profile["linkedinUrl"]): profile
+            for profile in profiles if profile.get("linkedinUrl")
+        })
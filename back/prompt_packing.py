@@ -0,0 +1,144 @@
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from json_stream import TruncatedJSONError
+
+# Keys of nested profile objects that carry nothing for scoring (links, images, ids)
+DROPPED_KEY_SUFFIXES = ("url", "urn", "id", "logo", "image", "picture")
+
+# Error messages of the model service that mean the prompt or the output did not fit
+TRUNCATION_MARKERS = ("context_length", "maximum context length", "too many tokens", "max_tokens", "truncat")
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def compact_value(value: Any, max_items: int, max_chars: int, nested: bool = False) -> Any:
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars] + "..."
+    if isinstance(value, list):
+        items = [compact_value(item, max_items, max_chars, nested=True) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"... {len(value) - max_items} more")
+        return items
+    if isinstance(value, dict):
+        return {
+            key: compact_value(item, max_items, max_chars, nested=True)
+            for key, item in value.items()
+            if item not in (None, "", [], {}) and not (nested and key.lower().endswith(DROPPED_KEY_SUFFIXES))
+        }
+    return value
+
+
+def compact_profile(profile: Dict[str, Any], max_items: Optional[int] = None, max_chars: Optional[int] = None) -> Dict[str, Any]:
+    """The profile as the agents see it: empty fields dropped, long texts cut and long arrays trimmed."""
+    max_items = max_items or int(os.getenv("PROMPT_MAX_LIST_ITEMS", "5"))
+    max_chars = max_chars or int(os.getenv("PROMPT_MAX_TEXT_CHARS", "300"))
+    return compact_value(profile, max_items, max_chars)
+
+
+def profile_tokens(profile: Dict[str, Any]) -> int:
+    return estimate_tokens(json.dumps(compact_profile(profile)))
+
+
+def is_truncation_error(error: BaseException) -> bool:
+    """Whether the prompt or the answer did not fit the model's token limits.
+
+    Other malformed answers (prose, a schema violation, a document without results) are not: they
+    are retried as they are instead of shrinking the budget.
+    """
+    if isinstance(error, TruncatedJSONError):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in TRUNCATION_MARKERS)
+
+
+class PromptPacker:
+    """Packs profiles into batches that fit a prompt token budget, and adapts the budget.
+
+    The budget grows by ``step`` after every batch that finishes within ``target_seconds`` and is
+    halved after a slow or truncated batch (additive increase, multiplicative decrease), staying
+    between ``min_budget`` and ``max_budget``. Other failures leave it alone. One packer is shared
+    by every analysis, so what one run learns about the model applies to the next.
+    """
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        min_budget: Optional[int] = None,
+        max_budget: Optional[int] = None,
+        step: Optional[int] = None,
+        target_seconds: Optional[float] = None,
+        default_profile_tokens: Optional[int] = None,
+        history: int = 100,
+    ):
+        self.min_budget = min_budget or int(os.getenv("PROMPT_MIN_TOKEN_BUDGET", "1000"))
+        self.max_budget = max_budget or int(os.getenv("PROMPT_MAX_TOKEN_BUDGET", "16000"))
+        self.token_budget = token_budget or int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+        self.step = step or int(os.getenv("PROMPT_BUDGET_STEP", "500"))
+        self.target_seconds = target_seconds or float(os.getenv("PROMPT_TARGET_BATCH_SECONDS", "60"))
+        # Used for profiles that were not scraped ahead of the analysis
+        self.default_profile_tokens = default_profile_tokens or int(os.getenv("PROMPT_DEFAULT_PROFILE_TOKENS", "600"))
+        self.batches: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self.totals = {"batches": 0, "profiles": 0, "tokens": 0, "seconds": 0.0, "slow": 0, "truncated": 0, "failed": 0}
+
+    def take(self, pending: Deque[Tuple[str, int]], max_items: int, reserved: int = 0) -> List[Tuple[str, int]]:
+        """Pop the next batch of ``(url, tokens)`` from ``pending``; a batch always has at least one profile."""
+        budget = self.token_budget - reserved
+        batch: List[Tuple[str, int]] = []
+        used = 0
+        while pending and len(batch) < max_items:
+            tokens = pending[0][1]
+            if batch and used + tokens > budget:
+                break
+            batch.append(pending.popleft())
+            used += tokens
+        return batch
+
+    def pack(self, items: Sequence[Tuple[str, int]], max_items: int, reserved: int = 0) -> List[List[str]]:
+        """Split ``(url, tokens)`` pairs into batches with the current budget."""
+        pending = deque(items)
+        batches = []
+        while pending:
+            batches.append([url for url, _ in self.take(pending, max_items, reserved)])
+        return batches
+
+    def record(self, profiles: int, tokens: int, seconds: float, outcome: str = "ok") -> None:
+        """Record a finished batch (``outcome`` is ok, truncated or failed) and adapt the budget."""
+        slow = seconds > self.target_seconds
+        if outcome == "truncated" or slow:
+            self.token_budget = max(self.min_budget, self.token_budget // 2)
+        elif outcome == "ok":
+            self.token_budget = min(self.max_budget, self.token_budget + self.step)
+
+        self.totals["batches"] += 1
+        self.totals["profiles"] += profiles
+        self.totals["tokens"] += tokens
+        self.totals["seconds"] += seconds
+        self.totals["slow"] += int(slow)
+        if outcome != "ok":
+            self.totals[outcome] += 1
+        self.batches.append({
+            "finished_at": time.time(),
+            "profiles": profiles,
+            "tokens": tokens,
+            "seconds": round(seconds, 3),
+            "outcome": outcome,
+            "budget_after": self.token_budget,
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        batches = self.totals["batches"]
+        return {
+            "token_budget": self.token_budget,
+            **self.totals,
+            "seconds": round(self.totals["seconds"], 3),
+            "avg_tokens_per_batch": self.totals["tokens"] / batches if batches else None,
+            "avg_seconds_per_batch": self.totals["seconds"] / batches if batches else None,
+            "recent_batches": list(self.batches),
+        }
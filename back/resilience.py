@@ -0,0 +1,389 @@
+import asyncio
+import email.utils
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from prompt_packing import estimate_tokens
+
+T = TypeVar("T")
+
+# HTTP statuses worth retrying; 429 is throttling, the others mean the service is struggling
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """Token bucket that lets ``rate`` operations per second through, with bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Wait until ``amount`` tokens are available and return how long that took."""
+        if self.rate <= 0:
+            return 0.0
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """Take ``amount`` tokens if they are available and return 0, or else the seconds until they are."""
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class CircuitOpenError(RuntimeError):
+    """A dependency failed too often and calls to it fail fast until ``retry_after`` seconds pass."""
+
+    def __init__(self, service: str, retry_after: float):
+        super().__init__(f"{service} is unavailable, retry in {retry_after:.0f}s.")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class RetryableResponse(Exception):
+    """An HTTP response with a retryable status, raised so the response can be retried."""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+        self.status_code = response.status_code
+
+    async def aclose(self) -> None:
+        await self.response.aclose()
+
+
+def _causes(error: BaseException):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def find_error(error: BaseException, kind: type) -> Optional[BaseException]:
+    """The first error of type ``kind`` in the chain of an error, as SDKs wrap what the transport raised."""
+    for cause in _causes(error):
+        if isinstance(cause, kind):
+            return cause
+    return None
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    """HTTP status of an error or of the error it wraps (SDK exceptions keep the response)."""
+    for cause in _causes(error):
+        status = getattr(cause, "status_code", None) or getattr(getattr(cause, "response", None), "status_code", None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the service asked us to wait, from ``Retry-After`` and its millisecond variants."""
+    for cause in _causes(error):
+        headers = getattr(getattr(cause, "response", None), "headers", None)
+        if not headers:
+            continue
+        for name, scale in (("retry-after-ms", 0.001), ("x-ms-retry-after-ms", 0.001), ("retry-after", 1.0)):
+            value = headers.get(name)
+            if not value:
+                continue
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                pass
+            try:
+                date = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError, IndexError):
+                # Neither seconds nor an HTTP date; the caller's backoff applies
+                return None
+            return max(0.0, date.timestamp() - time.time())
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    status = error_status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return any(
+        getattr(cause, "retryable", False)
+        or isinstance(cause, (ConnectionError, TimeoutError, asyncio.TimeoutError, httpx.TransportError))
+        for cause in _causes(error)
+    )
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and lets one trial call through after ``reset_seconds``.
+
+    Every answer from the service, throttling and client errors included, counts as a success.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._trial = False
+
+    def check(self, service: str) -> None:
+        if self.state == "closed":
+            return
+        remaining = self.opened_at + self.reset_seconds - time.monotonic()
+        if remaining > 0 or self._trial:
+            raise CircuitOpenError(service, max(remaining, 1.0))
+        self.state = "half_open"
+        self._trial = True
+
+    def release_trial(self) -> None:
+        """Let another trial call through when the one let through ended without an answer (it was cancelled)."""
+        self._trial = False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self._trial = False
+        self.failures += 1
+        if self.state == "half_open" or (self.failure_threshold and self.failures >= self.failure_threshold):
+            if self.state != "open":
+                self.opens += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class ResilientService:
+    """Rate limits, retries, circuit breaking and hedging for the calls to one outbound service.
+
+    Limits and policies are read from ``<NAME>_*`` environment variables: REQUESTS_PER_MINUTE and
+    TOKENS_PER_MINUTE (0 = unlimited), MAX_RETRIES, BREAKER_FAILURES, BREAKER_RESET_SECONDS and
+    HEDGE_AFTER_SECONDS (0 = no hedging; a hedged call starts a second attempt when the first is
+    slower than that and keeps whichever answers first, so only use it for idempotent calls).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        breaker_failures: Optional[int] = None,
+        breaker_reset_seconds: Optional[float] = None,
+        hedge_after_seconds: Optional[float] = None,
+    ):
+        prefix = name.upper()
+
+        def setting(value, key, default):
+            return value if value is not None else float(os.getenv(f"{prefix}_{key}", default))
+
+        self.name = name
+        rpm = setting(requests_per_minute, "REQUESTS_PER_MINUTE", "0")
+        tpm = setting(tokens_per_minute, "TOKENS_PER_MINUTE", "0")
+        # Buckets hold ten seconds' worth, the window Azure OpenAI enforces its rate limits over
+        self.requests = RateLimiter(rpm / 60, burst=max(rpm / 6, 1.0))
+        self.tokens = RateLimiter(tpm / 60, burst=max(tpm / 6, 1.0))
+        self.max_retries = int(setting(max_retries, "MAX_RETRIES", "4"))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(
+            int(setting(breaker_failures, "BREAKER_FAILURES", "5")),
+            setting(breaker_reset_seconds, "BREAKER_RESET_SECONDS", "30"),
+        )
+        self.hedge_after_seconds = setting(hedge_after_seconds, "HEDGE_AFTER_SECONDS", "0")
+        self.metrics: Dict[str, float] = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "throttled": 0,
+            "short_circuited": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "limiter_wait_seconds": 0.0,
+            "backoff_seconds": 0.0,
+        }
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter keeps retrying clients from hitting the service in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _hedged(self, operation: Callable[[], Awaitable[T]], discard: Optional[Callable[[T], Awaitable[None]]]) -> T:
+        if not self.hedge_after_seconds:
+            return await operation()
+        first = asyncio.ensure_future(operation())
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after_seconds)
+        if done:
+            return first.result()
+
+        self.metrics["hedges"] += 1
+        second = asyncio.ensure_future(operation())
+        attempts = {first, second}
+        errors = []
+        try:
+            while attempts:
+                done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        if attempt is second:
+                            self.metrics["hedge_wins"] += 1
+                        return attempt.result()
+                    errors.append(attempt.exception())
+            raise errors.pop()
+        finally:
+            for error in errors:
+                if hasattr(error, "aclose"):
+                    await error.aclose()
+            for attempt in attempts:
+                attempt.cancel()
+            for attempt in attempts:
+                try:
+                    result = await attempt
+                except BaseException:
+                    continue
+                # The loser finished before it was cancelled; release what it holds
+                if discard:
+                    await discard(result)
+
+    async def call(
+        self,
+        operation: Callable[[], Awaitable[T]],
+        tokens: float = 0,
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> T:
+        """Run ``operation`` under the service's rate limits, retrying retryable errors with backoff.
+
+        Waits honor ``Retry-After`` when the error carries it. Errors with an ``aclose()`` coroutine
+        are closed before a retry, and ``discard`` releases the result of a losing hedged attempt.
+        """
+        self.metrics["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.breaker.check(self.name)
+            except CircuitOpenError:
+                self.metrics["short_circuited"] += 1
+                raise
+            try:
+                waited = await self.requests.acquire()
+                if tokens:
+                    waited += await self.tokens.acquire(tokens)
+                self.metrics["limiter_wait_seconds"] += waited
+                result = await self._hedged(operation, discard)
+            except asyncio.CancelledError:
+                # A cancelled trial call says nothing about the service
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                status = error_status(e)
+                retryable = is_retryable(e)
+                if status == 429:
+                    self.metrics["throttled"] += 1
+                if retryable and status != 429:
+                    # Only signs the service is down count towards opening the breaker
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if not retryable or attempt == self.max_retries:
+                    self.metrics["failures"] += 1
+                    raise
+                delay = retry_after(e)
+                delay = self.backoff(attempt) if delay is None else min(delay, self.max_delay)
+                if hasattr(e, "aclose"):
+                    await e.aclose()
+                self.metrics["retries"] += 1
+                self.metrics["backoff_seconds"] += delay
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.metrics["successes"] += 1
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **{key: round(value, 3) if isinstance(value, float) else value for key, value in self.metrics.items()},
+            "breaker": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+        }
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """httpx transport that sends every request of a client through a ResilientService.
+
+    Throttled and failed responses are retried; once retries are exhausted the last response is
+    returned as is, so the SDK on top raises its usual error for it.
+    """
+
+    def __init__(self, service: ResilientService, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.service = service
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # Read the body once so every attempt can send it again
+        body = await request.aread()
+
+        async def send() -> httpx.Response:
+            response = await self.transport.handle_async_request(request)
+            if response.status_code in RETRY_STATUSES:
+                raise RetryableResponse(response)
+            return response
+
+        async def discard(response: httpx.Response) -> None:
+            await response.aclose()
+
+        try:
+            tokens = estimate_tokens(body.decode("utf-8", "ignore"))
+            return await self.service.call(send, tokens=tokens, discard=discard)
+        except RetryableResponse as e:
+            return e.response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class ServiceRegistry:
+    """One ResilientService per outbound dependency, shared by every caller in the process."""
+
+    def __init__(self):
+        self._services: Dict[str, ResilientService] = {}
+
+    def get(self, name: str) -> ResilientService:
+        service = self._services.get(name)
+        if service is None:
+            service = self._services[name] = ResilientService(name)
+        return service
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: service.stats() for name, service in self._services.items()}
+
+
+services = ServiceRegistry()
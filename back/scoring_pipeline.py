@@ -0,0 +1,407 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from analysis_cache import AnalysisCache, company_fingerprint, profile_fingerprint
+from json_stream import IncrementalJSONParser, TruncatedJSONError
+from lead_index import LeadIndex
+from linkedin_extraction import LinkedInExtractor
+from profile_cache import normalize_profile_url
+from prompt_packing import PromptPacker, compact_profile, estimate_tokens, is_truncation_error, profile_tokens
+from resilience import CircuitOpenError, find_error
+from single_flight import Futures, SingleFlight
+from tenants import DEFAULT_TENANT
+from telemetry import logger, record_agent_stream, stage_seconds
+
+ResultCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# "agents" lets the coordinator agent scrape through the linkedin agent; "direct" scrapes here and
+# sends the profiles to the scoring agent, one LLM call per chunk
+SCORING_MODES = ("agents", "direct")
+
+
+class ProfileScoringPipeline:
+    """Scores LinkedIn profiles in chunks through the coordinator agent and merges the partial results.
+
+    Chunks are packed by the ``packer`` to a prompt token budget (and at most ``chunk_size`` profiles),
+    using the token estimate of each profile when the ``extractor`` scraped it ahead of time. Workers
+    take the next chunk only when they are free, so budget changes apply to the rest of the run.
+
+    Chunks run concurrently on a bounded pool and each chunk is retried on its own, so a failing
+    chunk never makes the chunks that already finished run again. Results are parsed while the
+    coordinator streams, and a retry only asks for the profiles of the chunk that were not scored yet.
+
+    With an ``analysis_cache`` (and the ``extractor`` to fingerprint profiles), profiles already
+    analyzed for the same company are answered from the cache and only the rest are scored.
+
+    In the ``direct`` mode (which needs the ``extractor``) the scraped profiles go straight to the
+    runtime's scoring agent instead of through the coordinator and linkedin agents; profiles that
+    could not be scraped are reported as errors.
+
+    URLs listed twice are scored once. With a ``lead_index``, the scraped profiles and the results
+    are recorded for the tenant, and profiles the tenant had analyzed for the same company are
+    answered from the index before anything is scraped. With an ``in_flight`` shared by the
+    pipelines, a profile another pipeline is already scoring for the same company is not scored
+    again; its result is taken from that pipeline.
+    """
+
+    def __init__(
+        self,
+        runtime: Any,
+        chunk_size: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        extractor: Optional[LinkedInExtractor] = None,
+        analysis_cache: Optional[AnalysisCache] = None,
+        packer: Optional[PromptPacker] = None,
+        mode: Optional[str] = None,
+        lead_index: Optional[LeadIndex] = None,
+        tenant_id: str = DEFAULT_TENANT,
+        in_flight: Optional[SingleFlight] = None,
+    ):
+        # The agent chain stays the default; callers and deployments opt into the direct mode
+        self.mode = mode or os.getenv("SCORING_MODE", "agents")
+        if self.mode not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode {self.mode!r}, expected one of {', '.join(SCORING_MODES)}.")
+        if self.mode == "direct" and extractor is None:
+            raise ValueError("The direct scoring mode needs an extractor to scrape the profiles.")
+        self.runtime = runtime
+        self.profiles: Dict[str, Dict[str, Any]] = {}
+        self.extractor = extractor
+        self.analysis_cache = analysis_cache
+        self.lead_index = lead_index
+        self.tenant_id = tenant_id
+        self.in_flight = in_flight
+        self.packer = packer or PromptPacker()
+        self.chunk_size = chunk_size or int(os.getenv("SCORING_CHUNK_SIZE", "10"))
+        self.max_workers = max_workers or int(os.getenv("SCORING_MAX_WORKERS", "4"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("SCORING_MAX_RETRIES", "2"))
+
+    def make_chunks(self, urls: List[str]) -> List[List[str]]:
+        """Chunks the URLs would be split into with the current budget, before any profile is scraped."""
+        return self.packer.pack([(url, self.packer.default_profile_tokens) for url in urls], self.chunk_size)
+
+    async def score_chunk(
+        self,
+        company_description: str,
+        urls: List[str],
+        on_result: Optional[ResultCallback] = None,
+    ) -> List[Dict[str, Any]]:
+        from semantic_kernel.contents import ChatHistory
+
+        history = ChatHistory()
+        if self.mode == "direct":
+            agent = self.runtime.scoring_agent
+            history.add_user_message(json.dumps({
+                "action": "score_profiles",
+                "company_description": company_description,
+                "profiles": [self.profiles[normalize_profile_url(url)] for url in urls],
+            }))
+        else:
+            agent = self.runtime.coordinator_agent
+            history.add_user_message(json.dumps({
+                "action": "analyze_profiles",
+                "company_description": company_description,
+                "linkedin_urls": urls,
+            }))
+
+        parser = IncrementalJSONParser()
+        stream = agent.invoke_stream(messages=history)
+        parse_seconds = 0.0
+        finish_reason = None
+        async for content in record_agent_stream(agent.name, stream, history.messages[0].content):
+            finish_reason = getattr(content.content, "finish_reason", None) or finish_reason
+            started = time.perf_counter()
+            results = parser.feed(content.content.content)
+            parse_seconds += time.perf_counter() - started
+            for result in results:
+                if on_result:
+                    await on_result(result)
+        stage_seconds.observe(parse_seconds, stage="parse")
+
+        # The model stopping at its token limit is a truncation, whatever the output looks like
+        truncated = str(finish_reason or "").lower().endswith("length")
+        try:
+            results = parser.document().get("results")
+        except TruncatedJSONError:
+            raise
+        except ValueError as e:
+            if truncated:
+                raise TruncatedJSONError(f"The response stopped at the token limit: {e}") from e
+            raise
+        if not isinstance(results, list):
+            if truncated:
+                raise TruncatedJSONError("The response stopped at the token limit before its results")
+            raise ValueError("The coordinator response has no results")
+        return results
+
+    async def _score_with_retries(
+        self,
+        company_description: str,
+        urls: List[str],
+        on_result: Optional[ResultCallback] = None,
+        tokens: Optional[Dict[str, int]] = None,
+        requeue: Optional[Callable[[List[str]], None]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Score a chunk, retrying the profiles not scored yet.
+
+        After a truncated response the unscored profiles go back to ``requeue`` instead, when they
+        no longer fit the reduced token budget, so they are packed again into smaller chunks.
+        """
+        tokens = tokens or {}
+        requested = {normalize_profile_url(url): url for url in urls}
+        # Results already streamed out survive a failed attempt and are not scored again
+        scored: Dict[str, Dict[str, Any]] = {}
+
+        async def collect(result: Dict[str, Any]) -> None:
+            # Results are cached and indexed under the URL that was asked for, not the one the
+            # model echoed back; a result for a profile not in the chunk is dropped
+            key = normalize_profile_url(str(result.get("url", "")))
+            if key not in requested:
+                logger.warning("Dropping a result for %s, which is not in the chunk", result.get("url"))
+                return
+            if key in scored:
+                return
+            result = {**result, "url": requested[key]}
+            scored[key] = result
+            if on_result:
+                await on_result(result)
+
+        pending = urls
+        for attempt in range(self.max_retries + 1):
+            prompt_tokens = estimate_tokens(company_description) + sum(
+                tokens.get(normalize_profile_url(url), self.packer.default_profile_tokens) for url in pending
+            )
+            started = time.perf_counter()
+            try:
+                for result in await self.score_chunk(company_description, pending, on_result=collect):
+                    await collect(result)
+                self.packer.record(len(pending), prompt_tokens, time.perf_counter() - started)
+                return list(scored.values())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                truncated = is_truncation_error(e)
+                self.packer.record(len(pending), prompt_tokens, time.perf_counter() - started, "truncated" if truncated else "failed")
+                unscored = [url for url in urls if normalize_profile_url(url) not in scored]
+                if truncated and requeue and len(unscored) > 1 and prompt_tokens > self.packer.token_budget:
+                    logger.info("Packing %d profiles of a truncated chunk again with a budget of %d tokens", len(unscored), self.packer.token_budget)
+                    requeue(unscored)
+                    return list(scored.values())
+                # Retrying the chunk cannot help while a dependency's circuit is open
+                if attempt == self.max_retries or find_error(e, CircuitOpenError):
+                    raise
+                pending = unscored or urls
+                logger.warning("Retrying %d of %d profiles of a chunk after error: %s", len(pending), len(urls), e)
+
+    async def run(
+        self,
+        company_description: str,
+        urls: List[str],
+        on_chunk: Optional[Callable[[Dict[str, Any], List[Dict[str, Any]]], Awaitable[None]]] = None,
+        on_result: Optional[ResultCallback] = None,
+    ) -> Dict[str, Any]:
+        """Score every URL and return the merged response in the coordinator schema.
+
+        ``on_result`` is called with every profile result as soon as the coordinator has written it,
+        and ``on_chunk`` with the running summary and the chunk's results each time a chunk finishes.
+        """
+        company_key = company_fingerprint(company_description)
+        unique: Dict[str, str] = {}
+        for url in urls:
+            unique.setdefault(normalize_profile_url(url), url)
+        urls = list(unique.values())
+
+        indexed: Dict[str, Dict[str, Any]] = {}
+        if self.lead_index is not None:
+            try:
+                indexed = await asyncio.to_thread(self.lead_index.known_results, self.tenant_id, company_key, urls)
+            except Exception as e:
+                logger.warning("Scoring every profile, the lead index lookup failed: %s", e)
+        cached_results: List[Dict[str, Any]] = [
+            {"url": url, **indexed[key], "cached": True} for key, url in unique.items() if key in indexed
+        ]
+        new_urls = [url for key, url in unique.items() if key not in indexed]
+
+        tokens: Dict[str, int] = {}
+        fingerprints: Dict[str, str] = {}
+        if self.extractor is not None and new_urls:
+            try:
+                # Scraped profiles land in the profile cache, so the agents do not scrape them again
+                profiles = await self.extractor.extract(new_urls)
+                if self.lead_index is not None:
+                    await asyncio.to_thread(self.lead_index.put_profiles, profiles)
+                for profile in profiles:
+                    key = normalize_profile_url(profile.get("linkedinUrl") or "")
+                    tokens[key] = profile_tokens(profile)
+                    if self.mode == "direct":
+                        self.profiles[key] = compact_profile(profile)
+                    if self.analysis_cache is not None:
+                        fingerprints[key] = profile_fingerprint(profile)
+            except Exception as e:
+                logger.warning("Packing chunks without profile sizes, the profiles could not be scraped ahead: %s", e)
+
+        cached: Dict[str, Dict[str, Any]] = {}
+        if self.analysis_cache is not None and fingerprints:
+            try:
+                cached = await asyncio.to_thread(self.analysis_cache.get_analyses, company_key, fingerprints.values())
+            except Exception as e:
+                logger.warning("Scoring every profile, the analysis cache lookup failed: %s", e)
+        pending_urls = []
+        for url in new_urls:
+            fingerprint = fingerprints.get(normalize_profile_url(url))
+            if fingerprint in cached:
+                cached_results.append({"url": url, **cached[fingerprint], "cached": True})
+            else:
+                pending_urls.append(url)
+        if self.lead_index is not None and len(cached_results) > len(indexed):
+            await asyncio.to_thread(self.lead_index.put_results, self.tenant_id, company_key, cached_results[len(indexed):])
+        prompt_tokens = {fingerprint: tokens[key] for key, fingerprint in fingerprints.items()}
+        unscraped: List[str] = []
+        if self.mode == "direct":
+            unscraped = [url for url in pending_urls if normalize_profile_url(url) not in self.profiles]
+            pending_urls = [url for url in pending_urls if normalize_profile_url(url) in self.profiles]
+
+        # Before anything is claimed: a consumer that stops here leaves no analysis unreleased
+        if on_result:
+            for result in cached_results:
+                await on_result(result)
+
+        # An analysis is the same work for every pipeline scoring the profile for the company
+        analysis_keys = {
+            url: f"{company_key}:{fingerprints.get(normalize_profile_url(url)) or normalize_profile_url(url)}"
+            for url in pending_urls
+        }
+        led: Futures = {}
+        joined: Futures = {}
+        if self.in_flight is not None:
+            led, joined = self.in_flight.claim(analysis_keys.values())
+            joined_urls = {key: url for url, key in analysis_keys.items() if key in joined}
+            pending_urls = [url for url in pending_urls if analysis_keys[url] in led]
+
+        reserved = estimate_tokens(company_description)
+        pending = deque(
+            (url, tokens.get(normalize_profile_url(url), self.packer.default_profile_tokens)) for url in pending_urls
+        )
+        summary: Dict[str, Any] = {
+            "status": "processing",
+            "current_batch": 0,
+            "total_batches": len(self.packer.pack(pending, self.chunk_size, reserved)),
+            "processed_urls": len(cached_results) + len(unscraped),
+            "total_urls": len(urls),
+            "results": list(cached_results),
+            "errors": [{"urls": unscraped, "error": "The profiles could not be scraped."}] if unscraped else [],
+        }
+        in_flight = 0
+
+        async def run_chunk(chunk: List[str]) -> None:
+            nonlocal in_flight
+            requeued: List[str] = []
+
+            def requeue(chunk_urls: List[str]) -> None:
+                requeued.extend(chunk_urls)
+                pending.extendleft(
+                    (url, tokens.get(normalize_profile_url(url), self.packer.default_profile_tokens))
+                    for url in reversed(chunk_urls)
+                )
+
+            in_flight += 1
+            try:
+                results = await self._score_with_retries(
+                    company_description, chunk, on_result=on_result, tokens=tokens, requeue=requeue
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                results = None
+                summary["errors"].append({"urls": chunk, "error": str(e)})
+                if self.in_flight is not None:
+                    for url in chunk:
+                        self.in_flight.fail(led, analysis_keys[url], e)
+            finally:
+                in_flight -= 1
+            done = [url for url in chunk if url not in requeued]
+            if results is None:
+                results = []
+            else:
+                answered = {normalize_profile_url(result["url"]) for result in results}
+                left_out = [url for url in done if normalize_profile_url(url) not in answered]
+                if left_out:
+                    summary["errors"].append({"urls": left_out, "error": "The response has no result for these profiles."})
+            if self.in_flight is not None:
+                for result in results:
+                    key = analysis_keys.get(unique.get(normalize_profile_url(str(result.get("url", "")))))
+                    if key:
+                        self.in_flight.resolve(led, key, result)
+                # Profiles the response left out have no result for anyone
+                for url in done:
+                    self.in_flight.resolve(led, analysis_keys[url], None)
+            summary["current_batch"] += 1
+            # The remaining chunks are packed with the budget adapted by this one
+            summary["total_batches"] = summary["current_batch"] + in_flight + len(
+                self.packer.pack(pending, self.chunk_size, reserved)
+            )
+            summary["processed_urls"] += len(chunk) - len(requeued)
+            summary["results"].extend(results)
+            if self.analysis_cache is not None and fingerprints:
+                analyses = {}
+                for result in results:
+                    fingerprint = fingerprints.get(normalize_profile_url(str(result.get("url", ""))))
+                    if fingerprint:
+                        analyses[fingerprint] = result
+                await asyncio.to_thread(self.analysis_cache.put_analyses, company_key, analyses, prompt_tokens)
+            if self.in_flight is not None:
+                # Only now that the analyses are cached, so later pipelines find them there
+                self.in_flight.release(led, [analysis_keys[url] for url in done])
+            if self.lead_index is not None and results:
+                await asyncio.to_thread(self.lead_index.put_results, self.tenant_id, company_key, results)
+            if on_chunk:
+                await on_chunk(summary, results)
+
+        async def worker() -> None:
+            while pending:
+                await run_chunk([url for url, _ in self.packer.take(pending, self.chunk_size, reserved)])
+
+        async def follow(key: str, future: asyncio.Future) -> None:
+            url = joined_urls[key]
+            future, taken_over = await self.in_flight.follow(key, future)
+            if taken_over:
+                # The pipeline scoring it was cancelled, so this one scores it, packed with the other
+                # profiles taken over at the same time once they are queued too
+                led[key] = future
+                pending.append((url, tokens.get(normalize_profile_url(url), self.packer.default_profile_tokens)))
+                await asyncio.sleep(0)
+                await worker()
+                return
+            results = []
+            try:
+                result = future.result()
+            except Exception as e:
+                summary["errors"].append({"urls": [url], "error": str(e)})
+            else:
+                if result:
+                    results.append({**result, "url": url})
+            summary["processed_urls"] += 1
+            summary["results"].extend(results)
+            if on_result:
+                for result in results:
+                    await on_result(result)
+            if self.lead_index is not None and results:
+                await asyncio.to_thread(self.lead_index.put_results, self.tenant_id, company_key, results)
+            if on_chunk:
+                await on_chunk(summary, results)
+
+        try:
+            await asyncio.gather(
+                *(worker() for _ in range(min(self.max_workers, len(pending)))),
+                *(follow(key, future) for key, future in joined.items()),
+            )
+        finally:
+            if self.in_flight is not None:
+                # Whatever this pipeline did not finish is left to the pipelines that joined it
+                self.in_flight.release(led)
+        summary["status"] = "error" if summary["errors"] and not summary["results"] else "complete"
+        return summary
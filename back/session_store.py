@@ -0,0 +1,234 @@
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from prompt_packing import estimate_tokens
+from state_store import StateStore
+from telemetry import logger
+
+if TYPE_CHECKING:
+    from semantic_kernel.contents import ChatHistory
+
+SESSIONS = "sessions"
+INVITEES = "invitees"
+SUMMARY_HEADER = "Summary of earlier conversation turns:"
+
+
+class SessionBusyError(RuntimeError):
+    """Another turn held the session for longer than a turn waits for it."""
+
+    def __init__(self, session_id: str):
+        super().__init__(f"Session {session_id} is busy with another request, please try again shortly.")
+        self.session_id = session_id
+
+
+def history_tokens(chat_history: "ChatHistory") -> int:
+    return sum(estimate_tokens(str(message.content or "")) for message in chat_history.messages)
+
+
+class SessionManager:
+    """Chat histories per session, kept in a StateStore with bounded size.
+
+    Sessions idle for longer than ``idle_ttl_seconds`` are dropped, the least recently used ones
+    are evicted past ``max_sessions`` or ``max_bytes``, invitee lists uploaded for a session
+    counting towards both and going with it. Listing the sessions costs as much as there are, so
+    the limits are enforced once every ``evict_every`` saves, and a session whose turn is running
+    is never evicted. Histories over ``token_budget`` are compacted: the first user message (the
+    company information) and the most recent messages are kept, and the turns in between are
+    replaced by a short summary.
+
+    Turns of a session run one at a time across every worker sharing the store: a turn holds the
+    session's lease, renewed while the turn runs and expiring ``lease_seconds`` after its worker
+    died mid-turn. A turn waits at most ``lease_wait_seconds`` for the session, then fails with
+    SessionBusyError.
+    """
+
+    def __init__(
+        self,
+        store: StateStore,
+        max_sessions: Optional[int] = None,
+        idle_ttl_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        token_budget: Optional[int] = None,
+        keep_recent_messages: Optional[int] = None,
+        lease_seconds: Optional[float] = None,
+        lease_wait_seconds: Optional[float] = None,
+        evict_every: Optional[int] = None,
+    ):
+        self.store = store
+        self.max_sessions = max_sessions or int(os.getenv("SESSION_MAX_COUNT", "1000"))
+        self.idle_ttl_seconds = idle_ttl_seconds or float(os.getenv("SESSION_IDLE_TTL_SECONDS", "86400"))
+        self.max_bytes = max_bytes or int(float(os.getenv("SESSION_MAX_MEMORY_MB", "64")) * 1024 * 1024)
+        self.token_budget = token_budget or int(os.getenv("SESSION_TOKEN_BUDGET", "6000"))
+        self.keep_recent_messages = keep_recent_messages or int(os.getenv("SESSION_KEEP_RECENT_MESSAGES", "10"))
+        self.lease_seconds = lease_seconds or float(os.getenv("SESSION_LEASE_SECONDS", "60"))
+        self.lease_wait_seconds = lease_wait_seconds or float(os.getenv("SESSION_LEASE_WAIT_SECONDS", "30"))
+        self.evict_every = evict_every or int(os.getenv("SESSION_EVICT_EVERY", "50"))
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.evictions = 0
+        self.expirations = 0
+        self.compactions = 0
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+        self._saves_since_eviction = 0
+
+    async def load(self, session_id: str) -> "ChatHistory":
+        from semantic_kernel.contents import ChatHistory
+
+        data = await asyncio.to_thread(self.store.get, SESSIONS, session_id)
+        if not data:
+            return ChatHistory()
+        return ChatHistory.restore_chat_history(data["history"])
+
+    async def save(self, session_id: str, chat_history: "ChatHistory") -> None:
+        self.compact(chat_history)
+        await asyncio.to_thread(self._save, session_id, chat_history.serialize())
+
+    def _save(self, session_id: str, history: str) -> None:
+        self.store.set(SESSIONS, session_id, {"history": history})
+        self._saved()
+
+    async def load_invitees(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The invitee list last uploaded for a session, if any."""
+        return await asyncio.to_thread(self.store.get, INVITEES, session_id)
+
+    async def save_invitees(self, session_id: str, invitees: List[Dict[str, Any]], report: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._save_invitees, session_id, {"invitees": invitees, "report": report})
+
+    def _save_invitees(self, session_id: str, invitees: Dict[str, Any]) -> None:
+        self.store.set(INVITEES, session_id, invitees)
+        self._saved()
+
+    @asynccontextmanager
+    async def session(self, session_id: str) -> AsyncIterator["ChatHistory"]:
+        """Load a history for one turn and save it afterwards; turns of a session run one at a time."""
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._lock_users[session_id] = self._lock_users.get(session_id, 0) + 1
+        lease = f"{SESSIONS}:{session_id}"
+        deadline = time.monotonic() + self.lease_wait_seconds
+        try:
+            # Turns of this worker queue on the lock; only the one running waits for other workers
+            try:
+                await asyncio.wait_for(lock.acquire(), self.lease_wait_seconds)
+            except asyncio.TimeoutError:
+                raise SessionBusyError(session_id) from None
+            try:
+                while not await asyncio.to_thread(self.store.acquire_lease, lease, self.owner, self.lease_seconds):
+                    if time.monotonic() >= deadline:
+                        raise SessionBusyError(session_id)
+                    await asyncio.sleep(0.05)
+                renewal = asyncio.create_task(self._renew(lease))
+                try:
+                    chat_history = await self.load(session_id)
+                    yield chat_history
+                    await self.save(session_id, chat_history)
+                finally:
+                    renewal.cancel()
+                    await asyncio.gather(renewal, return_exceptions=True)
+                    await asyncio.to_thread(self.store.release_lease, lease, self.owner)
+            finally:
+                lock.release()
+        finally:
+            self._lock_users[session_id] -= 1
+            if not self._lock_users[session_id]:
+                del self._lock_users[session_id]
+                del self._locks[session_id]
+
+    async def _renew(self, lease: str) -> None:
+        """Keep the lease of a running turn, however long the turn takes."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await asyncio.to_thread(self.store.acquire_lease, lease, self.owner, self.lease_seconds):
+                logger.warning("Lost the lease of %s to another worker", lease)
+                return
+
+    def compact(self, chat_history: "ChatHistory") -> bool:
+        from semantic_kernel.contents import AuthorRole, ChatMessageContent
+
+        if history_tokens(chat_history) <= self.token_budget:
+            return False
+        messages = chat_history.messages
+        pinned = next((i for i, message in enumerate(messages) if message.role == AuthorRole.USER), None)
+        recent_start = max(len(messages) - self.keep_recent_messages, (pinned or 0) + 1)
+        older = [message for i, message in enumerate(messages[:recent_start]) if i != pinned]
+        if not older:
+            return False
+
+        lines = []
+        for message in older:
+            content = str(message.content or "")
+            if message.role == AuthorRole.SYSTEM and content.startswith(SUMMARY_HEADER):
+                # Fold the summary of a previous compaction into the new one
+                lines.extend(content.splitlines()[1:])
+                continue
+            text = " ".join(content.split())
+            lines.append(f"- {message.role.value}: {text[:200]}{'...' if len(text) > 200 else ''}")
+        summary = SUMMARY_HEADER + "\n" + "\n".join(lines[-20:])
+
+        kept: List[Any] = [messages[pinned]] if pinned is not None else []
+        chat_history.messages = kept + [ChatMessageContent(role=AuthorRole.SYSTEM, content=summary)] + messages[recent_start:]
+        self.compactions += 1
+        return True
+
+    def _delete(self, session_id: str) -> None:
+        self.store.delete(SESSIONS, session_id)
+        self.store.delete(INVITEES, session_id)
+
+    def _entries(self) -> List[Tuple[str, float, int]]:
+        """Every session with a history or invitees, least recently used first, and its size in bytes."""
+        sessions: Dict[str, Tuple[float, int]] = {}
+        for namespace in (SESSIONS, INVITEES):
+            for key, updated_at, size in self.store.entries(namespace):
+                last_used, total = sessions.get(key, (0.0, 0))
+                sessions[key] = (max(last_used, updated_at), total + size)
+        return sorted(((key, updated_at, size) for key, (updated_at, size) in sessions.items()), key=lambda entry: entry[1])
+
+    def _evict_unused(self, session_id: str) -> bool:
+        """Delete a session unless a turn holds it; its lease is taken for the time of the delete."""
+        lease = f"{SESSIONS}:{session_id}"
+        evictor = f"{self.owner}-evict"
+        if not self.store.acquire_lease(lease, evictor, self.lease_seconds):
+            return False
+        try:
+            self._delete(session_id)
+        finally:
+            self.store.release_lease(lease, evictor)
+        return True
+
+    def _saved(self) -> None:
+        self._saves_since_eviction += 1
+        if self._saves_since_eviction >= self.evict_every:
+            self._saves_since_eviction = 0
+            self._evict()
+
+    def _evict(self) -> None:
+        now = time.time()
+        live = []
+        for key, updated_at, size in self._entries():
+            if now - updated_at > self.idle_ttl_seconds and self._evict_unused(key):
+                self.expirations += 1
+            else:
+                live.append((key, size))
+
+        count = len(live)
+        total_bytes = sum(size for _, size in live)
+        for key, size in live:
+            if count <= self.max_sessions and total_bytes <= self.max_bytes:
+                break
+            if self._evict_unused(key):
+                count -= 1
+                total_bytes -= size
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {
+            "sessions": len(entries),
+            "bytes": sum(size for _, _, size in entries),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "compactions": self.compactions,
+        }
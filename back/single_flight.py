@@ -0,0 +1,100 @@
+import asyncio
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from telemetry import metrics
+
+single_flight = metrics.counter(
+    "single_flight_total", "Keys of coalesced work, per flight: led (did the work) or joined (waited for it)."
+)
+
+Futures = Dict[str, asyncio.Future]
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    # Failures nobody joined would otherwise be logged as never retrieved
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    """Coalesces concurrent work on the same keys, so each key is worked on once at a time.
+
+    ``claim`` splits keys into the ones the caller now leads, with a future it must ``resolve`` or
+    ``fail``, and the ones already in flight, whose future it joins through ``follow`` instead of
+    redoing the work. The leader ``release``s its keys once the result is also stored where later
+    callers look first; a key released without a result (the leader was cancelled) is taken over
+    by one of the callers that joined it. A joining caller that is cancelled leaves the work alone.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.led = 0
+        self.joined = 0
+        self.taken_over = 0
+        self._flights: Futures = {}
+
+    def claim(self, keys: Iterable[str]) -> Tuple[Futures, Futures]:
+        """Split ``keys`` into the ones the caller leads and the ones it joins, each with its future."""
+        led: Futures = {}
+        joined: Futures = {}
+        for key in keys:
+            if key in led or key in joined:
+                continue
+            future = self._flights.get(key)
+            if future is None:
+                future = asyncio.get_running_loop().create_future()
+                future.add_done_callback(_retrieve)
+                self._flights[key] = led[key] = future
+            else:
+                joined[key] = future
+        self.led += len(led)
+        self.joined += len(joined)
+        if led:
+            single_flight.inc(len(led), flight=self.name, outcome="led")
+        if joined:
+            single_flight.inc(len(joined), flight=self.name, outcome="joined")
+        return led, joined
+
+    async def follow(self, key: str, future: asyncio.Future) -> Tuple[asyncio.Future, bool]:
+        """Wait for a joined key; returns its finished future, or a new future the caller now leads
+        (and ``True``) when the leader gave up without a result."""
+        while True:
+            # Unlike awaiting the future, asyncio.wait does not cancel it when this caller is cancelled
+            await asyncio.wait({future})
+            if not future.cancelled():
+                return future, False
+            led, joined = self.claim([key])
+            if led:
+                self.taken_over += 1
+                return led[key], True
+            future = joined[key]
+
+    @staticmethod
+    def resolve(led: Futures, key: str, value: Any) -> None:
+        future = led.get(key)
+        if future is not None and not future.done():
+            future.set_result(value)
+
+    @staticmethod
+    def fail(led: Futures, key: str, error: BaseException) -> None:
+        future = led.get(key)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    def release(self, led: Futures, keys: Optional[Iterable[str]] = None) -> None:
+        """Stop sharing the led ``keys`` (all by default); the ones without a result are cancelled."""
+        for key in list(led) if keys is None else keys:
+            future = led.get(key)
+            if future is None:
+                continue
+            future.cancel()
+            if self._flights.get(key) is future:
+                del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "led": self.led,
+            "joined": self.joined,
+            "taken_over": self.taken_over,
+        }
@@ -0,0 +1,176 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class StateStore(ABC):
+    """Namespaced key-value store of JSON documents with their last update time, and expiring leases
+    that let one worker process at a time own something (e.g. a session's turn).
+
+    Workers that share a store share sessions, tenant connections and job records, so any of them
+    can serve any request; another backend only needs to implement these methods.
+
+    Methods are blocking and thread-safe; call them through ``asyncio.to_thread`` from async code.
+    """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def entries(self, namespace: str) -> List[Tuple[str, float, int]]:
+        """``(key, updated_at, size_in_bytes)`` of every entry, least recently updated first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """Take (or renew) the lease ``name`` for ``owner`` unless another owner holds an unexpired one."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_lease(self, name: str, owner: str) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class InMemoryStateStore(StateStore):
+    """State kept in this process only."""
+
+    def __init__(self):
+        self._namespaces: Dict[str, "OrderedDict[str, Tuple[float, str]]"] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._namespaces.get(namespace, {}).get(key)
+        return json.loads(entry[1]) if entry else None
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        data = json.dumps(value)
+        with self._lock:
+            entries = self._namespaces.setdefault(namespace, OrderedDict())
+            entries[key] = (time.time(), data)
+            entries.move_to_end(key)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._namespaces.get(namespace, {}).pop(key, None)
+
+    def entries(self, namespace: str) -> List[Tuple[str, float, int]]:
+        with self._lock:
+            return [
+                (key, updated_at, len(data))
+                for key, (updated_at, data) in self._namespaces.get(namespace, {}).items()
+            ]
+
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder and holder[0] != owner and holder[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl_seconds)
+            return True
+
+    def release_lease(self, name: str, owner: str) -> None:
+        with self._lock:
+            if self._leases.get(name, ("", 0.0))[0] == owner:
+                del self._leases[name]
+
+
+class SQLiteStateStore(StateStore):
+    """State in a SQLite file, shared by every worker process that opens the same path."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL lets readers in other processes proceed while one worker writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "updated_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS state_updated_at ON state (namespace, updated_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        data = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, data, time.time()),
+            )
+            self._conn.commit()
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+            self._conn.commit()
+
+    def entries(self, namespace: str) -> List[Tuple[str, float, int]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, updated_at, LENGTH(value) FROM state WHERE namespace = ? ORDER BY updated_at",
+                (namespace,),
+            ).fetchall()
+
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        with self._lock:
+            # One statement, so two workers racing for a free lease cannot both get it
+            self._conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                (name, owner, now + ttl_seconds, now),
+            )
+            self._conn.commit()
+            row = self._conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == owner
+
+    def release_lease(self, name: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_state_store() -> StateStore:
+    """State store selected by STATE_STORE (``memory`` or ``sqlite``)."""
+    kind = os.getenv("STATE_STORE", "memory").lower()
+    if kind == "sqlite":
+        return SQLiteStateStore(os.getenv("STATE_STORE_PATH", "state.db"))
+    if kind == "memory":
+        return InMemoryStateStore()
+    raise ValueError(f"Unknown STATE_STORE: {kind}")
@@ -0,0 +1,297 @@
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from prompt_packing import estimate_tokens
+
+try:
+    from opentelemetry import trace
+except ImportError:  # OpenTelemetry export is optional
+    trace = None
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """Current value per label set."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations per label set."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            # One count per bucket, then the sum and the total count
+            counts = self.values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, counts in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {_format_value(count)}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {_format_value(counts[-1])}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(counts[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {_format_value(counts[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics of the process, rendered in the Prometheus text format.
+
+    Besides the metrics recorded as things happen, ``register_stats`` turns the ``stats()`` of a
+    component (caches, queues, pools) into counters and gauges that are read when the metrics are
+    rendered.
+    """
+
+    def __init__(self, namespace: str = "evagent"):
+        self.namespace = namespace
+        self._metrics: Dict[str, Any] = {}
+        self._stats: List[Tuple[str, str, Callable[[], Dict[str, Any]], Optional[str], Iterable[str]]] = []
+        self._lock = threading.Lock()
+
+    def _get(self, kind: type, name: str, help: str, **options: Any) -> Any:
+        name = f"{self.namespace}_{name}"
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind(name, help, **options)
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def register_stats(
+        self,
+        prefix: str,
+        help: str,
+        stats: Callable[[], Dict[str, Any]],
+        label: Optional[str] = None,
+        counters: Iterable[str] = (),
+    ) -> None:
+        """Expose the numeric values of ``stats()`` as ``<prefix>_<key>`` gauges.
+
+        Nested dicts extend the name, except at the top level when ``label`` is given: their keys
+        (service names, connection fingerprints) become the value of that label instead. The keys
+        listed in ``counters`` only ever grow, and are exposed as ``<prefix>_<key>_total`` counters.
+        """
+        self._stats.append((prefix, help, stats, label, frozenset(counters)))
+
+    def _stats_samples(self) -> List[str]:
+        families: Dict[str, Tuple[str, str, List[str]]] = {}
+        for prefix, help, stats, label, counters in self._stats:
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning("Could not read the %s stats: %s", prefix, e)
+                continue
+            groups = values.items() if label else [(None, values)]
+            for group, group_values in groups:
+                labels = _label_key({label: group}) if label else ()
+                for path, value in _flatten(group_values):
+                    counter = path in counters
+                    name = f"{self.namespace}_{prefix}_{path}{'_total' if counter else ''}"
+                    family = families.setdefault(name, ("counter" if counter else "gauge", f"{help} ({path})", []))
+                    family[2].append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        lines = []
+        for name, (kind, description, samples) in families.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return lines
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        lines.extend(self._stats_samples())
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(values: Dict[str, Any], prefix: str = "") -> Iterator[Tuple[str, float]]:
+    for key, value in values.items():
+        name = "".join(c if c.isalnum() else "_" for c in f"{prefix}{key}")
+        if isinstance(value, bool):
+            yield name, float(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+        elif isinstance(value, dict):
+            yield from _flatten(value, f"{name}_")
+
+
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram("stage_seconds", "Seconds spent per request stage.")
+stage_errors = metrics.counter("stage_errors_total", "Stage runs that raised an error.")
+agent_tokens = metrics.counter("agent_tokens_total", "Prompt and completion tokens per agent.")
+
+
+def _tracer() -> Any:
+    """OpenTelemetry tracer when OTEL_EXPORTER_OTLP_ENDPOINT is set and the SDK and exporter are installed."""
+    if trace is None or not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return None
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk or the OTLP exporter is not installed.")
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "evagent")}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer("evagent")
+
+
+@contextmanager
+def timed(stage: str, **labels: Any) -> Iterator[None]:
+    """Record the duration of a stage in ``stage_seconds`` and, with OpenTelemetry set up, as a span."""
+    span = tracer.start_as_current_span(stage, attributes={k: str(v) for k, v in labels.items()}) if tracer else None
+    started = time.perf_counter()
+    try:
+        if span:
+            with span:
+                yield
+        else:
+            yield
+    except BaseException:
+        stage_errors.inc(stage=stage, **labels)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=stage, **labels)
+
+
+def _usage(content: Any) -> Optional[Tuple[int, int]]:
+    usage = (getattr(content, "metadata", None) or {}).get("usage")
+    if usage is None:
+        return None
+    prompt = getattr(usage, "prompt_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if prompt is None and isinstance(usage, dict):
+        prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return (prompt or 0, completion or 0) if prompt is not None else None
+
+
+async def record_agent_stream(agent: str, stream: AsyncIterable[Any], prompt: str = "") -> AsyncIterator[Any]:
+    """Pass an agent's streamed chunks through, timing the invocation and counting its tokens.
+
+    Token counts come from the usage the service reports with the stream, and are estimated from the
+    prompt and the streamed text when it reports none.
+    """
+    completion_chars: List[str] = []
+    usage = None
+    with timed("agent_invoke", agent=agent):
+        async for content in stream:
+            usage = _usage(content) or usage
+            text = getattr(getattr(content, "content", None), "content", None)
+            if isinstance(text, str):
+                completion_chars.append(text)
+            yield content
+    if usage is None:
+        usage = (estimate_tokens(prompt), estimate_tokens("".join(completion_chars)))
+    agent_tokens.inc(usage[0], agent=agent, kind="prompt")
+    agent_tokens.inc(usage[1], agent=agent, kind="completion")
+
+
+logger = logging.getLogger("evagent")
+
+
+def configure_logging() -> None:
+    """Log to stderr at LOG_LEVEL; called by the entry point, not on import, so embedding code keeps its own setup."""
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logger.setLevel(level)
+
+# Raw agent responses are large, so only a sample of them is logged, at DEBUG and truncated
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "2000"))
+
+
+def log_sampled(message: str, payload: Any, rate: Optional[float] = None) -> None:
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= (LOG_SAMPLE_RATE if rate is None else rate):
+        return
+    text = str(payload)
+    if len(text) > LOG_MAX_CHARS:
+        text = f"{text[:LOG_MAX_CHARS]}... ({len(text)} chars)"
+    logger.debug("%s: %s", message, text)
+
+
+tracer = _tracer()
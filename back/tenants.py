@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from resilience import RateLimiter
+from state_store import StateStore
+
+
+DEFAULT_TENANT = "default"
+CONNECTIONS = "connections"
+
+
+def connection_key(conn_str: str) -> str:
+    """Short fingerprint of a connection string, which holds secrets and is never reported as is."""
+    return hashlib.sha256(conn_str.encode()).hexdigest()[:8]
+
+
+def token_hash(token: str) -> str:
+    """Tenant tokens are only kept as their hash, in memory and in the state store."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TenantAuthError(PermissionError):
+    """A request named a tenant without presenting the tenant's token."""
+
+    def __init__(self, tenant_id: str):
+        super().__init__(f"Invalid or missing token for tenant {tenant_id}.")
+        self.tenant_id = tenant_id
+
+
+class TenantQuotaError(RuntimeError):
+    """A tenant used up its request quota; it may send requests again in ``retry_after`` seconds."""
+
+    def __init__(self, tenant_id: str, retry_after: float):
+        super().__init__(f"Request quota of tenant {tenant_id} exceeded, retry in {retry_after:.0f}s.")
+        self.tenant_id = tenant_id
+        self.retry_after = retry_after
+
+
+class Tenant:
+    """Connection and limits of one tenant: at most ``max_concurrency`` requests run at a time and
+    ``requests_per_minute`` are admitted (0 = no quota). Requests must present the token whose hash
+    is ``token_hash``, when the tenant has one."""
+
+    def __init__(
+        self,
+        tenant_id: str,
+        conn_str: str,
+        max_concurrency: int,
+        requests_per_minute: float,
+        token_hash: Optional[str] = None,
+    ):
+        self.id = tenant_id
+        self.conn_str = conn_str
+        self.token_hash = token_hash
+        self.max_concurrency = max_concurrency
+        self.quota = RateLimiter(requests_per_minute / 60, burst=max(requests_per_minute / 6, 1.0))
+        self.created_at = time.time()
+        self.last_used_at = self.created_at
+        self.running = 0
+        self.requests = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def authorize(self, token: Optional[str]) -> None:
+        """Raise TenantAuthError unless ``token`` is the tenant's token (or the tenant has none)."""
+        if self.token_hash and not hmac.compare_digest(self.token_hash, token_hash(token or "")):
+            raise TenantAuthError(self.id)
+
+    def admit(self) -> None:
+        """Count a request against the quota, raising TenantQuotaError when none is left."""
+        self.last_used_at = time.time()
+        wait = self.quota.try_acquire()
+        if wait:
+            self.rejected += 1
+            raise TenantQuotaError(self.id, wait)
+        self.requests += 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait for one of the tenant's concurrency slots and hold it while the work runs."""
+        async with self._semaphore:
+            self.running += 1
+            try:
+                yield
+            finally:
+                self.running -= 1
+                self.last_used_at = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connection": connection_key(self.conn_str),
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "idle_seconds": round(time.time() - self.last_used_at, 1),
+        }
+
+
+class ConnectionRegistry:
+    """Connection of every tenant, on top of the shared agent runtimes.
+
+    Tenants that use the same connection string share its warmed runtime (credential, clients and
+    HTTP pool); a runtime is closed once no tenant uses it anymore. Connections are validated by
+    building their runtime, without touching the process environment, so tenants never see each
+    other's settings. The least recently used tenants are dropped beyond ``max_tenants``.
+
+    The default tenant, used by requests that name no tenant, starts with PROJECT_CONNECTION_STRING.
+    It is shared, so it never gets a token of its own: only DEFAULT_TENANT_TOKEN, when set, locks it.
+
+    Setting the connection of any other tenant that has none issues the tenant's token; from then on
+    the tenant's requests, including setting its connection again, must present it.
+
+    With a ``store``, the connection of every tenant is saved to it and read back on each lookup, so
+    a connection set through one worker is used by every worker sharing the store. Concurrency limits
+    and quotas are counted per worker.
+    """
+
+    def __init__(
+        self,
+        runtimes: Any,
+        max_tenants: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        requests_per_minute: Optional[float] = None,
+        validate_timeout: Optional[float] = None,
+        store: Optional[StateStore] = None,
+    ):
+        self.runtimes = runtimes
+        self.store = store
+        self.max_tenants = max_tenants or int(os.getenv("TENANT_MAX_COUNT", "1000"))
+        self.max_concurrency = max_concurrency or int(os.getenv("TENANT_MAX_CONCURRENCY", "4"))
+        self.requests_per_minute = (
+            requests_per_minute if requests_per_minute is not None
+            else float(os.getenv("TENANT_REQUESTS_PER_MINUTE", "0"))
+        )
+        self.validate_timeout = validate_timeout or float(os.getenv("CONNECTION_VALIDATE_TIMEOUT_SECONDS", "30"))
+        self.tenants: "OrderedDict[str, Tenant]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        default_token = os.getenv("DEFAULT_TENANT_TOKEN")
+        self.default_token_hash = token_hash(default_token) if default_token else None
+        default_conn_str = os.getenv("PROJECT_CONNECTION_STRING")
+        if default_conn_str:
+            self.tenants[DEFAULT_TENANT] = self._new_tenant(DEFAULT_TENANT, default_conn_str, self.default_token_hash)
+
+    def _new_tenant(self, tenant_id: str, conn_str: str, hashed_token: Optional[str] = None) -> Tenant:
+        return Tenant(tenant_id, conn_str, self.max_concurrency, self.requests_per_minute, hashed_token)
+
+    async def validate(self, conn_str: str) -> None:
+        """Build (or reuse) the runtime of a connection string, raising if it cannot be set up.
+
+        A runtime no tenant ends up using is closed again, so testing a connection leaves nothing behind.
+        """
+        try:
+            await asyncio.wait_for(self.runtimes.get(conn_str), self.validate_timeout)
+        finally:
+            await self._release_unused({conn_str})
+
+    def _put(self, tenant_id: str, conn_str: str, hashed_token: Optional[str]) -> Tuple[Tenant, Dict[str, str]]:
+        """Make ``conn_str`` the tenant's connection; returns the tenant and the connections it replaced
+        or evicted, by tenant. Call with the lock held."""
+        tenant = self.tenants.pop(tenant_id, None)
+        replaced = {tenant_id: tenant.conn_str} if tenant and tenant.conn_str != conn_str else {}
+        if tenant:
+            tenant.conn_str = conn_str
+            tenant.token_hash = hashed_token
+        else:
+            tenant = self._new_tenant(tenant_id, conn_str, hashed_token)
+        self.tenants[tenant_id] = tenant
+        # The default tenant serves every request that names no tenant, so it is never dropped
+        evictable = [key for key in self.tenants if key not in (DEFAULT_TENANT, tenant_id)]
+        for key in evictable[:max(0, len(self.tenants) - self.max_tenants)]:
+            replaced[key] = self.tenants.pop(key).conn_str
+        return tenant, replaced
+
+    async def set(self, tenant_id: str, conn_str: str, token: Optional[str] = None) -> Tuple[Tenant, Optional[str]]:
+        """Validate a connection and make it the tenant's, keeping its limits and counters if it had one.
+
+        Returns the tenant and its token: the one presented, or a new one when the tenant had none
+        (None for an unlocked default tenant). Raises TenantAuthError when the tenant has a token
+        and ``token`` is not it.
+        """
+        current = await self.get(tenant_id)
+        if tenant_id == DEFAULT_TENANT:
+            if self.default_token_hash and not hmac.compare_digest(self.default_token_hash, token_hash(token or "")):
+                raise TenantAuthError(tenant_id)
+            hashed_token = self.default_token_hash
+            token = token if hashed_token else None
+        elif current is not None and current.token_hash:
+            current.authorize(token)
+            hashed_token = current.token_hash
+        else:
+            token = secrets.token_urlsafe(32)
+            hashed_token = token_hash(token)
+        await asyncio.wait_for(self.runtimes.get(conn_str), self.validate_timeout)
+        async with self._lock:
+            latest = self.tenants.get(tenant_id)
+            if latest is not None and latest.token_hash and latest.token_hash != (current.token_hash if current else None):
+                # Another request claimed the tenant while the connection was validated
+                raise TenantAuthError(tenant_id)
+            tenant, replaced = self._put(tenant_id, conn_str, hashed_token)
+        if self.store is not None:
+            await asyncio.to_thread(
+                self.store.set, CONNECTIONS, tenant_id, {"connection_string": conn_str, "token_hash": tenant.token_hash}
+            )
+            for key in replaced:
+                if key != tenant_id:
+                    await asyncio.to_thread(self.store.delete, CONNECTIONS, key)
+        await self._release_unused(set(replaced.values()))
+        return tenant, token
+
+    async def _sync(self, tenant_id: str) -> None:
+        """Pick up a connection another worker set or removed for the tenant."""
+        stored = await asyncio.to_thread(self.store.get, CONNECTIONS, tenant_id)
+        conn_str = stored["connection_string"] if stored else None
+        hashed_token = stored.get("token_hash") if stored else None
+        if tenant_id == DEFAULT_TENANT:
+            # A token a worker once issued for the default tenant no longer locks it
+            hashed_token = self.default_token_hash
+        tenant = self.tenants.get(tenant_id)
+        current = (tenant.conn_str, tenant.token_hash) if tenant else (None, None)
+        if (conn_str, hashed_token) == current or (conn_str is None and tenant_id == DEFAULT_TENANT):
+            # The default tenant keeps PROJECT_CONNECTION_STRING until a connection is set for it
+            return
+        async with self._lock:
+            if conn_str is None:
+                replaced = {tenant_id: self.tenants.pop(tenant_id).conn_str} if tenant_id in self.tenants else {}
+            else:
+                _, replaced = self._put(tenant_id, conn_str, hashed_token)
+        await self._release_unused(set(replaced.values()))
+
+    async def get(self, tenant_id: str) -> Optional[Tenant]:
+        if self.store is not None:
+            await self._sync(tenant_id)
+        tenant = self.tenants.get(tenant_id)
+        if tenant:
+            self.tenants.move_to_end(tenant_id)
+        return tenant
+
+    async def remove(self, tenant_id: str) -> bool:
+        async with self._lock:
+            tenant = self.tenants.pop(tenant_id, None)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.delete, CONNECTIONS, tenant_id)
+        if tenant:
+            await self._release_unused({tenant.conn_str})
+        return tenant is not None
+
+    async def _release_unused(self, conn_strs: set) -> None:
+        in_use = {tenant.conn_str for tenant in self.tenants.values()}
+        for conn_str in conn_strs - in_use:
+            await self.runtimes.release(conn_str)
+
+    def stats(self) -> Dict[str, Any]:
+        return {tenant_id: tenant.stats() for tenant_id, tenant in self.tenants.items()}
@@ -0,0 +1,62 @@
+import asyncio
+from types import SimpleNamespace
+
+from agent_registry import AgentRuntimeRegistry
+
+
+class FakeRuntime:
+    def __init__(self, conn_str, transport):
+        self.conn_str = conn_str
+        self.closed = False
+
+    async def start(self):
+        if self.conn_str == "slow":
+            await asyncio.sleep(0.5)
+
+    async def close(self):
+        self.closed = True
+
+
+def registry() -> AgentRuntimeRegistry:
+    runtimes = AgentRuntimeRegistry()
+    runtimes._agents = SimpleNamespace(AgentRuntime=FakeRuntime)
+    return runtimes
+
+
+def test_released_runtime_is_closed_after_its_last_user():
+    async def scenario():
+        runtimes = registry()
+        async with runtimes.use("a") as (runtime, cold):
+            assert cold
+            async with runtimes.use("a") as (same, cold):
+                assert same is runtime and not cold
+                await runtimes.release("a")
+                assert not runtime.closed
+            assert not runtime.closed
+        assert runtime.closed
+        # The next request builds a new runtime
+        async with runtimes.use("a") as (rebuilt, cold):
+            assert rebuilt is not runtime and cold
+
+    asyncio.run(scenario())
+
+
+def test_unused_runtime_is_closed_on_release():
+    async def scenario():
+        runtimes = registry()
+        runtime, _ = await runtimes.get("a")
+        await runtimes.release("a")
+        assert runtime.closed
+
+    asyncio.run(scenario())
+
+
+def test_slow_connection_does_not_hold_back_other_connections():
+    async def scenario():
+        runtimes = registry()
+        slow = asyncio.create_task(runtimes.get("slow"))
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(runtimes.get("fast"), 0.1)
+        await slow
+
+    asyncio.run(scenario())
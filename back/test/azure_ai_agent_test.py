@@ -0,0 +1,142 @@
+import asyncio
+import io
+import json
+import time
+
+from fakes import fake_profile_urls
+
+COMPANY = "We are Contoso, a cloud consultancy looking for IT decision makers."
+
+
+def frames(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def wait_for_job(client, run, job_id, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = run(client.get(f"/jobs/{job_id}")).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        run(asyncio.sleep(0.05))
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_status_endpoints(client, run):
+    assert run(client.get("/")).json() == {"message": "LinkedIn Profile Analysis API"}
+    assert run(client.get("/connection_status/")).json()["connected"]
+    for path in ("/tenant_status/", "/runtime_status/", "/cache_status/", "/batch_status/", "/resilience_status/",
+                 "/session_status/", "/job_status/"):
+        assert run(client.get(path)).status_code == 200, path
+    metrics = run(client.get("/metrics"))
+    assert metrics.status_code == 200
+    assert "# TYPE" in metrics.text
+
+
+def test_uploaded_invitees_are_analyzed_for_the_session(client, run):
+    session = "upload"
+    urls = fake_profile_urls(4, offset=100)
+    csv = "name,email,linkedin_url\n" + "".join(f"Invitee {i},invitee{i}@example.com,{url}\n" for i, url in enumerate(urls))
+    # The last row repeats the first URL
+    csv += f"Again,again@example.com,{urls[0]}/\n"
+    uploaded = run(client.post(
+        "/upload_excel/", files={"file": ("invitees.csv", io.BytesIO(csv.encode()))}, data={"session_id": session}
+    ))
+    assert uploaded.status_code == 200
+    assert uploaded.json()["report"]["duplicates"] == 1
+    assert len(uploaded.json()["linkedin_data"]) == 4
+
+    assert run(client.post("/chat/", json={"session_id": session, "message": COMPANY})).json()["response"]
+    # The chat only confirmed the company; the host agent has not passed on a description yet
+    unknown = run(client.post("/process_invitees/", json={"session_id": session, "mode": "direct"}))
+    assert unknown.status_code == 400
+    response = run(client.post(
+        "/process_invitees/", json={"session_id": session, "mode": "direct", "company_description": COMPANY}
+    ))
+    assert response.status_code == 200
+    assert response.json()["errors"] == []
+    assert {client["url"] for client in response.json()["potential_clients"]} <= set(urls)
+
+    missing = run(client.post("/process_invitees/", json={"session_id": "nothing-uploaded", "company_description": COMPANY}))
+    assert missing.status_code == 400
+
+
+def test_streamed_analysis_ends_with_a_complete_frame(client, run):
+    urls = fake_profile_urls(6, offset=200)
+    response = run(client.post("/process_invitees/stream/", json={
+        "session_id": "stream", "linkedin_urls": urls, "company_description": COMPANY, "mode": "direct"
+    }))
+    assert response.status_code == 200
+    streamed = frames(response)
+    assert streamed[0]["type"] == "progress"
+    assert streamed[-1]["type"] == "complete"
+    assert sorted(frame["url"] for frame in streamed if frame["type"] == "result") == sorted(urls)
+
+
+def test_background_analysis_job(client, run):
+    urls = fake_profile_urls(3, offset=300)
+    submitted = run(client.post("/jobs/process_invitees/", json={
+        "session_id": "job", "linkedin_urls": urls, "company_description": COMPANY, "mode": "direct"
+    }))
+    assert submitted.status_code == 202
+    job_id = submitted.json()["job_id"]
+    # The events stream from the job's snapshot until it is done
+    events = frames(run(client.get(f"/jobs/{job_id}/events")))
+    assert events[0]["type"] == "snapshot"
+    assert events[-1]["type"] == "done" or events[-1]["status"] == "completed"
+    job = wait_for_job(client, run, job_id)
+    assert job["status"] == "completed"
+    assert sorted(result["url"] for result in job["partial_results"]) == sorted(urls)
+    assert run(client.delete(f"/jobs/{job_id}")).status_code == 404
+    assert run(client.get("/jobs/unknown")).status_code == 404
+
+
+def test_drafted_emails_are_streamed_and_sent(client, run):
+    clients = [
+        {"url": url, "name": f"Invitee {i}", "email": f"invitee{i}@example.com", "reason": "Buys cloud services"}
+        for i, url in enumerate(fake_profile_urls(2, offset=400))
+    ]
+    response = run(client.post("/generate_emails/", json={
+        "company_description": COMPANY, "potential_clients": clients, "send": True
+    }))
+    assert response.status_code == 200
+    streamed = frames(response)
+    assert streamed[0]["type"] == "delivery"
+    drafts = [frame for frame in streamed if frame["type"] == "draft"]
+    assert sorted(draft["to"] for draft in drafts) == ["invitee0@example.com", "invitee1@example.com"]
+    assert all(draft["body"] for draft in drafts)
+    assert streamed[-1]["type"] == "complete" and streamed[-1]["drafted"] == 2
+
+    delivery = streamed[0]["job_id"]
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        report = run(client.get(f"/send_emails/{delivery}")).json()
+        if report["finished_at"]:
+            break
+        run(asyncio.sleep(0.05))
+    assert report["counts"] == {"sent": 2}
+
+    sent = run(client.post("/send_emails/", json={"email_body": "Hi", "potential_clients": ["a@example.com", "a@example.com"]}))
+    assert sent.status_code == 202
+    assert list(sent.json()["recipients"]) == ["a@example.com"]
+    assert run(client.get("/send_emails/unknown")).status_code == 404
+
+
+def test_company_info_is_taken_from_the_host_agents_reply():
+    from semantic_kernel.contents import ChatHistory
+
+    from azure_ai_agent import CompanyInfo
+
+    history = ChatHistory()
+    history.add_user_message(f"Company Name: Contoso, Description: {COMPANY}")
+    history.add_assistant_message("Thanks! I saved your company information.")
+    assert CompanyInfo.from_history(history) is None
+
+    history.add_user_message("https://www.linkedin.com/in/ada")
+    history.add_assistant_message(json.dumps({
+        "action": "analyze_profiles", "company_description": COMPANY, "linkedin_urls": ["https://www.linkedin.com/in/ada"]
+    }))
+    history.add_assistant_message(json.dumps({"analyzed_urls": 1, "potential_clients": []}))
+    info = CompanyInfo.from_history(history)
+    assert info.describe() == COMPANY
+    assert info.fingerprint() == CompanyInfo(description=COMPANY.upper()).fingerprint()
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+import tempfile
+from contextlib import ExitStack
+from typing import Any, Awaitable, Callable, Iterator
+
+import httpx
+import pytest
+
+# The modules of the app are imported from the back directory, as uvicorn does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FakeApifyClientAsync, FakeChatCompletionServer, SMTPSink, configure_environment  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def loop() -> Iterator[asyncio.AbstractEventLoop]:
+    """One event loop for every test driving the app, whose locks and pools are bound to it."""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def run(loop: asyncio.AbstractEventLoop) -> Callable[[Awaitable[Any]], Any]:
+    return loop.run_until_complete
+
+
+_fakes = ExitStack()
+
+
+def pytest_configure(config) -> None:
+    # The caches and stores are created when their modules are imported, so the environment points
+    # at the fakes and at an empty data directory before any test module is collected
+    data_dir = _fakes.enter_context(tempfile.TemporaryDirectory())
+    config.fake_llm = _fakes.enter_context(FakeChatCompletionServer())
+    config.fake_smtp = _fakes.enter_context(SMTPSink())
+    configure_environment(config.fake_llm, config.fake_smtp, data_dir)
+
+
+def pytest_unconfigure(config) -> None:
+    _fakes.close()
+
+
+@pytest.fixture(scope="session")
+def llm(pytestconfig) -> FakeChatCompletionServer:
+    return pytestconfig.fake_llm
+
+
+@pytest.fixture(scope="session")
+def app_module(llm: FakeChatCompletionServer, run) -> Iterator[Any]:
+    """The app, running against the fake Azure OpenAI, Apify and SMTP backends."""
+    import main
+
+    main.linkedin_extractor.client = FakeApifyClientAsync(run_latency=0.0, per_url_latency=0.0)
+    main.runtimes.transport = llm.transport()
+    run(main.warm_up())
+    yield main
+    run(main.jobs.close())
+    run(main.email_engine.close())
+    run(main.runtimes.close())
+
+
+@pytest.fixture
+def client(app_module: Any, run) -> Iterator[httpx.AsyncClient]:
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_module.app), base_url="http://test", timeout=60)
+    yield client
+    run(client.aclose())
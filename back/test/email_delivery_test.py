@@ -0,0 +1,45 @@
+import asyncio
+
+from email_delivery import EmailDeliveryEngine, SMTPSettings
+from fakes import SMTPSink
+
+
+def engine(sink: SMTPSink) -> EmailDeliveryEngine:
+    settings = SMTPSettings(server=sink.host, port=sink.port, sender="test@example.com", starttls=False)
+    return EmailDeliveryEngine(settings=settings, pool_size=2, rate_per_second=0, connection_rate_per_second=0)
+
+
+def test_transient_failures_are_retried_and_duplicates_sent_once():
+    async def scenario(sink):
+        delivery = engine(sink)
+        job = delivery.submit("Hello", "Body", ["a@example.com", "b@example.com", " a@example.com ", "c@example.com", ""])
+        await delivery.wait(job.id)
+        await delivery.close()
+        return job.to_dict()
+
+    # Every second message is answered with a transient 421
+    with SMTPSink(fail_every=2) as sink:
+        report = asyncio.run(scenario(sink))
+        # Three accepted messages and the two refused between them
+        assert sink.received == 5
+    assert report["status"] == "completed"
+    assert sorted(report["recipients"]) == ["a@example.com", "b@example.com", "c@example.com"]
+    assert sum(recipient["attempts"] for recipient in report["recipients"].values()) == 5
+
+
+def test_drafted_recipients_are_sent_their_own_email_or_failed():
+    async def scenario(sink):
+        delivery = engine(sink)
+        job = delivery.submit("Fallback", "", ["a@example.com", "b@example.com"], drafted=True)
+        delivery.provide_draft(job, "a@example.com", "For Ada", "Hello Ada")
+        delivery.fail_draft(job, "The writer is unavailable", "b@example.com")
+        await delivery.wait(job.id)
+        await delivery.close()
+        return job.to_dict()
+
+    with SMTPSink() as sink:
+        report = asyncio.run(scenario(sink))
+        assert sink.received == 1
+    assert report["status"] == "partial"
+    assert report["recipients"]["a@example.com"]["status"] == "sent"
+    assert report["recipients"]["b@example.com"] == {"status": "failed", "attempts": 0, "error": "The writer is unavailable"}
@@ -0,0 +1,23 @@
+import asyncio
+from types import SimpleNamespace
+
+from email_drafting import EmailDrafter
+
+
+class UnavailableWriter:
+    name = "writer_agent"
+
+    async def invoke_stream(self, messages):
+        raise ConnectionError("The writer is unavailable")
+        yield
+
+
+def test_failed_draft_names_its_recipient():
+    async def scenario():
+        drafter = EmailDrafter(SimpleNamespace(writer_agent=UnavailableWriter()))
+        clients = [{"url": "https://www.linkedin.com/in/ada", "email": "ada@example.com"}]
+        return [draft async for draft in drafter.draft_all("Contoso", clients)]
+
+    [draft] = asyncio.run(scenario())
+    assert draft["to"] == "ada@example.com"
+    assert "unavailable" in draft["error"]
@@ -0,0 +1,472 @@
+"""Local stand-ins for Azure OpenAI, Apify and SMTP, shared by the tests and the benchmarks."""
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+
+INDUSTRIES = ["Information Technology", "Financial Services", "Hospital & Health Care", "E-Learning", "Retail"]
+TITLES = ["CTO", "IT Director", "Technical Project Manager", "Software Engineer", "Marketing Manager"]
+SKILLS = ["Cloud Computing", "DevOps", "Kubernetes", "Python", "Security", "Leadership", "Sales", "SQL"]
+
+
+def fake_profile(url: str) -> Dict[str, Any]:
+    """Deterministic Apify-like dataset item for a LinkedIn URL."""
+    seed = int(hashlib.sha256(url.encode()).hexdigest(), 16)
+    slug = url.rstrip("/").rsplit("/", 1)[-1]
+    return {
+        "linkedinUrl": url,
+        "firstName": slug.split("-")[0].title(),
+        "lastName": f"Doe{seed % 1000}",
+        "headline": f"{TITLES[seed % len(TITLES)]} at Company {seed % 97}",
+        "jobTitle": TITLES[seed % len(TITLES)],
+        "companyName": f"Company {seed % 97}",
+        "companyIndustry": INDUSTRIES[seed % len(INDUSTRIES)],
+        "currentJobDuration": f"{seed % 9 + 1} yrs",
+        "topSkillsByEndorsements": ", ".join(SKILLS[(seed + i) % len(SKILLS)] for i in range(3)),
+        "experiences": [
+            {"title": TITLES[(seed + i) % len(TITLES)], "companyName": f"Company {(seed + i) % 97}", "description": "x" * 200}
+            for i in range(seed % 6 + 1)
+        ],
+        "skills": [{"title": SKILLS[(seed + i) % len(SKILLS)]} for i in range(seed % 8 + 1)],
+    }
+
+
+def fake_profile_urls(count: int, offset: int = 0) -> List[str]:
+    return [f"https://www.linkedin.com/in/user-{i}/" for i in range(offset, offset + count)]
+
+
+class _FakeActor:
+    def __init__(self, backend: "FakeApifyClientAsync"):
+        self.backend = backend
+
+    async def call(self, run_input: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        urls = (run_input or {}).get("profileUrls", [])
+        backend = self.backend
+        backend.calls += 1
+        backend.running += 1
+        backend.max_running = max(backend.max_running, backend.running)
+        try:
+            await asyncio.sleep(backend.run_latency + backend.per_url_latency * len(urls))
+        finally:
+            backend.running -= 1
+        dataset_id = f"dataset-{next(backend._ids)}"
+        backend.datasets[dataset_id] = [fake_profile(url) for url in urls]
+        return {"id": dataset_id.replace("dataset", "run"), "status": "SUCCEEDED", "defaultDatasetId": dataset_id}
+
+
+class _FakeDataset:
+    def __init__(self, backend: "FakeApifyClientAsync", dataset_id: str):
+        self.backend = backend
+        self.dataset_id = dataset_id
+
+    async def iterate_items(self, **kwargs):
+        for item in self.backend.datasets.pop(self.dataset_id, []):
+            if self.backend.item_latency:
+                await asyncio.sleep(self.backend.item_latency)
+            yield item
+
+
+class FakeApifyClientAsync:
+    """In-process stand-in for ``ApifyClientAsync`` with configurable actor run latency."""
+
+    def __init__(self, run_latency: float = 0.5, per_url_latency: float = 0.01, item_latency: float = 0.0):
+        self.run_latency = run_latency
+        self.per_url_latency = per_url_latency
+        self.item_latency = item_latency
+        self.datasets: Dict[str, List[Dict[str, Any]]] = {}
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._ids = itertools.count(1)
+
+    def actor(self, actor_id: str) -> _FakeActor:
+        return _FakeActor(self)
+
+    def dataset(self, dataset_id: str) -> _FakeDataset:
+        return _FakeDataset(self, dataset_id)
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        sink: SMTPSink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        self.reply("220 sink ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 sink")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                if sink.latency:
+                    time.sleep(sink.latency)
+                with sink.lock:
+                    sink.received += 1
+                    fail = sink.fail_every and sink.received % sink.fail_every == 0
+                if fail:
+                    self.reply("421 Try again later")
+                    return
+                self.reply("250 Queued")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+class SMTPSink:
+    """Local SMTP server that accepts and discards mail, for offline delivery benchmarks.
+
+    ``latency`` delays every accepted message and ``fail_every`` answers every n-th message with a
+    transient 421 and drops the connection.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, fail_every: int = 0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.received = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer((host, port), _SMTPSinkHandler)
+        self.server.daemon_threads = True
+        self.server.sink = self
+        self.host, self.port = self.server.server_address
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "SMTPSink":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _user_request(messages: List[Dict[str, Any]]) -> Any:
+    """The last user message, decoded when it is JSON."""
+    content = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content
+
+
+def _request_urls(request: Any) -> List[str]:
+    if not isinstance(request, dict):
+        return []
+    if request.get("linkedin_urls"):
+        return request["linkedin_urls"]
+    return [profile.get("linkedinUrl") for profile in request.get("profiles") or []]
+
+
+def fake_tool_call(body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Tool call the agent chain would make next, or None once the tool answered.
+
+    Requests to analyze LinkedIn URLs call the scraping function when it is offered, and otherwise
+    hand the request on to the first agent offered as a tool, as the coordinator does.
+    """
+    messages = body.get("messages") or []
+    tools = [tool["function"] for tool in body.get("tools") or [] if tool.get("type") == "function"]
+    if not tools or (messages and messages[-1].get("role") == "tool"):
+        return None
+    request = _user_request(messages)
+    if not isinstance(request, dict) or not request.get("linkedin_urls"):
+        return None
+    for tool in tools:
+        if "linkedinUrls" in (tool.get("parameters") or {}).get("properties", {}):
+            return {"name": tool["name"], "arguments": json.dumps({"linkedinUrls": request["linkedin_urls"]})}
+    return {"name": tools[0]["name"], "arguments": json.dumps({"messages": json.dumps(request)})}
+
+
+def fake_chat_reply(messages: List[Dict[str, Any]]) -> str:
+    """Answer of the fake chat completion service, shaped like the answers of the app's agents."""
+    request = _user_request(messages)
+    urls = _request_urls(request)
+    if urls:
+        results = []
+        for url in urls:
+            seed = int(hashlib.sha256(url.encode()).hexdigest(), 16)
+            results.append({
+                "url": url,
+                "analysis": {
+                    "role": TITLES[seed % len(TITLES)],
+                    "company": f"Company {seed % 97}",
+                    "industry": INDUSTRIES[seed % len(INDUSTRIES)],
+                    "seniority": "senior" if seed % 2 else "mid",
+                    "relevant_skills": [SKILLS[(seed + i) % len(SKILLS)] for i in range(2)],
+                },
+                "potential_match": seed % 3 == 0,
+                "match_reason": "The role and industry fit the target profile." if seed % 3 == 0 else "Outside the target profile.",
+            })
+        return json.dumps({
+            "status": "complete",
+            "current_batch": 1,
+            "total_batches": 1,
+            "processed_urls": len(urls),
+            "total_urls": len(urls),
+            "results": results,
+            "errors": [],
+        })
+    if isinstance(request, dict) and request.get("action") == "generate_email":
+        return json.dumps({
+            "action": "send_email",
+            "to": "",
+            "subject": "You're Invited to Our Event!",
+            "body": "Hello,\n\nGiven your experience we would love to see you at our event.\n\nBest regards",
+        })
+    return "Thanks! I saved your company information. Send me the LinkedIn URLs of your invitees when you are ready."
+
+
+class _ChatCompletionsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def respond(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def stream(
+        self,
+        number: int,
+        text: str,
+        usage: Optional[Dict[str, int]],
+        tokens_per_second: float,
+        tool_call: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        # Server-sent events until the connection closes, the way the SDK reads streamed completions
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def event(choices: List[Dict[str, Any]], **extra: Any) -> None:
+            chunk = {
+                "id": f"chatcmpl-{number}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "fake",
+                "choices": choices,
+                **extra,
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        if tool_call:
+            delta = {"tool_calls": [{"index": 0, "id": f"call_{number}", "type": "function", "function": tool_call}]}
+            event([{"index": 0, "delta": delta, "finish_reason": None}])
+        # About four characters per token, sent a few tokens at a time
+        step = 16
+        for start in range(0, len(text), step):
+            if tokens_per_second:
+                time.sleep(step / 4 / tokens_per_second)
+            event([{"index": 0, "delta": {"content": text[start:start + step]}, "finish_reason": None}])
+        event([{"index": 0, "delta": {}, "finish_reason": "tool_calls" if tool_call else "stop"}])
+        if usage:
+            event([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def do_POST(self) -> None:
+        server: FakeChatCompletionServer = self.server.fake
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.requests += 1
+            number = server.requests
+            down = server.down
+        if down:
+            server.count("unavailable")
+            self.respond(503, {"error": {"code": "ServiceUnavailable", "message": "The service is down."}})
+            return
+        if server.throttle_every and number % server.throttle_every == 0:
+            server.count("throttled")
+            self.respond(
+                429,
+                {"error": {"code": "429", "message": "Rate limit exceeded."}},
+                {"retry-after-ms": str(int(server.retry_after * 1000)), "retry-after": str(max(1, round(server.retry_after)))},
+            )
+            return
+        if server.fail_every and number % server.fail_every == 0:
+            server.count("failed")
+            self.respond(500, {"error": {"code": "InternalServerError", "message": "Something went wrong."}})
+            return
+        slow = server.slow_every and number % server.slow_every == 0
+        time.sleep(server.slow_latency if slow else server.latency)
+
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            body = {}
+        messages = body.get("messages") or []
+        tool_call = fake_tool_call(body) if server.call_tools else None
+        text = "" if tool_call else server.reply(messages)
+        prompt_tokens = max(1, len(json.dumps(messages)) // 4)
+        completion_tokens = max(1, len(json.dumps(tool_call) if tool_call else text) // 4)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        with server.lock:
+            server.prompt_tokens += prompt_tokens
+            server.completion_tokens += completion_tokens
+        server.count("succeeded")
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            self.stream(number, text, usage if include_usage else None, server.tokens_per_second, tool_call)
+            return
+        if server.tokens_per_second:
+            time.sleep(completion_tokens / server.tokens_per_second)
+        message: Dict[str, Any] = {"role": "assistant", "content": text or None}
+        if tool_call:
+            message["tool_calls"] = [{"id": f"call_{number}", "type": "function", "function": tool_call}]
+        self.respond(200, {
+            "id": f"chatcmpl-{number}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "fake",
+            "choices": [{"index": 0, "finish_reason": "tool_calls" if tool_call else "stop", "message": message}],
+            "usage": usage,
+        })
+
+
+class RedirectTransport(httpx.AsyncBaseTransport):
+    """Sends every request to ``base_url`` instead of its own host, so SDKs that insist on https
+    endpoints can talk to a local fake."""
+
+    def __init__(self, base_url: str):
+        self.base_url = httpx.URL(base_url)
+        self.transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.url = request.url.copy_with(
+            scheme=self.base_url.scheme, host=self.base_url.host, port=self.base_url.port
+        )
+        request.headers["host"] = self.base_url.netloc.decode()
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class FakeChatCompletionServer:
+    """Local HTTP server answering Azure OpenAI chat completion requests, for offline benchmarks and resilience tests.
+
+    Answers come from ``reply`` (``fake_chat_reply`` by default) after ``latency`` seconds, and are
+    streamed at ``tokens_per_second`` (0 = as fast as possible) when the request asks for a stream.
+    With ``call_tools``, analysis requests that offer tools get the tool calls of ``fake_tool_call``
+    first, so the agent chain makes the same round trips as against the real service.
+    Every ``throttle_every``-th request gets a 429 with ``Retry-After``, every ``fail_every``-th a 500,
+    every ``slow_every``-th takes ``slow_latency`` instead of ``latency`` seconds, and while ``down`` is
+    set every request gets a 503.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        throttle_every: int = 0,
+        retry_after: float = 0.2,
+        fail_every: int = 0,
+        slow_every: int = 0,
+        slow_latency: float = 1.0,
+        reply: Callable[[List[Dict[str, Any]]], str] = fake_chat_reply,
+        call_tools: bool = True,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.fail_every = fail_every
+        self.slow_every = slow_every
+        self.slow_latency = slow_latency
+        self.reply = reply
+        self.call_tools = call_tools
+        self.down = False
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.outcomes: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), _ChatCompletionsHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.host, self.port = self.server.server_address
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://{self.host}:{self.port}/"
+
+    def transport(self) -> RedirectTransport:
+        """Transport that sends requests for any Azure OpenAI endpoint to this server."""
+        return RedirectTransport(self.endpoint)
+
+    @property
+    def url(self) -> str:
+        return f"{self.endpoint}openai/deployments/fake/chat/completions"
+
+    def count(self, outcome: str) -> None:
+        with self.lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def __enter__(self) -> "FakeChatCompletionServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Connection string in the format the Azure AI project client parses; nothing is called with it
+FAKE_CONNECTION_STRING = "localhost;00000000-0000-0000-0000-000000000000;bench;bench"
+
+
+def configure_environment(llm: FakeChatCompletionServer, sink: SMTPSink, data_dir: str) -> None:
+    """Point the app at the fakes and at empty caches, before it is imported."""
+    os.environ.update({
+        # The chat services only accept https endpoints; the runtime's transport sends the requests to the fake
+        "AZURE_OPENAI_ENDPOINT": "https://fake.openai.azure.com/",
+        "AZURE_OPENAI_API_KEY": "bench",
+        "AZURE_OPENAI_CHAT_DEPLOYMENT_NAME": "fake",
+        "AZURE_OPENAI_API_VERSION": "2024-10-21",
+        "PROJECT_CONNECTION_STRING": FAKE_CONNECTION_STRING,
+        "APIFY_API_KEY": "bench",
+        "SMTP_SERVER": sink.host,
+        "SMTP_PORT": str(sink.port),
+        "SMTP_STARTTLS": "false",
+        "SMTP_SENDER": "bench@example.com",
+        "SMTP_PASSWORD": "",
+        "PROFILE_CACHE_PATH": os.path.join(data_dir, "profile_cache.db"),
+        "ANALYSIS_CACHE_PATH": os.path.join(data_dir, "analysis_cache.db"),
+        "LEAD_INDEX_PATH": os.path.join(data_dir, "lead_index.db"),
+        "STATE_STORE": "memory",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
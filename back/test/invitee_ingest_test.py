@@ -0,0 +1,53 @@
+import io
+
+import pytest
+from openpyxl import Workbook
+
+from invitee_ingest import InviteeFileError, ingest_invitees
+
+ROWS = [
+    ("Ada", "Ada@Example.com ", "https://www.linkedin.com/in/ada/"),
+    ("Ada again", "ada2@example.com", "http://WWW.linkedin.com/in/ada?trk=1"),
+    ("Bob", "not an email", "www.linkedin.com/in/bob"),
+    ("Carol", "", "https://example.com/carol"),
+    ("Dan", "ada@example.com", "https://www.linkedin.com/in/dan"),
+    ("Eve", "", "https://www.linkedin.com/in/eve"),
+]
+
+EXPECTED = [
+    {"name": "Ada", "email": "ada@example.com", "linkedinUrl": "https://www.linkedin.com/in/ada"},
+    {"name": "Bob", "email": "", "linkedinUrl": "https://www.linkedin.com/in/bob"},
+    {"name": "Eve", "email": "", "linkedinUrl": "https://www.linkedin.com/in/eve"},
+]
+
+
+def csv_file() -> io.BytesIO:
+    lines = ["﻿Email,LinkedIn_URL,Name,Company"] + [f"{email},{url},{name},Contoso" for name, email, url in ROWS]
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def xlsx_file() -> io.BytesIO:
+    workbook = Workbook()
+    workbook.active.append(["name", "email", "linkedin_url"])
+    for row in ROWS:
+        workbook.active.append(row)
+    file = io.BytesIO()
+    workbook.save(file)
+    file.seek(0)
+    return file
+
+
+@pytest.mark.parametrize("chunk_rows", [2, 100])
+@pytest.mark.parametrize("filename,file", [("invitees.csv", csv_file), ("invitees.xlsx", xlsx_file)])
+def test_repeated_urls_and_emails_are_skipped_across_chunks(filename, file, chunk_rows):
+    invitees, report = ingest_invitees(file(), filename, chunk_rows=chunk_rows)
+    assert invitees == EXPECTED
+    assert report.to_dict()["rows"] == 6
+    assert (report.invitees, report.duplicates, report.invalid) == (3, 2, 1)
+
+
+def test_files_without_the_required_columns_are_rejected():
+    with pytest.raises(InviteeFileError, match="missing linkedin_url"):
+        ingest_invitees(io.BytesIO(b"name,email\nAda,ada@example.com\n"), "invitees.csv")
+    with pytest.raises(InviteeFileError, match="Only .csv and .xlsx"):
+        ingest_invitees(io.BytesIO(b""), "invitees.txt")
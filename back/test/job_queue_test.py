@@ -0,0 +1,66 @@
+import asyncio
+
+import job_queue
+from job_queue import JOBS, JobQueue
+from state_store import InMemoryStateStore
+
+
+def test_job_of_a_stopped_worker_is_reported_failed(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(job_queue.time, "time", lambda: now[0])
+
+    async def scenario():
+        store = InMemoryStateStore()
+        worker = JobQueue(store, save_interval=0.01, lease_seconds=30)
+        other = JobQueue(store, save_interval=0.01, lease_seconds=30)
+        release = asyncio.Event()
+
+        async def run(job):
+            await release.wait()
+            return "done"
+
+        running = await worker.submit("test", "key", run, tenant="acme")
+        await asyncio.sleep(0.05)
+        # The running worker's heartbeats keep the job alive for the others
+        now[0] += 25
+        await asyncio.sleep(0.05)
+        now[0] += 25
+        assert (await other.get(running.id)).status == "running"
+
+        # A worker that died leaves a record nobody saves anymore
+        stopped = await worker.submit("test", "key", run, tenant="acme")
+        await asyncio.sleep(0.05)
+        record = store.get(JOBS, stopped.id)
+        await worker.close()
+        store.set(JOBS, stopped.id, record)
+        now[0] += 31
+        job = await other.get(stopped.id)
+        assert job.status == "failed" and job.tenant == "acme"
+        assert store.get(JOBS, stopped.id)["status"] == "failed"
+        assert not await other.cancel(stopped.id)
+
+    asyncio.run(scenario())
+
+
+def test_finished_jobs_behind_a_running_one_are_forgotten():
+    async def scenario():
+        store = InMemoryStateStore()
+        queue = JobQueue(store, max_jobs=2)
+        release = asyncio.Event()
+
+        async def blocked(job):
+            await release.wait()
+
+        async def quick(job):
+            return "done"
+
+        running = await queue.submit("test", "blocked", blocked)
+        finished = [await queue.submit("test", f"quick-{i}", quick) for i in range(3)]
+        await asyncio.sleep(0.05)
+        assert running.id in queue.jobs
+        assert [job.id for job in finished if job.id in queue.jobs] == [finished[-1].id]
+        assert store.get(JOBS, finished[0].id) is None
+        release.set()
+        await queue.close()
+
+    asyncio.run(scenario())
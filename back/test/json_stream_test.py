@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from json_stream import IncrementalJSONParser, parse_agent_json
+
+RESPONSE = {
+    "results": [
+        {"url": "https://www.linkedin.com/in/a", "score": 8, "reason": "Buys {cloud} \"services\", [often]"},
+        {"url": "https://www.linkedin.com/in/b", "score": 3, "reason": "Student\\intern"},
+    ],
+    "summary": {"potential_clients": 1},
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1000])
+def test_results_are_returned_as_soon_as_they_are_closed(chunk_size):
+    text = "Here is the analysis:\n```json\n" + json.dumps(RESPONSE) + "\n```\nAnything else?"
+    parser = IncrementalJSONParser()
+    streamed = []
+    for i in range(0, len(text), chunk_size):
+        streamed.extend(parser.feed(text[i:i + chunk_size]))
+        if chunk_size < 1000 and not streamed:
+            # Nothing is returned before the first result's closing brace
+            assert i < text.index("}, {")
+    assert streamed == RESPONSE["results"]
+    assert parser.document() == RESPONSE
+    assert not parser.unclosed
+
+
+def test_document_is_the_first_complete_object():
+    assert parse_agent_json('Sure {not json} then {"results": []} and {"other": 1}') == {"results": []}
+    with pytest.raises(ValueError):
+        parse_agent_json("No json here [1, 2]")
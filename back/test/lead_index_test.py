@@ -0,0 +1,44 @@
+from fakes import fake_profile
+from lead_index import LeadIndex
+
+ADA = "https://www.linkedin.com/in/ada"
+BOB = "https://www.linkedin.com/in/bob"
+
+
+def index(tmp_path) -> LeadIndex:
+    leads = LeadIndex(str(tmp_path / "leads.db"))
+    ada = {**fake_profile(ADA), "headline": "Cloud architect", "companyIndustry": "Retail"}
+    bob = {**fake_profile(BOB), "headline": "Sales lead", "companyIndustry": "Retail"}
+    # Scraped twice, for two events; the profile is kept once
+    leads.put_profiles([ada, bob, {**ada, "linkedinUrl": ADA + "/"}])
+    leads.put_results("acme", "contoso", [
+        {"url": ADA, "potential_match": True, "match_reason": "Buys cloud services"},
+        {"url": BOB + "/", "potential_match": False, "match_reason": "Sells"},
+    ])
+    leads.put_results("globex", "globex", [{"url": BOB, "potential_match": True}])
+    return leads
+
+
+def test_leads_are_kept_once_and_only_found_by_their_tenant(tmp_path):
+    leads = index(tmp_path)
+    assert leads.stats()["leads"] == 2
+    assert [lead["url"] for lead in leads.query("acme", potential_match=True)] == [ADA]
+    assert [lead["url"] for lead in leads.query("globex")] == [BOB]
+    assert leads.get("globex", ADA) is None
+    assert [analysis["match_reason"] for analysis in leads.get("acme", ADA + "/")["analyses"]] == ["Buys cloud services"]
+
+
+def test_leads_are_filtered_by_column_and_text(tmp_path):
+    leads = index(tmp_path)
+    assert {lead["url"] for lead in leads.query("acme", industry="retail")} == {ADA, BOB}
+    assert [lead["url"] for lead in leads.query("acme", text="architect")] == [ADA]
+    assert leads.query("acme", text='"unbalanced') == []
+    assert leads.query("acme", company_key="globex") == []
+
+
+def test_known_results_are_scoped_to_tenant_company_and_age(tmp_path):
+    leads = index(tmp_path)
+    assert set(leads.known_results("acme", "contoso", [ADA + "/", BOB, "https://www.linkedin.com/in/eve"])) == {ADA, BOB}
+    assert leads.known_results("acme", "globex", [BOB]) == {}
+    leads.max_age_seconds = -1
+    assert leads.known_results("acme", "contoso", [ADA]) == {}
@@ -0,0 +1,39 @@
+import asyncio
+
+from fakes import FakeApifyClientAsync, fake_profile, fake_profile_urls
+from linkedin_extraction import ExtractionProgress, LinkedInExtractor
+from profile_cache import ProfileCache
+
+
+def test_profiles_are_scraped_in_concurrent_batches():
+    async def scenario():
+        client = FakeApifyClientAsync(run_latency=0.05, per_url_latency=0.0)
+        extractor = LinkedInExtractor(client, batch_size=3, max_concurrency=2)
+        urls = fake_profile_urls(10)
+        progress = ExtractionProgress()
+        profiles = await extractor.extract(urls, progress=progress)
+        return client, urls, progress, profiles
+
+    client, urls, progress, profiles = asyncio.run(scenario())
+    assert sorted(profile["linkedinUrl"] for profile in profiles) == urls
+    assert client.calls == 4 and client.max_running == 2
+    assert (progress.total_batches, progress.processed_urls, progress.errors) == (4, 10, [])
+
+
+def test_consumer_stopping_during_cached_profiles_releases_its_scrapes(tmp_path):
+    async def scenario():
+        cache = ProfileCache(str(tmp_path / "profiles.db"))
+        urls = fake_profile_urls(4)
+        cache.put_many([fake_profile(url) for url in urls[:2]])
+        extractor = LinkedInExtractor(FakeApifyClientAsync(run_latency=0.0, per_url_latency=0.0), cache=cache)
+
+        stream = extractor.stream(urls)
+        assert (await stream.__anext__())["linkedinUrl"] == urls[0]
+        await stream.aclose()
+        assert extractor.in_flight.stats()["in_flight"] == 0
+
+        # The next caller scrapes the misses instead of waiting for the stopped one
+        profiles = await asyncio.wait_for(extractor.extract(urls), 5)
+        assert sorted(profile["linkedinUrl"] for profile in profiles) == urls
+
+    asyncio.run(scenario())
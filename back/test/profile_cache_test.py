@@ -0,0 +1,30 @@
+import asyncio
+
+from fakes import FakeApifyClientAsync, fake_profile, fake_profile_urls
+from linkedin_extraction import LinkedInExtractor
+from profile_cache import ProfileCache, normalize_profile_url
+
+
+def test_url_variants_share_one_entry(tmp_path):
+    cache = ProfileCache(str(tmp_path / "profiles.db"))
+    cache.put_many([fake_profile("https://www.linkedin.com/in/ada/")])
+    variants = ["http://WWW.LinkedIn.com/in/Ada", "www.linkedin.com/in/ada/?utm_source=share#about"]
+    assert {normalize_profile_url(url) for url in variants} == {"https://www.linkedin.com/in/ada"}
+    assert list(ProfileCache(str(tmp_path / "profiles.db")).get_many(variants)) == ["https://www.linkedin.com/in/ada"]
+
+
+def test_cached_profiles_are_not_scraped_again(tmp_path):
+    async def scenario():
+        urls = fake_profile_urls(5)
+        first = FakeApifyClientAsync(run_latency=0.0, per_url_latency=0.0)
+        await LinkedInExtractor(first, cache=ProfileCache(str(tmp_path / "profiles.db"))).extract(urls[:3])
+
+        # A restarted worker finds them on disk and only scrapes the rest
+        second = FakeApifyClientAsync(run_latency=0.0, per_url_latency=0.0)
+        extractor = LinkedInExtractor(second, batch_size=2, cache=ProfileCache(str(tmp_path / "profiles.db")))
+        profiles = await extractor.extract(urls)
+        return urls, profiles, second
+
+    urls, profiles, second = asyncio.run(scenario())
+    assert sorted(profile["linkedinUrl"] for profile in profiles) == urls
+    assert second.calls == 1
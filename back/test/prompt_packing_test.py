@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from json_stream import IncrementalJSONParser, TruncatedJSONError
+from prompt_packing import PromptPacker, is_truncation_error
+
+
+def parse(text: str) -> IncrementalJSONParser:
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    return parser
+
+
+def test_only_cut_off_responses_are_truncations():
+    with pytest.raises(TruncatedJSONError) as cut_off:
+        parse('{"results": [{"url": "https://www.linkedin.com/in/a", "score"').document()
+    assert is_truncation_error(cut_off.value)
+
+    with pytest.raises(ValueError) as prose:
+        parse("I could not score these profiles.").document()
+    assert not is_truncation_error(prose.value)
+    with pytest.raises(ValueError) as malformed:
+        json.loads('{"results": [1,]}')
+    assert not is_truncation_error(malformed.value)
+
+    assert is_truncation_error(RuntimeError("This model's maximum context length is 8192 tokens"))
+
+
+def test_packer_fills_batches_up_to_the_budget():
+    packer = PromptPacker(token_budget=1000, min_budget=500, max_budget=2000, step=100, target_seconds=10)
+    items = [("a", 400), ("b", 400), ("c", 400), ("d", 1500), ("e", 100)]
+    assert packer.pack(items, max_items=10) == [["a", "b"], ["c"], ["d"], ["e"]]
+    assert packer.pack(items, max_items=10, reserved=300) == [["a"], ["b"], ["c"], ["d"], ["e"]]
+    assert packer.pack(items, max_items=1) == [["a"], ["b"], ["c"], ["d"], ["e"]]
+
+
+def test_packer_budget_grows_additively_and_shrinks_multiplicatively():
+    packer = PromptPacker(token_budget=1000, min_budget=500, max_budget=1150, step=100, target_seconds=10)
+    packer.record(2, 900, 1.0)
+    assert packer.token_budget == 1100
+    packer.record(2, 900, 1.0)
+    assert packer.token_budget == 1150
+    packer.record(2, 900, 1.0, "failed")
+    assert packer.token_budget == 1150
+    packer.record(2, 900, 11.0)
+    assert packer.token_budget == 575
+    packer.record(2, 900, 1.0, "truncated")
+    assert packer.token_budget == 500
+    stats = packer.stats()
+    assert (stats["batches"], stats["slow"], stats["truncated"], stats["failed"]) == (5, 1, 1, 1)
@@ -0,0 +1,134 @@
+import asyncio
+import email.utils
+import time
+
+import httpx
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, ResilientService, retry_after
+
+
+def status_error(status: int, headers=None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://example.openai.azure.com/")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"status {status}", request=request, response=response)
+
+
+def test_retry_after_reads_seconds_milliseconds_and_dates():
+    assert retry_after(status_error(429, {"Retry-After": "3"})) == 3.0
+    assert retry_after(status_error(429, {"retry-after-ms": "250", "Retry-After": "3"})) == 0.25
+    assert retry_after(status_error(429, {"x-ms-retry-after-ms": "1500"})) == 1.5
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= retry_after(status_error(503, {"Retry-After": date})) <= 30
+    assert retry_after(status_error(500)) is None
+    assert retry_after(status_error(429, {"Retry-After": "soon"})) is None
+    assert retry_after(status_error(429, {"Retry-After": "Mon, 32 Foo"})) is None
+    # The header is found on the cause of a wrapping error
+    try:
+        try:
+            raise status_error(429, {"Retry-After": "2"})
+        except httpx.HTTPStatusError as e:
+            raise RuntimeError("The agent failed") from e
+    except RuntimeError as wrapped:
+        assert retry_after(wrapped) == 2.0
+
+
+def test_breaker_opens_after_consecutive_failures_and_lets_one_trial_through(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.check("llm")
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError) as opened:
+        breaker.check("llm")
+    assert opened.value.retry_after == 10
+
+    now[0] += 10
+    breaker.check("llm")
+    assert breaker.state == "half_open"
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.check("llm")
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opens == 2
+
+    now[0] += 10
+    breaker.check("llm")
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_service_waits_as_long_as_retry_after_asks(monkeypatch):
+    delays = []
+    sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", fake_sleep)
+    service = ResilientService("test", max_retries=3, max_delay=5, breaker_failures=2, hedge_after_seconds=0)
+    errors = [status_error(429, {"Retry-After": "2"}), status_error(429, {"Retry-After": "60"})]
+
+    async def operation():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert asyncio.run(service.call(operation)) == "ok"
+    # Capped at max_delay; throttling does not open the breaker
+    assert delays == [2.0, 5]
+    stats = service.stats()
+    assert stats["retries"] == 2 and stats["throttled"] == 2 and stats["breaker"] == "closed"
+
+
+def test_service_short_circuits_while_the_breaker_is_open(monkeypatch):
+    async def fake_sleep(delay):
+        pass
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", fake_sleep)
+    service = ResilientService("test", max_retries=5, breaker_failures=2, breaker_reset_seconds=30, hedge_after_seconds=0)
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        raise status_error(503)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(service.call(operation))
+    assert len(calls) == 2
+    assert service.stats()["breaker"] == "open" and service.stats()["short_circuited"] == 1
+
+
+def test_cancelled_half_open_trial_lets_the_next_call_through(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    service = ResilientService("test", max_retries=0, breaker_failures=1, breaker_reset_seconds=10, hedge_after_seconds=0)
+
+    async def failing():
+        raise status_error(503)
+
+    async def hanging():
+        await asyncio.Event().wait()
+
+    async def succeeding():
+        return "ok"
+
+    async def scenario():
+        with pytest.raises(httpx.HTTPStatusError):
+            await service.call(failing)
+        assert service.breaker.state == "open"
+        now[0] += 10
+        trial = asyncio.create_task(service.call(hanging))
+        await asyncio.sleep(0)
+        assert service.breaker.state == "half_open"
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        assert await service.call(succeeding) == "ok"
+        assert service.breaker.state == "closed"
+
+    asyncio.run(scenario())
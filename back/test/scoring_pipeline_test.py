@@ -0,0 +1,98 @@
+import json
+
+from fakes import fake_profile_urls
+
+COMPANY = "We are Contoso, a cloud consultancy looking for IT decision makers."
+
+
+def test_overlapping_list_in_one_session_is_answered_from_the_analysis_cache(app_module, client, llm, run, monkeypatch):
+    # Without the lead index, a re-run can only be answered by the analysis cache
+    monkeypatch.setattr(app_module, "lead_index", None)
+    session = "rerun"
+    urls = fake_profile_urls(10, offset=900)
+
+    assert run(client.post("/chat/", json={"session_id": session, "message": COMPANY})).status_code == 200
+
+    async def host_passes_on_the_company():
+        async with app_module.sessions.session(session) as chat_history:
+            chat_history.add_assistant_message(json.dumps({
+                "action": "analyze_profiles", "company_description": COMPANY, "linkedin_urls": urls,
+            }))
+
+    run(host_passes_on_the_company())
+    first = run(client.post("/process_invitees/", json={"session_id": session, "linkedin_urls": urls, "mode": "direct"}))
+    assert first.status_code == 200
+    # A chat turn between the runs must not change the company the profiles are scored for
+    assert run(client.post("/chat/", json={"session_id": session, "message": "Thanks, what next?"})).status_code == 200
+
+    hits = app_module.analysis_cache.stats()["hits"]
+    requests = llm.requests
+    rerun = run(client.post("/process_invitees/", json={"session_id": session, "linkedin_urls": urls[5:], "mode": "direct"}))
+    assert rerun.status_code == 200
+    assert rerun.json()["errors"] == []
+    assert app_module.analysis_cache.stats()["hits"] - hits == 5
+    assert llm.requests == requests
+
+    # Only the profiles not analyzed yet cost a model call
+    overlapping = urls[5:] + fake_profile_urls(5, offset=950)
+    requests = llm.requests
+    response = run(client.post("/process_invitees/", json={"session_id": session, "linkedin_urls": overlapping, "mode": "direct"}))
+    assert response.status_code == 200
+    assert llm.requests - requests == 1
+
+
+def test_results_are_recorded_under_the_requested_urls(tmp_path, run):
+    from analysis_cache import company_fingerprint
+    from lead_index import LeadIndex
+    from scoring_pipeline import ProfileScoringPipeline
+
+    index = LeadIndex(str(tmp_path / "leads.db"))
+    pipeline = ProfileScoringPipeline(None, mode="agents", lead_index=index, tenant_id="acme", max_retries=0)
+    urls = ["https://www.linkedin.com/in/ada", "https://www.linkedin.com/in/bob"]
+
+    async def score_chunk(company_description, chunk, on_result=None):
+        # The model echoes the URLs back in its own spelling, and makes one up
+        return [
+            {"url": "HTTP://www.LinkedIn.com/in/ADA/?trk=x", "potential_match": True},
+            {"url": "https://www.linkedin.com/in/carol", "potential_match": True},
+        ]
+
+    pipeline.score_chunk = score_chunk
+    summary = run(pipeline.run(COMPANY, urls))
+    assert [result["url"] for result in summary["results"]] == ["https://www.linkedin.com/in/ada"]
+    assert summary["errors"] == [{"urls": ["https://www.linkedin.com/in/bob"], "error": "The response has no result for these profiles."}]
+    assert list(index.known_results("acme", company_fingerprint(COMPANY), urls + ["https://www.linkedin.com/in/carol"])) == [
+        "https://www.linkedin.com/in/ada"
+    ]
+
+
+def test_consumer_failing_on_a_cached_result_releases_its_analyses(tmp_path, run):
+    from analysis_cache import company_fingerprint
+    from lead_index import LeadIndex
+    from scoring_pipeline import ProfileScoringPipeline
+    from single_flight import SingleFlight
+
+    index = LeadIndex(str(tmp_path / "leads.db"))
+    urls = ["https://www.linkedin.com/in/ada", "https://www.linkedin.com/in/bob"]
+    index.put_results("acme", company_fingerprint(COMPANY), [{"url": urls[0], "potential_match": True}])
+    flights = SingleFlight("analysis")
+    pipeline = ProfileScoringPipeline(None, mode="agents", lead_index=index, tenant_id="acme", in_flight=flights)
+
+    async def on_result(result):
+        raise ConnectionResetError("The client went away")
+
+    try:
+        run(pipeline.run(COMPANY, urls, on_result=on_result))
+    except ConnectionResetError:
+        pass
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_agents_are_the_default_scoring_mode(monkeypatch):
+    from scoring_pipeline import ProfileScoringPipeline
+
+    monkeypatch.delenv("SCORING_MODE", raising=False)
+    assert ProfileScoringPipeline(None).mode == "agents"
+    monkeypatch.setenv("SCORING_MODE", "direct")
+    assert ProfileScoringPipeline(None, extractor=object()).mode == "direct"
+    assert ProfileScoringPipeline(None, mode="agents").mode == "agents"
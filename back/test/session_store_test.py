@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+import session_store
+import state_store
+from session_store import SessionBusyError, SessionManager
+from state_store import InMemoryStateStore
+
+INVITEES = [{"name": "Ada", "email": "ada@example.com", "linkedinUrl": "https://www.linkedin.com/in/ada"}]
+
+
+def test_uploaded_invitees_expire_and_are_evicted_with_their_session(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+    monkeypatch.setattr(state_store.time, "time", lambda: now[0])
+
+    async def scenario():
+        sessions = SessionManager(InMemoryStateStore(), max_sessions=2, idle_ttl_seconds=60, evict_every=1)
+        await sessions.save_invitees("old", INVITEES, {"rows": 1})
+        now[0] += 61
+        await sessions.save_invitees("a", INVITEES, {"rows": 1})
+        assert await sessions.load_invitees("old") is None
+        assert sessions.stats()["expirations"] == 1
+
+        now[0] += 1
+        await sessions.save_invitees("b", INVITEES, {"rows": 1})
+        now[0] += 1
+        # Using a session's history keeps its invitees too
+        async with sessions.session("a"):
+            pass
+        now[0] += 1
+        await sessions.save_invitees("c", INVITEES, {"rows": 1})
+        assert await sessions.load_invitees("b") is None
+        assert (await sessions.load_invitees("a"))["invitees"] == INVITEES
+        assert sessions.stats()["sessions"] == 2 and sessions.stats()["evictions"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_invitees_count_towards_the_byte_limit():
+    async def scenario():
+        sessions = SessionManager(InMemoryStateStore(), max_bytes=1000, evict_every=1)
+        await sessions.save_invitees("a", INVITEES * 5, {"rows": 5})
+        await sessions.save_invitees("b", INVITEES * 5, {"rows": 5})
+        assert await sessions.load_invitees("a") is None
+        assert sessions.stats()["bytes"] < 1000
+
+    asyncio.run(scenario())
+
+
+def test_running_turn_keeps_its_lease_and_others_give_up_waiting():
+    async def scenario():
+        store = InMemoryStateStore()
+        # Two workers sharing the store
+        first = SessionManager(store, lease_seconds=0.2, lease_wait_seconds=0.3)
+        second = SessionManager(store, lease_seconds=0.2, lease_wait_seconds=0.3)
+        turn_started = asyncio.Event()
+        finish_turn = asyncio.Event()
+
+        async def long_turn():
+            async with first.session("s") as chat_history:
+                turn_started.set()
+                await finish_turn.wait()
+                chat_history.add_user_message("done")
+
+        turn = asyncio.create_task(long_turn())
+        await turn_started.wait()
+        # Outlives the lease several times over, in this worker and in the other one
+        await asyncio.sleep(0.5)
+        with pytest.raises(SessionBusyError):
+            async with second.session("s"):
+                pass
+        with pytest.raises(SessionBusyError):
+            async with first.session("s"):
+                pass
+
+        finish_turn.set()
+        await turn
+        async with second.session("s") as chat_history:
+            assert [str(message.content) for message in chat_history.messages] == ["done"]
+
+    asyncio.run(scenario())
+
+
+def test_sessions_are_evicted_once_every_few_saves_and_never_mid_turn():
+    async def scenario():
+        store = InMemoryStateStore()
+        listings = []
+        entries = store.entries
+        store.entries = lambda namespace: listings.append(namespace) or entries(namespace)
+        sessions = SessionManager(store, max_sessions=2, evict_every=3)
+
+        async with sessions.session("busy") as chat_history:
+            chat_history.add_user_message("Company information")
+            await sessions.save("busy", chat_history)
+            for session_id in ("a", "b"):
+                await sessions.save_invitees(session_id, INVITEES, {"rows": 1})
+            # One listing of each namespace for three saves
+            assert len(listings) == 2
+            # The oldest session is running a turn, so the next one goes instead
+            assert await sessions.load_invitees("a") is None
+            assert (await sessions.load_invitees("b"))["invitees"] == INVITEES
+        assert [str(message.content) for message in (await sessions.load("busy")).messages] == ["Company information"]
+
+    asyncio.run(scenario())
+
+
+def test_long_history_keeps_the_company_and_the_recent_turns():
+    from semantic_kernel.contents import AuthorRole, ChatHistory
+
+    sessions = SessionManager(InMemoryStateStore(), token_budget=200, keep_recent_messages=4)
+    history = ChatHistory()
+    history.add_user_message("Company Name: Contoso, Description: cloud consultancy")
+    for turn in range(10):
+        history.add_user_message(f"Question {turn} " + "word " * 30)
+        history.add_assistant_message(f"Answer {turn} " + "word " * 30)
+
+    assert sessions.compact(history)
+    messages = history.messages
+    assert str(messages[0].content).startswith("Company Name: Contoso")
+    assert messages[1].role == AuthorRole.SYSTEM and str(messages[1].content).startswith(session_store.SUMMARY_HEADER)
+    assert [str(message.content).split(" ", 2)[:2] for message in messages[2:]] == [
+        ["Question", "8"], ["Answer", "8"], ["Question", "9"], ["Answer", "9"]
+    ]
+    # A compacted history under the budget is left alone
+    assert not SessionManager(InMemoryStateStore(), token_budget=10_000).compact(history)
@@ -0,0 +1,61 @@
+import asyncio
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_the_leaders_result():
+    async def scenario():
+        flights = SingleFlight("test")
+        led, joined = flights.claim(["a", "b"])
+        assert set(led) == {"a", "b"} and not joined
+        led_again, joined = flights.claim(["b", "c", "c"])
+        assert set(led_again) == {"c"} and set(joined) == {"b"}
+
+        follower = asyncio.create_task(flights.follow("b", joined["b"]))
+        await asyncio.sleep(0)
+        flights.resolve(led, "b", {"score": 5})
+        flights.release(led)
+        future, took_over = await follower
+        assert future.result() == {"score": 5} and not took_over
+        # Released keys are worked on again by the next caller
+        assert set(flights.claim(["a"])[0]) == {"a"}
+        assert flights.stats()["joined"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_key_released_without_a_result_is_taken_over_by_one_follower():
+    async def scenario():
+        flights = SingleFlight("test")
+        led, _ = flights.claim(["a"])
+        followers = [asyncio.create_task(flights.follow("a", flights.claim(["a"])[1]["a"])) for _ in range(2)]
+        await asyncio.sleep(0)
+        # The leader was cancelled
+        flights.release(led)
+        new_leader, took_over = await followers[0]
+        assert took_over and not new_leader.done()
+        assert not followers[1].done()
+
+        flights.resolve({"a": new_leader}, "a", "done")
+        future, took_over = await followers[1]
+        assert future.result() == "done" and not took_over
+        assert flights.stats()["taken_over"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_follower_leaves_the_work_alone():
+    async def scenario():
+        flights = SingleFlight("test")
+        led, _ = flights.claim(["a"])
+        follower = asyncio.create_task(flights.follow("a", flights.claim(["a"])[1]["a"]))
+        await asyncio.sleep(0)
+        follower.cancel()
+        await asyncio.gather(follower, return_exceptions=True)
+        assert not led["a"].cancelled()
+        flights.fail(led, "a", RuntimeError("scrape failed"))
+        assert isinstance(led["a"].exception(), RuntimeError)
+        flights.release(led)
+        assert flights.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+import pytest
+
+from state_store import InMemoryStateStore, SQLiteStateStore, StateStore
+
+
+def test_a_backend_must_implement_every_method():
+    class PartialStore(StateStore):
+        def get(self, namespace, key):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_entries_and_leases(backend, tmp_path):
+    store = InMemoryStateStore() if backend == "memory" else SQLiteStateStore(str(tmp_path / "state.db"))
+    try:
+        store.set("sessions", "a", {"turn": 1})
+        store.set("sessions", "b", {"turn": 1})
+        store.set("sessions", "a", {"turn": 2})
+        assert store.get("sessions", "a") == {"turn": 2}
+        assert [key for key, _, _ in store.entries("sessions")] == ["b", "a"]
+        store.delete("sessions", "b")
+        assert store.get("sessions", "b") is None
+
+        assert store.acquire_lease("session:a", "worker-1", 30)
+        assert not store.acquire_lease("session:a", "worker-2", 30)
+        store.release_lease("session:a", "worker-2")
+        assert not store.acquire_lease("session:a", "worker-2", 30)
+        store.release_lease("session:a", "worker-1")
+        assert store.acquire_lease("session:a", "worker-2", 30)
+    finally:
+        store.close()
@@ -0,0 +1,23 @@
+from telemetry import MetricsRegistry
+
+
+def test_monotonic_stats_are_rendered_as_counters():
+    registry = MetricsRegistry("test")
+    registry.register_stats("cache", "Profile cache", lambda: {"hits": 3, "entries": 2, "hit_rate": None}, counters=("hits",))
+    registry.register_stats(
+        "outbound", "Outbound calls", lambda: {"llm": {"calls": 5, "breaker": "closed"}, "apify": {"calls": 1}},
+        label="service", counters=("calls",),
+    )
+    lines = registry.render().splitlines()
+    assert lines == [
+        "# HELP test_cache_hits_total Profile cache (hits)",
+        "# TYPE test_cache_hits_total counter",
+        "test_cache_hits_total 3",
+        "# HELP test_cache_entries Profile cache (entries)",
+        "# TYPE test_cache_entries gauge",
+        "test_cache_entries 2",
+        "# HELP test_outbound_calls_total Outbound calls (calls)",
+        "# TYPE test_outbound_calls_total counter",
+        'test_outbound_calls_total{service="llm"} 5',
+        'test_outbound_calls_total{service="apify"} 1',
+    ]
@@ -0,0 +1,74 @@
+from fakes import FAKE_CONNECTION_STRING, fake_profile_urls
+from tenants import connection_key
+
+ACME = {"X-Tenant-ID": "acme"}
+
+
+def test_tenant_requests_need_the_token_issued_with_the_connection(client, run):
+    conn_str = FAKE_CONNECTION_STRING.replace("bench;bench", "bench;acme")
+    response = run(client.post("/set_connection/", json={"connection_string": conn_str}, headers=ACME))
+    assert response.status_code == 200
+    token = response.json()["tenant_token"]
+
+    assert run(client.get("/leads/", headers={**ACME, "X-Tenant-Token": token})).status_code == 200
+    assert run(client.get("/leads/", headers=ACME)).status_code == 401
+    assert run(client.get("/leads/", headers={**ACME, "X-Tenant-Token": "guess"})).status_code == 401
+
+    # Nobody else can take the tenant over by setting its connection
+    taken = run(client.post("/set_connection/", json={"connection_string": FAKE_CONNECTION_STRING}, headers=ACME))
+    assert taken.status_code == 401
+    changed = run(client.post(
+        "/set_connection/", json={"connection_string": FAKE_CONNECTION_STRING}, headers={**ACME, "X-Tenant-Token": token}
+    ))
+    assert changed.status_code == 200
+    assert changed.json()["tenant_token"] == token
+
+
+def test_jobs_are_only_visible_to_their_tenant(client, run):
+    conn_str = FAKE_CONNECTION_STRING.replace("bench;bench", "bench;globex")
+    globex = {"X-Tenant-ID": "globex"}
+    token = run(client.post("/set_connection/", json={"connection_string": conn_str}, headers=globex)).json()["tenant_token"]
+    globex["X-Tenant-Token"] = token
+
+    submitted = run(client.post("/jobs/process_invitees/", headers=globex, json={
+        "session_id": "globex", "linkedin_urls": fake_profile_urls(2, offset=600), "company_description": "Globex", "mode": "direct"
+    }))
+    job_id = submitted.json()["job_id"]
+    # To the default tenant the job does not exist
+    assert run(client.get(f"/jobs/{job_id}")).status_code == 404
+    assert run(client.get(f"/jobs/{job_id}/events")).status_code == 404
+    assert run(client.delete(f"/jobs/{job_id}")).status_code == 404
+    assert run(client.get(f"/jobs/{job_id}", headers={"X-Tenant-ID": "globex"})).status_code == 401
+
+    events = run(client.get(f"/jobs/{job_id}/events", headers=globex))
+    assert events.status_code == 200
+    assert run(client.get(f"/jobs/{job_id}", headers=globex)).json()["status"] == "completed"
+
+
+def test_default_tenant_is_shared_unless_its_token_is_configured(client, run):
+    for _ in range(2):
+        response = run(client.post("/set_connection/", json={"connection_string": FAKE_CONNECTION_STRING}))
+        assert response.status_code == 200
+        assert response.json()["tenant_token"] is None
+    assert run(client.get("/leads/")).status_code == 200
+
+
+def test_email_deliveries_and_status_are_only_visible_to_their_tenant(client, run):
+    conn_str = FAKE_CONNECTION_STRING.replace("bench;bench", "bench;initech")
+    initech = {"X-Tenant-ID": "initech"}
+    token = run(client.post("/set_connection/", json={"connection_string": conn_str}, headers=initech)).json()["tenant_token"]
+    initech["X-Tenant-Token"] = token
+
+    assert run(client.post("/send_emails/", headers={"X-Tenant-ID": "initech"}, json={
+        "email_body": "Hi", "potential_clients": ["a@example.com"]
+    })).status_code == 401
+    sent = run(client.post("/send_emails/", headers=initech, json={"email_body": "Hi", "potential_clients": ["a@example.com"]}))
+    assert sent.status_code == 202
+    job_id = sent.json()["job_id"]
+    assert run(client.get(f"/send_emails/{job_id}", headers=initech)).status_code == 200
+    assert run(client.get(f"/send_emails/{job_id}")).status_code == 404
+
+    assert list(run(client.get("/tenant_status/", headers=initech)).json()) == ["initech"]
+    assert run(client.get("/tenant_status/", headers={"X-Tenant-ID": "initech"})).status_code == 401
+    runtimes = run(client.get("/runtime_status/", headers=initech)).json()["runtimes"]
+    assert list(runtimes) == [connection_key(conn_str)]
@@ -0,0 +1,39 @@
+import tiered_cache
+from tiered_cache import TieredCache
+
+
+def cache(tmp_path, **settings) -> TieredCache:
+    return TieredCache(str(tmp_path / "cache.db"), "entries", **{
+        "ttl_seconds": 60, "max_memory_entries": 10, "max_disk_entries": 100, **settings
+    })
+
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tiered_cache.time, "time", lambda: now[0])
+    entries = cache(tmp_path)
+    entries.put_many({"a": {"score": 1}})
+    now[0] += 59
+    assert entries.get_many(["a"]) == {"a": {"score": 1}}
+
+    now[0] += 2
+    assert entries.get_many(["a"]) == {}
+    # A second process opening the same file does not see it either
+    assert cache(tmp_path).get_many(["a"]) == {}
+    stats = entries.stats()
+    assert stats["expirations"] == 1 and stats["disk_entries"] == 0 and stats["misses"] == 1
+
+
+def test_oldest_entries_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tiered_cache.time, "time", lambda: now[0])
+    entries = cache(tmp_path, max_memory_entries=2, max_disk_entries=3)
+    for key in "abcd":
+        now[0] += 1
+        entries.put_many({key: key})
+    assert entries.stats()["disk_entries"] == 3
+
+    assert entries.get_many("abcd") == {"b": "b", "c": "c", "d": "d"}
+    stats = entries.stats()
+    assert stats["memory_entries"] == 2
+    assert stats["memory_hits"] == 2 and stats["disk_hits"] == 1 and stats["misses"] == 1
@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class TieredCache:
+    """JSON values in an in-memory LRU backed by a SQLite table, with a TTL and size-based eviction.
+
+    Methods are blocking and thread-safe; call them through ``asyncio.to_thread`` from async code.
+    """
+
+    def __init__(self, path: str, table: str, ttl_seconds: float, max_memory_entries: int, max_disk_entries: int):
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # The disk tier is shared by every worker process that opens the same path; WAL lets them
+        # read while one of them writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+        if columns and "key" not in columns:
+            # Entries written by an older layout are only a cache, so they are dropped
+            self._conn.execute(f"DROP TABLE {table}")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, data TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_stored_at ON {table} (stored_at)")
+        self._conn.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return now - stored_at > self.ttl_seconds
+
+    def _remember(self, key: str, stored_at: float, value: Any) -> None:
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Return the cached values for the given keys. Missing keys are misses."""
+        now = time.time()
+        found: Dict[str, Any] = {}
+        with self._lock:
+            pending: List[str] = []
+            for key in dict.fromkeys(keys):
+                entry = self._memory.get(key)
+                if entry and not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    found[key] = entry[1]
+                    self.memory_hits += 1
+                else:
+                    if entry:
+                        del self._memory[key]
+                    pending.append(key)
+
+            if pending:
+                placeholders = ",".join("?" * len(pending))
+                rows = self._conn.execute(
+                    f"SELECT key, data, stored_at FROM {self.table} WHERE key IN ({placeholders})", pending
+                ).fetchall()
+                expired = []
+                for key, data, stored_at in rows:
+                    if self._expired(stored_at, now):
+                        expired.append(key)
+                        continue
+                    value = json.loads(data)
+                    found[key] = value
+                    self._remember(key, stored_at, value)
+                    self.disk_hits += 1
+                if expired:
+                    self.expirations += len(expired)
+                    self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in expired])
+                    self._conn.commit()
+                self.misses += len(pending) - (len(rows) - len(expired))
+        return found
+
+    def put_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            rows = []
+            for key, value in items.items():
+                self._remember(key, now, value)
+                rows.append((key, json.dumps(value), now))
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, data, stored_at) VALUES (?, ?, ?)", rows
+            )
+            # Size-based eviction of the oldest entries on disk
+            overflow = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_disk_entries
+            if overflow > 0:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY stored_at LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            disk_entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else None,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -13,6 +13,22 @@ const API_URL = import.meta.env.VITE_API_URL || "http://localhost:8000";
 // Generate a unique session ID
 const sessionId = `session-${Date.now()}-${Math.random().toString(36)}`;
 
+// Each browser is its own tenant, with its own connection; every request names the tenant and
+// presents the token the backend issued when the connection was set
+const TENANT_ID_KEY = "tenantId";
+const TENANT_TOKEN_KEY = "tenantToken";
+let tenantId = localStorage.getItem(TENANT_ID_KEY);
+if (!tenantId) {
+    tenantId = `tenant-${crypto.randomUUID()}`;
+    localStorage.setItem(TENANT_ID_KEY, tenantId);
+    localStorage.removeItem(TENANT_TOKEN_KEY);
+}
+axios.defaults.headers.common["X-Tenant-ID"] = tenantId;
+const storedTenantToken = localStorage.getItem(TENANT_TOKEN_KEY);
+if (storedTenantToken) {
+    axios.defaults.headers.common["X-Tenant-Token"] = storedTenantToken;
+}
+
 function App() {
     const [isConnected, setIsConnected] = useState(false);
     const [activeSection, setActiveSection] = useState<
@@ -79,9 +95,13 @@ function App() {
 
     const handleConnectionEstablished = async (connString: string) => {
         try {
-            await axios.post(`${API_URL}/set_connection/`, {
+            const response = await axios.post(`${API_URL}/set_connection/`, {
                 connection_string: connString,
             });
+            if (response.data.tenant_token) {
+                localStorage.setItem(TENANT_TOKEN_KEY, response.data.tenant_token);
+                axios.defaults.headers.common["X-Tenant-Token"] = response.data.tenant_token;
+            }
             setIsConnected(true);
         } catch (error) {
             console.error("Error setting connection:", error);
@@ -99,6 +119,9 @@ function App() {
         }));
     };
 
+    const describeCompany = () =>
+        `Company Name: ${companyData.name}, Description: ${companyData.description}, Ideal Profile: ${companyData.idealProfile}`;
+
     const handleCompanyDataSubmit = async (e: any) => {
         e.preventDefault();
         setSendButtonDisabled(true);
@@ -108,7 +131,7 @@ function App() {
                 `${API_URL}/chat/`,
                 {
                     session_id: sessionId,
-                    message: `Company Name: ${companyData.name}, Description: ${companyData.description}, Ideal Profile: ${companyData.idealProfile}`,
+                    message: describeCompany(),
                 },
                 {
                     headers: {
@@ -133,6 +156,7 @@ function App() {
             setFilePlaceholder(file.name);
             const formData = new FormData();
             formData.append("file", file);
+            formData.append("session_id", sessionId);
 
             try {
                 const response = await axios.post(
@@ -170,6 +194,7 @@ function App() {
                 {
                     session_id: sessionId,
                     linkedin_urls: linkedinUrls,
+                    company_description: describeCompany(),
                 },
                 {
                     headers: {
@@ -514,7 +539,7 @@ function App() {
                                                     name="file"
                                                     type="file"
                                                     draggable
-                                                    accept=".xlsx, .xls"
+                                                    accept=".xlsx, .csv"
                                                     onDrop={(e) => {
                                                         e.preventDefault();
                                                         handleFileUpload(e);